@@ -94,6 +94,28 @@ The `minknow_api.data`, `minknow_api.device` and `minknow_api.manager` modules c
 working with the services of the same name. See the documentation for those modules for more
 information.
 
+The `minknow_api.aio` module contains asyncio versions of `Connection` and
+`minknow_api.manager.Manager`, for driving many calls from a single event loop.
+
+The `minknow_api.channel_pool` module allows connections to the same position to share a gRPC
+channel, avoiding the cost of setting up a new one each time.
+
+The `minknow_api.fleet` module runs queries against the managers of many hosts in parallel.
+
+The `minknow_api.live_reads` module contains a client for the adaptive sampling (``get_live_reads``)
+RPC on the data service, and `minknow_api.channel_states` keeps track of the state of every channel
+using the ``get_channel_states`` RPC. `minknow_api.signal_min_max` decodes the summarised signal
+from the ``get_signal_min_max`` RPC and caches it at several zoom levels for drawing.
+
+The `minknow_api.acquisition_output` module folds the ``stream_acquisition_output`` RPC on the
+statistics service into numpy arrays, with one array per yield field for each filter group, and
+`minknow_api.statistics` follows that and the other time-series statistics streams, resuming them
+from the most recent data received if they fail. `minknow_api.histogram` decodes the read length
+and q-score histogram streams into numpy arrays, and calculates N50, mean and percentiles from them.
+
+The `minknow_api.monitoring` module keeps temperature and bias voltage streams in fixed-size
+ring buffers at several resolutions, so long-running monitoring uses a bounded amount of memory.
+
 """
 
 from dataclasses import dataclass
@@ -106,6 +128,7 @@ import platform
 import sys
 import threading
 import warnings
+import weakref
 import datetime
 from enum import Enum
 from typing import Any, Dict, Optional, Tuple, Union, List
@@ -114,7 +137,16 @@ import grpc
 import pyrfc3339
 import pytz
 
-from . import data
+from ._support import (
+    DEFAULT_RETRY_POLICY,
+    NO_RETRY_POLICY,
+    RetryCounts,
+    RetryPolicy,
+    ServiceStub,
+    clear_retry_counts,
+    get_retry_counts,
+    raw_messages,
+)
 
 # Try and import from minknow_api_production package
 try:
@@ -174,14 +206,30 @@ _optional_services = ["production"]
 
 __all__ = [name + "_service" for name in _services.keys()] + [
     "Connection",
+    "DEFAULT_RETRY_POLICY",
     "LocalAuthTokenCredentials",
+    "NO_RETRY_POLICY",
+    "RetryCounts",
+    "RetryPolicy",
+    "acquisition_output",
+    "aio",
+    "channel_pool",
+    "channel_states",
+    "clear_retry_counts",
     "data",
     "device",
+    "fleet",
     "load_grpc_credentials",
+    "raw_messages",
     "get_local_authentication_token_file",
+    "get_retry_counts",
     "grpc_credentials",
+    "histogram",
+    "live_reads",
     "read_ssl_certificate",
     "manager",
+    "monitoring",
+    "signal_min_max",
     "post_processing_protocol_connection",
 ]
 
@@ -220,14 +268,60 @@ def _import_submodule(svc_name: str, svc: Service, submodule_type: SubmoduleType
     )
 
 
-for svc_name, svc in _services.items():
-    try:
-        globals()[f"{svc_name}_service"] = _import_submodule(
-            svc_name, svc, SubmoduleType.SERVICE
-        )
-    except ImportError:
-        if svc_name not in _optional_services:
-            raise
+def _service_module(svc_name: str):
+    """Get the ``{svc_name}_service`` module, importing it if necessary.
+
+    Raises:
+        ImportError: if the module is not available.
+    """
+    module = _import_submodule(svc_name, _services[svc_name], SubmoduleType.SERVICE)
+    globals()[f"{svc_name}_service"] = module
+    return module
+
+
+# Helper modules that can be accessed as attributes of this module without importing them first
+_helper_modules = [
+    "acquisition_output",
+    "aio",
+    "channel_pool",
+    "channel_states",
+    "data",
+    "device",
+    "fleet",
+    "histogram",
+    "live_reads",
+    "manager",
+    "monitoring",
+    "post_processing_protocol_connection",
+    "signal_min_max",
+    "statistics",
+]
+
+
+def __getattr__(name: str):
+    # The service modules (and the protobuf modules they pull in) are only imported when they are
+    # first used, as importing all of them takes a noticeable amount of time.
+    svc_name = name[: -len("_service")] if name.endswith("_service") else None
+    if svc_name in _services:
+        try:
+            return _service_module(svc_name)
+        except ImportError:
+            if svc_name not in _optional_services:
+                raise
+    elif name in _helper_modules:
+        return importlib.import_module(f".{name}", __name__)
+    elif name.endswith("_pb2") or name.endswith("_pb2_grpc"):
+        try:
+            return importlib.import_module(f".{name}", __name__)
+        except ModuleNotFoundError as e:
+            if e.name != f"{__name__}.{name}":
+                raise
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
 
 logger = logging.getLogger(__name__)
 
@@ -352,8 +446,7 @@ def get_local_authentication_token_file(
             options=GRPC_CHANNEL_OPTIONS,
         )
 
-        # Disable F821 for pyflakes as i believe it can't recognise our use of import_module
-        service = manager_service.ManagerService(channel)  # noqa: F821
+        service = _service_module("manager").ManagerService(channel)
         return service.local_authentication_token_path().path
     except grpc.RpcError:
         logger.debug(
@@ -364,7 +457,7 @@ def get_local_authentication_token_file(
 
 
 def get_protocol_token_credentials(
-    environ: Union[Dict[str, str], os._Environ] = os.environ
+    environ: Union[Dict[str, str], os._Environ] = os.environ,
 ) -> Optional[grpc.ChannelCredentials]:
     """If running as a protocol in MinKNOW, get the protocol token used to authenticate
     to MinKNOW.
@@ -434,7 +527,7 @@ def get_developer_api_token_credentials(
 
 
 def read_ssl_certificate(
-    environ: Union[Dict[str, str], os._Environ] = os.environ
+    environ: Union[Dict[str, str], os._Environ] = os.environ,
 ) -> bytes:
     """Get the CA certificate that should be used to verify a TLS connection to MinKNOW.
 
@@ -525,7 +618,7 @@ def _is_localhost(host: str) -> bool:
 
 
 def _try_client_cert_from_env_vars(
-    environ: Union[Dict[str, str], os._Environ] = os.environ
+    environ: Union[Dict[str, str], os._Environ] = os.environ,
 ) -> Tuple[Optional[bytes], Optional[bytes]]:
     cert_chain_path = environ.get("MINKNOW_API_CLIENT_CERTIFICATE_CHAIN")
     cert_key_path = environ.get("MINKNOW_API_CLIENT_KEY")
@@ -749,6 +842,48 @@ def clear_credentials_cache() -> None:
 #
 
 
+def _connection_credentials(
+    host: str,
+    credentials: Optional[grpc.ChannelCredentials],
+    developer_api_token: Optional[str],
+    client_certificate_chain: Optional[bytes],
+    client_private_key: Optional[bytes],
+    ca_certificate: Optional[bytes],
+    environ: Union[Dict[str, str], os._Environ],
+    _warning_stacklevel: int = 0,
+) -> grpc.ChannelCredentials:
+    """Get the credentials for a connection to a flow cell position.
+
+    This is shared by `Connection` and `minknow_api.aio.Connection` - see those for a description
+    of the arguments.
+    """
+    if credentials is not None:
+        if developer_api_token is not None:
+            warnings.warn("`developer_api_token` ignored as `credentials` was provided")
+        if client_certificate_chain is not None or client_private_key is not None:
+            warnings.warn(
+                "`client_certificate_chain` and `client_private_key` ignored as `credentials` was provided"
+            )
+        if ca_certificate is not None:
+            warnings.warn("`ca_certificate` ignored as `credentials` was provided")
+        return credentials
+
+    try:
+        manager_port = int(environ["MINKNOW_MANAGER_TEST_PORT"])
+    except KeyError:
+        manager_port = None
+    return grpc_credentials(
+        manager_port=manager_port,
+        developer_api_token=developer_api_token,
+        host=host,
+        client_certificate_chain=client_certificate_chain,
+        client_private_key=client_private_key,
+        ca_certificate=ca_certificate,
+        _warning_stacklevel=_warning_stacklevel + 1,
+        environ=environ,
+    )
+
+
 class Connection(object):
     """A connection to a MinKNOW flow cell sequencing position via RPC.
 
@@ -776,6 +911,19 @@ class Connection(object):
             provided, this parameter is ignored.
         environ: Optional dictionary containing global environment variables, if not provided
             then os.environ is used.
+        wrap_messages: If False, the service methods return bare protobuf messages (or, for
+            streaming calls, the gRPC call object) rather than wrapping each message as described
+            below. This avoids some overhead on high-rate streams. See also `raw_messages`, which
+            does the same for a single call.
+        retry_policy: How to retry calls that fail with transient errors. Defaults to
+            `DEFAULT_RETRY_POLICY`.
+        retry_policies: Override `retry_policy` for particular services or methods. Keys are
+            either a service name (eg: "data") or a method name qualified by the service name (eg:
+            "data.get_data_types"). The latter take precedence.
+        channel_pool: Share the gRPC channel with other connections to the same host and port using
+            this `minknow_api.channel_pool.ChannelPool`. If the pool already has a channel open, no
+            call is made to check that MinKNOW is reachable. The channel is returned to the pool when
+            the connection is closed.
 
     If no port is provided, the MINKNOW_RPC_PORT environment variable will be used
     (MinKNOW sets this when running protocol scripts, for example). If this environment
@@ -809,6 +957,10 @@ class Connection(object):
     >>> temp_settings = connection.minion_device._pb.TemperatureRange(min=37.0, max=37.0)
     >>> connection.minion_device.change_settings(
     >>>     temperature_target=temp_settings)
+
+    The returned messages are wrapped in a type that collapses submessages for fields marked with
+    ``[rpc_unwrap]``, and returns the value of fields with wrapper types (such as
+    ``google.protobuf.BoolValue``) directly.
     """
 
     def __init__(
@@ -821,78 +973,74 @@ class Connection(object):
         client_private_key: Optional[bytes] = None,
         ca_certificate: Optional[bytes] = None,
         environ: Union[Dict[str, str], os._Environ] = os.environ,
+        wrap_messages: bool = True,
+        retry_policy: Optional[RetryPolicy] = None,
+        retry_policies: Optional[Dict[str, RetryPolicy]] = None,
+        channel_pool: Optional["minknow_api.channel_pool.ChannelPool"] = None,
     ):
         import time
         import grpc
 
         self.environ = environ
+        self._channel_finalizer = None
+        self._close_callbacks = []
+        self._wrap_messages = wrap_messages
+        self._retry_policy = retry_policy or DEFAULT_RETRY_POLICY
+        self._retry_policies = retry_policies
 
         self.host = host
         if port is None:
             port = int(self.environ["MINKNOW_RPC_PORT_SECURE"])
         self.port = port
 
-        if credentials is not None:
-            if developer_api_token is not None:
-                warnings.warn(
-                    "`developer_api_token` ignored as `credentials` was provided"
-                )
-            if client_certificate_chain is not None or client_private_key is not None:
-                warnings.warn(
-                    "`client_certificate_chain` and `client_private_key` ignored as `credentials` was provided"
-                )
-            if ca_certificate is not None:
-                warnings.warn("`ca_certificate` ignored as `credentials` was provided")
+        credentials = _connection_credentials(
+            host=host,
+            credentials=credentials,
+            developer_api_token=developer_api_token,
+            client_certificate_chain=client_certificate_chain,
+            client_private_key=client_private_key,
+            ca_certificate=ca_certificate,
+            environ=self.environ,
+            _warning_stacklevel=1,
+        )
 
         error = None
         retry_count = 5
         for i in range(retry_count):
-            if not credentials:
-                try:
-                    manager_port = int(self.environ["MINKNOW_MANAGER_TEST_PORT"])
-                except KeyError:
-                    manager_port = None
-                credentials = grpc_credentials(
-                    manager_port=manager_port,
-                    developer_api_token=developer_api_token,
-                    host=host,
-                    client_certificate_chain=client_certificate_chain,
-                    client_private_key=client_private_key,
-                    ca_certificate=ca_certificate,
-                    _warning_stacklevel=1,
-                    environ=self.environ,
+            if channel_pool is None:
+                self.channel = grpc.secure_channel(
+                    f"{host}:{port}",
+                    credentials=credentials,
+                    options=GRPC_CHANNEL_OPTIONS,
+                )
+                reused_channel = False
+            else:
+                self.channel, reused_channel = channel_pool.acquire(
+                    f"{host}:{port}", credentials, GRPC_CHANNEL_OPTIONS
                 )
 
-            self.channel = grpc.secure_channel(
-                f"{host}:{port}",
-                credentials=credentials,
-                options=GRPC_CHANNEL_OPTIONS,
-            )
+            # The service objects are created on first use (see __getattr__), so discard any
+            # that were created for the previous channel
+            for name in _services:
+                self.__dict__.pop(name, None)
 
-            # One entry for each service
-            for name, svc in _services.items():
-                for svc_class_name in svc.services:
-                    try:
-                        # effectively does `self.{name} = {name}_service.{svc_class_name}(self.channel)`
-                        setattr(
-                            self,
-                            name,
-                            getattr(globals()[f"{name}_service"], svc_class_name)(
-                                self.channel
-                            ),
-                        )
-                    except KeyError:
-                        if name not in _optional_services:
-                            raise
+            if reused_channel:
+                # the pool only keeps channels that have connected successfully
+                error = None
+                break
 
             # Ensure channel is ready for communication
             try:
                 logger.debug("Calling get_version_info to test connection")
                 self.instance.get_version_info()
+                if channel_pool is not None:
+                    channel_pool.confirm(self.channel)
                 error = None
                 break
             except grpc.RpcError as e:
                 logger.info("Error received from rpc")
+                if channel_pool is not None:
+                    channel_pool.release(self.channel, discard=True)
                 if (
                     e.code() == grpc.StatusCode.INTERNAL
                     and e.details() == "GOAWAY received"
@@ -918,8 +1066,65 @@ class Connection(object):
         if error:
             raise error
 
+        if channel_pool is not None:
+            # return the channel to the pool even if the connection is never closed
+            self._channel_finalizer = weakref.finalize(
+                self, channel_pool.release, self.channel
+            )
+
+    def __getattr__(self, name):
+        # One entry for each service, created when it is first used
+        if name not in _services or "channel" not in self.__dict__:
+            raise AttributeError(
+                f"{type(self).__name__!r} object has no attribute {name!r}"
+            )
+        try:
+            module = _service_module(name)
+        except ImportError:
+            if name not in _optional_services:
+                raise
+            raise AttributeError(f"The {name!r} service is not available")
+        for svc_class_name in _services[name].services:
+            # effectively does `self.{name} = {name}_service.{svc_class_name}(self.channel)`
+            service = getattr(module, svc_class_name)(self.channel)
+            service._stub = ServiceStub(
+                service._stub,
+                name,
+                wrap_messages=self._wrap_messages,
+                retry_policy=self._retry_policy,
+                retry_policies=self._retry_policies,
+            )
+            setattr(self, name, service)
+        return service
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(_services))
+
     def __enter__(self):
         return self
 
+    def close(self) -> None:
+        """Close the connection.
+
+        If the channel came from a `minknow_api.channel_pool.ChannelPool`, it is returned to the
+        pool instead of being closed.
+        """
+        callbacks, self._close_callbacks = self._close_callbacks, []
+        for callback in callbacks:
+            callback()
+        if self._channel_finalizer is not None:
+            self._channel_finalizer()
+        else:
+            self.channel.close()
+
     def __exit__(self, exc_type, exc_value, traceback):
-        self.channel.close()
+        self.close()
+
+    def _on_close(self, callback) -> None:
+        """Call ``callback`` (with no arguments) when the connection is closed.
+
+        This is for helpers that start background work using the connection (such as the
+        acquisition watcher in `minknow_api.data`), which must stop even if the channel is kept
+        open by a `minknow_api.channel_pool.ChannelPool`.
+        """
+        self._close_callbacks.append(callback)
@@ -1,4 +1,14 @@
+import collections
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional
+
 import grpc
+import grpc.aio
+
+logger = logging.getLogger(__name__)
 
 _wrapper_types = {
     "google.protobuf.BoolValue",
@@ -13,16 +23,329 @@ _wrapper_types = {
 }
 
 
+# (message type, unwrapped fields) -> {attribute name: (index into _objs, is wrapper type)}
+_attribute_tables = {}
+
+
+def _attribute_table(message_type, unwraps):
+    """Work out where each field of a (wrapped) message type should be read from.
+
+    This does the same resolution as `MessageWrapper.__getattr__`'s fallback path, but once per
+    message type rather than on every attribute access.
+    """
+    key = (message_type, tuple(unwraps))
+    try:
+        return _attribute_tables[key]
+    except KeyError:
+        pass
+
+    table = {}
+    descriptor = getattr(message_type, "DESCRIPTOR", None)
+    if descriptor is not None and hasattr(descriptor, "fields_by_name"):
+        descriptors = [descriptor.fields_by_name[attr].message_type for attr in unwraps]
+        descriptors.append(descriptor)
+        # earlier objects take precedence, as in __getattr__
+        for index, obj_descriptor in reversed(list(enumerate(descriptors))):
+            for field in obj_descriptor.fields:
+                is_wrapper = (
+                    field.message_type is not None
+                    and field.label != field.LABEL_REPEATED
+                    and field.message_type.full_name in _wrapper_types
+                )
+                table[field.name] = (index, is_wrapper)
+    _attribute_tables[key] = table
+    return table
+
+
+class _RawResponse(object):
+    """Marks a response that should be returned without being wrapped (see `_StubMethod`)."""
+
+    __slots__ = ("response",)
+
+    def __init__(self, response):
+        self.response = response
+
+
+def is_transient_error(error: grpc.RpcError) -> bool:
+    """Whether an error is one of the transient transport errors gRPC sometimes reports.
+
+    This is the default `RetryPolicy.should_retry`.
+    """
+    code = error.code()
+    details = error.details() or ""
+    return (code == grpc.StatusCode.UNKNOWN and "Stream removed" in details) or (
+        code == grpc.StatusCode.INTERNAL and "RST_STREAM" in details
+    )
+
+
+class RetryPolicy(NamedTuple):
+    """How to retry RPC calls that fail with transient errors.
+
+    The delay before each retry starts at `initial_backoff` and is multiplied by
+    `backoff_multiplier` after each attempt, up to `max_backoff`. Each delay is randomly adjusted
+    by up to `jitter` (as a fraction of the delay) so that many clients do not retry in lockstep.
+
+    If the call is given a timeout (``_timeout`` on the service methods), that is the total time
+    allowed for all the attempts: each attempt gets whatever time remains. `deadline` can be used to
+    set such a budget for calls without a timeout (if both are given, the shorter applies).
+
+    Only calls that return a single message are retried. Streaming calls are not: errors on a stream
+    are only seen while reading it, after the call has been returned to the caller.
+
+    Attributes:
+        max_attempts: The maximum number of attempts (including the first).
+        initial_backoff: The delay before the first retry, in seconds.
+        max_backoff: The maximum delay between attempts, in seconds.
+        backoff_multiplier: How much to increase the delay by after each retry.
+        jitter: The maximum random adjustment to each delay, as a fraction of the delay.
+        deadline: The total time allowed for all attempts, in seconds.
+        should_retry: Decides whether a failed call should be retried.
+    """
+
+    max_attempts: int = 20
+    initial_backoff: float = 0.05
+    max_backoff: float = 1.0
+    backoff_multiplier: float = 2.0
+    jitter: float = 0.2
+    deadline: Optional[float] = None
+    should_retry: Callable[[grpc.RpcError], bool] = is_transient_error
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+# Never retry anything
+NO_RETRY_POLICY = RetryPolicy(max_attempts=1)
+
+
+class RetryCounts(NamedTuple):
+    """Counts of retried calls for a method.
+
+    Attributes:
+        retries: The number of times a call was retried.
+        exhausted: The number of calls that failed with a retryable error, but were not retried
+            because `RetryPolicy.max_attempts` or the time budget had been used up.
+    """
+
+    retries: int = 0
+    exhausted: int = 0
+
+
+_retry_counts_lock = threading.Lock()
+_retry_counts: Dict[str, RetryCounts] = collections.defaultdict(RetryCounts)
+
+
+def get_retry_counts() -> Dict[str, RetryCounts]:
+    """Get the retry counts for each method that has had a retryable error.
+
+    The keys are the full names of the methods (eg: ``minknow_api.data.DataService.get_data_types``)
+    or just the service name for calls on service objects not created by a
+    `minknow_api.Connection`.
+    """
+    with _retry_counts_lock:
+        return dict(_retry_counts)
+
+
+def clear_retry_counts() -> None:
+    """Reset the counts returned by `get_retry_counts`."""
+    with _retry_counts_lock:
+        _retry_counts.clear()
+
+
+class RetryAttempts(object):
+    """Tracks the attempts made for a single call under a `RetryPolicy`.
+
+    Args:
+        policy: The policy to apply.
+        timeout: The timeout given for the call, if any.
+        name: The name of the method being called (used for logging and retry counts).
+    """
+
+    def __init__(self, policy: RetryPolicy, timeout: Optional[float], name: str):
+        self.policy = policy
+        self.name = name
+        self.attempt = 1
+        self._backoff = policy.initial_backoff
+        self._end = None
+        budgets = [b for b in (timeout, policy.deadline) if b is not None]
+        if budgets:
+            self._end = time.monotonic() + min(budgets)
+
+    def timeout(self) -> Optional[float]:
+        """The timeout to use for the next attempt."""
+        if self._end is None:
+            return None
+        return max(self._end - time.monotonic(), 0.0)
+
+    def retry_delay(self, error: grpc.RpcError) -> Optional[float]:
+        """Decide whether to retry after an attempt failed.
+
+        Returns:
+            How long to wait before the next attempt, or None if the error should be raised.
+        """
+        if not self.policy.should_retry(error):
+            return None
+
+        jitter = self.policy.jitter
+        delay = min(self._backoff, self.policy.max_backoff)
+        delay *= random.uniform(1 - jitter, 1 + jitter)
+        out_of_time = self._end is not None and time.monotonic() + delay >= self._end
+        if self.attempt >= self.policy.max_attempts or out_of_time:
+            self._count(exhausted=1)
+            return None
+
+        logger.info(
+            "Bypassed (%s: %s) error for grpc: %s. Attempt %s.",
+            error.code(),
+            error.details(),
+            self.name,
+            self.attempt,
+        )
+        self._count(retries=1)
+        self.attempt += 1
+        self._backoff *= self.policy.backoff_multiplier
+        return delay
+
+    def _count(self, retries: int = 0, exhausted: int = 0) -> None:
+        with _retry_counts_lock:
+            counts = _retry_counts[self.name]
+            _retry_counts[self.name] = RetryCounts(
+                counts.retries + retries, counts.exhausted + exhausted
+            )
+
+
+def run_with_retry(method, message, timeout, unwraps, full_name):
+    """Make a call using a service stub method, retrying transient errors.
+
+    This is used by the generated service classes. The retry policy is taken from the stub method
+    if it has one (see `ServiceStub`), otherwise `DEFAULT_RETRY_POLICY` is used.
+    """
+    policy = getattr(method, "retry_policy", DEFAULT_RETRY_POLICY)
+    method_name = getattr(method, "method_name", None)
+    if method_name is not None:
+        full_name = "{}.{}".format(full_name, method_name)
+    attempts = RetryAttempts(policy, timeout, full_name)
+    while True:
+        try:
+            return MessageWrapper(
+                method(message, timeout=attempts.timeout()), unwraps=unwraps
+            )
+        except grpc.RpcError as e:
+            delay = attempts.retry_delay(e)
+            if delay is None:
+                raise
+        time.sleep(delay)
+
+
+class _StubMethod(object):
+    """A stub method with the options from a `ServiceStub` attached."""
+
+    def __init__(self, method, method_name, retry_policy, wrap_messages):
+        self._method = method
+        self.method_name = method_name
+        self.retry_policy = retry_policy
+        self._wrap_messages = wrap_messages
+
+    def __call__(self, *args, **kwargs):
+        response = self._method(*args, **kwargs)
+        if self._wrap_messages:
+            return response
+        return _RawResponse(response)
+
+
+_REQUEST_RESPONSE_CALLABLES = (
+    grpc.UnaryUnaryMultiCallable,
+    grpc.UnaryStreamMultiCallable,
+    grpc.aio.UnaryUnaryMultiCallable,
+    grpc.aio.UnaryStreamMultiCallable,
+)
+
+
+class ServiceStub(object):
+    """Wraps a gRPC stub to apply per-connection options to the generated service methods.
+
+    Args:
+        stub: The gRPC stub.
+        service_name: The name of the service attribute on the connection (eg: "data").
+        wrap_messages: If False, the service methods return bare protobuf messages (or, for
+            streaming calls, the gRPC call object) instead of `MessageWrapper` instances.
+        retry_policy: The policy for all methods not in `retry_policies`.
+        retry_policies: Policies for particular services or methods. Keys are either a service name
+            (eg: "data") or a method name qualified by the service name (eg: "data.get_data_types").
+            Entries for other services are ignored.
+    """
+
+    def __init__(
+        self,
+        stub,
+        service_name: str,
+        wrap_messages: bool = True,
+        retry_policy: RetryPolicy = DEFAULT_RETRY_POLICY,
+        retry_policies: Optional[Dict[str, RetryPolicy]] = None,
+    ):
+        self._stub = stub
+        self._service_name = service_name
+        self._wrap_messages = wrap_messages
+        self._retry_policy = (retry_policies or {}).get(service_name, retry_policy)
+        self._retry_policies = retry_policies or {}
+        self._methods = {}
+
+    def __getattr__(self, name):
+        try:
+            return self._methods[name]
+        except KeyError:
+            pass
+        method = getattr(self._stub, name)
+        if isinstance(method, _REQUEST_RESPONSE_CALLABLES):
+            # methods taking a stream of requests are called directly, rather than via
+            # run_with_retry, so there is nothing to configure for them
+            policy = self._retry_policies.get(
+                "{}.{}".format(self._service_name, name), self._retry_policy
+            )
+            method = _StubMethod(method, name, policy, self._wrap_messages)
+        self._methods[name] = method
+        return method
+
+
+def raw_messages(response):
+    """Get the bare protobuf message(s) from the value returned by a service method.
+
+    For a method that returns a single message, this returns the message itself. For a method that
+    returns a stream of messages, this returns the gRPC call object, which can be iterated over to
+    get the messages (and also has a ``cancel()`` method, for example).
+
+    This is useful for high-rate streams, where wrapping each message has a measurable cost. Note
+    that the fields of submessages marked with ``[rpc_unwrap]`` are not collapsed into the
+    returned messages, and fields that use wrapper types (such as ``google.protobuf.BoolValue``)
+    must be accessed via their ``value`` attribute.
+
+    >>> for msg in raw_messages(connection.data.get_signal_bytes(**args)):
+    >>>     process(msg.channels)
+
+    To do this for every call on a connection, see the ``wrap_messages`` argument to
+    `minknow_api.Connection`.
+    """
+    if isinstance(response, MessageWrapper):
+        return response._message
+    return response
+
+
 class MessageWrapper(object):
+    def __new__(cls, message, unwraps=[]):
+        if isinstance(message, _RawResponse):
+            # see ServiceStub and _StubMethod
+            return message.response
+        return super().__new__(cls)
+
     def __init__(self, message, unwraps=[]):
         self._unwraps = unwraps
         self._objs = [getattr(message, attr) for attr in unwraps]
         self._objs.append(message)
         self._message = message
+        self._attributes = _attribute_table(type(message), unwraps)
 
     def __next__(self):
         try:
-            return MessageWrapper(next(self._message))
+            return MessageWrapper(next(self._message), self._unwraps)
         except grpc.RpcError as e:
             if e.code() == grpc.StatusCode.CANCELLED:
                 raise StopIteration
@@ -58,6 +381,14 @@ class MessageWrapper(object):
             yield MessageWrapper(m, self._unwraps)
 
     def __getattr__(self, name):
+        try:
+            index, is_wrapper = self._attributes[name]
+        except KeyError:
+            pass
+        else:
+            val = getattr(self._objs[index], name)
+            return val.value if is_wrapper else val
+
         for o in self._objs:
             try:
                 val = getattr(o, name)
@@ -0,0 +1,278 @@
+"""
+Acquisition output as columns
+=============================
+
+The ``stream_acquisition_output`` RPC on the statistics service reports the yield of an acquisition
+period over time, as snapshots of ``acquisition.AcquisitionYieldSummary`` messages. When the output
+is split (eg: by barcode and alignment reference), a long run produces a very large number of these
+messages.
+
+`AcquisitionOutputStore` folds the stream into a compact columnar form: for each filter group,
+there is a ``seconds`` array and one numpy array for each field of ``AcquisitionYieldSummary``
+(nested fields are flattened, so ``basecalled_pass_reads_split.simplex`` becomes the
+``basecalled_pass_reads_split_simplex`` column). New snapshots are appended as the updates arrive.
+
+>>> store = collect_acquisition_output(
+>>>     connection,
+>>>     acquisition_run_id,
+>>>     split=statistics_pb2.AcquisitionOutputSplit(barcode_name=True),
+>>> )
+>>> for filters, series in store.find(barcode_name="barcode01"):
+>>>     plt.plot(series.seconds, series["basecalled_pass_bases"])
+"""
+
+import collections
+import logging
+import operator
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy
+
+from . import acquisition_pb2, statistics_pb2
+from ._support import raw_messages
+
+__all__ = [
+    "AcquisitionOutputSeries",
+    "AcquisitionOutputStore",
+    "OutputFilter",
+    "YIELD_COLUMNS",
+    "collect_acquisition_output",
+]
+
+logger = logging.getLogger(__name__)
+
+#: A hashable version of ``statistics.AcquisitionOutputKey``.
+OutputFilter = collections.namedtuple(
+    "OutputFilter",
+    [field.name for field in statistics_pb2.AcquisitionOutputKey.DESCRIPTOR.fields],
+)
+
+
+def _yield_columns(descriptor, prefix=""):
+    columns = []
+    for field in descriptor.fields:
+        if field.message_type is not None:
+            columns.extend(
+                _yield_columns(field.message_type, prefix + field.name + ".")
+            )
+        elif field.cpp_type == field.CPPTYPE_FLOAT:
+            columns.append((prefix + field.name, numpy.float32))
+        else:
+            columns.append((prefix + field.name, numpy.int64))
+    return columns
+
+
+# (dotted field path, dtype) for each numeric field of AcquisitionYieldSummary
+_YIELD_FIELDS = _yield_columns(acquisition_pb2.AcquisitionYieldSummary.DESCRIPTOR)
+
+#: The names of the columns in an `AcquisitionOutputSeries`, other than ``seconds``.
+YIELD_COLUMNS = [path.replace(".", "_") for path, _ in _YIELD_FIELDS]
+
+_YIELD_GETTERS = [
+    (name, operator.attrgetter("yield_summary." + path), dtype)
+    for name, (path, dtype) in zip(YIELD_COLUMNS, _YIELD_FIELDS)
+]
+
+
+class _TimeSeriesColumns(object):
+    """Numpy columns that grow as rows are added, with one row per point in time.
+
+    Rows are added with `_merge`: rows for times that are already stored replace the stored
+    values (MinKNOW re-sends the most recent bucket as it fills up), and newer ones are appended.
+    """
+
+    def __init__(self, dtypes: Dict[str, type], capacity: int = 64):
+        self._times = numpy.empty(capacity, numpy.uint32)
+        self._columns = {
+            name: numpy.zeros(capacity, dtype) for name, dtype in dtypes.items()
+        }
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, column: str) -> numpy.ndarray:
+        return self._columns[column][: self._size]
+
+    @property
+    def columns(self) -> Dict[str, numpy.ndarray]:
+        return {name: values[: self._size] for name, values in self._columns.items()}
+
+    def _merge(self, times, values) -> None:
+        count = len(times)
+        if not count:
+            return
+        for name, column in values.items():
+            if name not in self._columns:
+                # eg: a channel state that has not been seen before
+                self._columns[name] = numpy.zeros(len(self._times), column.dtype)
+
+        stored = self._times[: self._size]
+        new = 0
+        if self._size:
+            new = int(numpy.searchsorted(times, stored[-1], side="right"))
+            if new:
+                rows = numpy.searchsorted(stored, times[:new])
+                matched = stored[numpy.minimum(rows, self._size - 1)] == times[:new]
+                if not matched.all():
+                    logger.debug("Ignoring rows older than the stored ones")
+                rows = rows[matched]
+                for name, column in values.items():
+                    self._columns[name][rows] = column[:new][matched]
+
+        end = self._size + count - new
+        if end > len(self._times):
+            self._grow(end)
+        self._times[self._size : end] = times[new:]
+        for name, column in values.items():
+            self._columns[name][self._size : end] = column[new:]
+        self._size = end
+
+    def _grow(self, min_capacity):
+        capacity = max(min_capacity, 2 * len(self._times))
+        size = self._size
+        times = numpy.empty(capacity, self._times.dtype)
+        times[:size] = self._times[:size]
+        self._times = times
+        for name, values in self._columns.items():
+            self._columns[name] = numpy.zeros(capacity, values.dtype)
+            self._columns[name][:size] = values[:size]
+
+
+class AcquisitionOutputSeries(_TimeSeriesColumns):
+    """The snapshots for one filter group, as columns.
+
+    Attributes:
+        seconds (numpy.ndarray): The time of each snapshot, in seconds since the start of the
+            acquisition period.
+        columns (Dict[str, numpy.ndarray]): An array for each name in `YIELD_COLUMNS`, with one
+            element per snapshot.
+    """
+
+    def __init__(self, capacity: int = 64):
+        super().__init__(
+            {name: dtype for name, _, dtype in _YIELD_GETTERS}, capacity=capacity
+        )
+
+    @property
+    def seconds(self) -> numpy.ndarray:
+        return self._times[: self._size]
+
+    def add_snapshots(self, snapshots) -> None:
+        """Add ``AcquisitionOutputSnapshot`` messages, in time order.
+
+        Snapshots for a time that is already stored replace the stored values (MinKNOW re-sends
+        the most recent snapshot as it fills up).
+        """
+        count = len(snapshots)
+        self._merge(
+            numpy.fromiter((s.seconds for s in snapshots), numpy.uint32, count),
+            {
+                name: numpy.fromiter((getter(s) for s in snapshots), dtype, count)
+                for name, getter, dtype in _YIELD_GETTERS
+            },
+        )
+
+
+def _filter_key(filtering) -> Tuple[OutputFilter, ...]:
+    return tuple(
+        OutputFilter(*(getattr(key, field) for field in OutputFilter._fields))
+        for key in filtering
+    )
+
+
+class AcquisitionOutputStore(object):
+    """The output of ``stream_acquisition_output``, as an `AcquisitionOutputSeries` for each
+    filter group.
+
+    Filter groups are keyed by a tuple of `OutputFilter` objects (one for each
+    ``AcquisitionOutputKey`` in the group's ``filtering`` field).
+    """
+
+    def __init__(self):
+        self._series: Dict[Tuple[OutputFilter, ...], AcquisitionOutputSeries] = {}
+
+    def __len__(self) -> int:
+        return len(self._series)
+
+    def __iter__(self) -> Iterator[Tuple[OutputFilter, ...]]:
+        return iter(self._series)
+
+    def __getitem__(self, key: Tuple[OutputFilter, ...]) -> AcquisitionOutputSeries:
+        return self._series[key]
+
+    def items(self):
+        return self._series.items()
+
+    def update(self, response) -> None:
+        """Add a ``StreamAcquisitionOutputResponse`` message."""
+        for group in response.snapshots:
+            key = _filter_key(group.filtering)
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = AcquisitionOutputSeries()
+            series.add_snapshots(group.snapshots)
+
+    def find(
+        self, **criteria
+    ) -> List[Tuple[Tuple[OutputFilter, ...], AcquisitionOutputSeries]]:
+        """Find the filter groups with a filter matching all of ``criteria``.
+
+        Args:
+            **criteria: `OutputFilter` field values (eg: ``barcode_name="barcode01"``).
+
+        Returns:
+            A list of ``(key, series)`` pairs.
+        """
+        unknown = set(criteria) - set(OutputFilter._fields)
+        if unknown:
+            raise ValueError("Unknown filter fields: " + ", ".join(sorted(unknown)))
+        return [
+            (key, series)
+            for key, series in self._series.items()
+            if any(
+                all(getattr(f, name) == value for name, value in criteria.items())
+                for f in key
+            )
+        ]
+
+
+def collect_acquisition_output(
+    connection,
+    acquisition_run_id: str,
+    store: Optional[AcquisitionOutputStore] = None,
+    on_update=None,
+    **kwargs
+) -> AcquisitionOutputStore:
+    """Fold the ``stream_acquisition_output`` stream into an `AcquisitionOutputStore`.
+
+    This returns when the stream ends, which is when the acquisition period ends (or immediately
+    after the first message, if it has already ended).
+
+    Args:
+        connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
+        acquisition_run_id: The acquisition period to get the output of.
+        store: The store to add to. Defaults to a new one.
+        on_update (callable, optional): Called with the store after each message is added, from
+            the calling thread.
+        **kwargs: Other arguments to ``stream_acquisition_output`` (eg: ``data_selection`` and
+            ``split``).
+
+    Returns:
+        The store.
+    """
+    if store is None:
+        store = AcquisitionOutputStore()
+    call = raw_messages(
+        connection.statistics.stream_acquisition_output(
+            acquisition_run_id=acquisition_run_id, **kwargs
+        )
+    )
+    try:
+        for response in call:
+            store.update(response)
+            if on_update:
+                on_update(store)
+    finally:
+        call.cancel()
+    return store
@@ -0,0 +1,656 @@
+"""
+Asyncio support
+===============
+
+`minknow_api.Connection` and `minknow_api.manager.Manager` use blocking gRPC calls, so watching many
+streams at once (for example, the channel states of every position on a PromethION) needs a thread
+per stream. This module provides versions of those classes built on ``grpc.aio``, so that a single
+event loop can drive all the calls.
+
+>>> async with minknow_api.aio.Manager(host="localhost") as manager:
+>>>     for position in await manager.flow_cell_positions():
+>>>         async with position.connect() as connection:
+>>>             print(await connection.device.get_device_state())
+
+The services have the same methods as the ones on the blocking classes (see :ref:`rpc-services`),
+and accept the same arguments, but:
+
+- methods that return a single message are coroutines, and must be awaited
+- methods that return a stream of messages return an async iterator (which also has a ``cancel()``
+  method to end the call early)
+- methods that take a stream of messages (such as ``data.get_live_reads``) accept an async or
+  normal iterator of request messages
+
+Note that the credentials are still looked up with blocking calls when a `Connection` or `Manager`
+is constructed (see `minknow_api.grpc_credentials`, which caches them).
+"""
+
+import asyncio
+import copy
+import functools
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Union
+import os
+
+import grpc
+import grpc.aio
+
+import minknow_api
+import minknow_api.manager
+from minknow_api import manager_pb2
+from minknow_api._support import (
+    DEFAULT_RETRY_POLICY,
+    MessageWrapper,
+    RetryAttempts,
+    RetryPolicy,
+    ServiceStub,
+)
+
+__all__ = [
+    "Connection",
+    "FlowCellPosition",
+    "Manager",
+    "MessageStream",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class _RecordedCall(object):
+    """The arguments a generated service method passed to its stub."""
+
+    def __init__(self, method: str, request: Any, timeout: Optional[float]):
+        self.method = method
+        self.request = request
+        self.timeout = timeout
+
+    def __getattr__(self, name):
+        # MessageWrapper looks up the fields it unwraps on construction
+        return None
+
+
+class _RecordingStub(object):
+    """Stands in for a gRPC stub, so a generated service method can be used to turn keyword
+    arguments into a request message without making a call.
+    """
+
+    def __getattr__(self, method: str):
+        def record(request, timeout=None):
+            return _RecordedCall(method, request, timeout)
+
+        return record
+
+
+class MessageStream(object):
+    """The responses from a streaming call.
+
+    This is an async iterator of (wrapped) response messages. Other attributes (such as
+    ``cancel()``) are forwarded to the underlying ``grpc.aio.Call``. As with the blocking API,
+    iteration just stops if the call is cancelled.
+    """
+
+    def __init__(self, call: grpc.aio.Call, unwraps: List[str]):
+        self._call = call
+        self._unwraps = unwraps
+        self._iter = call.__aiter__()
+
+    def __aiter__(self) -> "MessageStream":
+        return self
+
+    async def __anext__(self) -> MessageWrapper:
+        try:
+            return MessageWrapper(await self._iter.__anext__(), self._unwraps)
+        except asyncio.CancelledError:
+            if self._call.cancelled():
+                raise StopAsyncIteration
+            raise
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.CANCELLED:
+                raise StopAsyncIteration
+            raise
+
+    def __getattr__(self, name):
+        return getattr(self._call, name)
+
+
+class _AsyncService(object):
+    """Base class for the async versions of the generated service classes.
+
+    Subclasses are created by `_async_service_class`.
+    """
+
+    _sync_class: type
+
+    def __init__(
+        self,
+        channel: grpc.aio.Channel,
+        service_name: str,
+        wrap_messages: bool = True,
+        retry_policy: RetryPolicy = DEFAULT_RETRY_POLICY,
+        retry_policies: Optional[Dict[str, RetryPolicy]] = None,
+    ):
+        # The generated stubs work with both blocking and async channels
+        sync_service = self._sync_class(channel)
+        self._wrap_messages = wrap_messages
+        self._stub = ServiceStub(
+            sync_service._stub,
+            service_name,
+            retry_policy=retry_policy,
+            retry_policies=retry_policies,
+        )
+        self._pb = sync_service._pb
+        self._full_name = self._pb.DESCRIPTOR.services_by_name[
+            self._sync_class.__name__
+        ].full_name
+        self._recorder = copy.copy(sync_service)
+        self._recorder._stub = _RecordingStub()
+
+    def _record(self, name: str, *args, **kwargs):
+        """Run the generated method, returning the call it would make and the unwrapped fields."""
+        result = getattr(self._recorder, name)(*args, **kwargs)
+        if isinstance(result, MessageWrapper):
+            return result._message, result._unwraps
+        return result, []
+
+    async def _unary_call(self, name: str, *args, **kwargs) -> MessageWrapper:
+        recorded, unwraps = self._record(name, *args, **kwargs)
+        method = getattr(self._stub, recorded.method)
+        attempts = RetryAttempts(
+            method.retry_policy,
+            recorded.timeout,
+            "{}.{}".format(self._full_name, recorded.method),
+        )
+        while True:
+            try:
+                response = await method(recorded.request, timeout=attempts.timeout())
+                if not self._wrap_messages:
+                    return response
+                return MessageWrapper(response, unwraps=unwraps)
+            except grpc.RpcError as e:
+                delay = attempts.retry_delay(e)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+
+    def _streaming_call(self, name: str, *args, **kwargs):
+        recorded, unwraps = self._record(name, *args, **kwargs)
+        method = getattr(self._stub, recorded.method)
+        call = method(recorded.request, timeout=recorded.timeout)
+        if not self._wrap_messages:
+            return call
+        return MessageStream(call, unwraps)
+
+
+def _make_async_method(name: str, sync_method, stub_method):
+    if isinstance(
+        stub_method, (grpc.UnaryStreamMultiCallable, grpc.StreamStreamMultiCallable)
+    ):
+
+        def method(self, *args, **kwargs):
+            return self._streaming_call(name, *args, **kwargs)
+
+    else:
+
+        async def method(self, *args, **kwargs):
+            return await self._unary_call(name, *args, **kwargs)
+
+    functools.update_wrapper(method, sync_method)
+    return method
+
+
+_async_service_classes: Dict[type, type] = {}
+
+
+def _async_service_class(sync_class: type) -> type:
+    """Create (or find) the async version of a generated service class."""
+    try:
+        return _async_service_classes[sync_class]
+    except KeyError:
+        pass
+
+    # we need an instance of the stub to find out what sort of call each method makes (this
+    # doesn't actually connect to anything)
+    with grpc.insecure_channel("localhost:0") as channel:
+        stub = sync_class(channel)._stub
+
+    namespace = {"_sync_class": sync_class, "__doc__": sync_class.__doc__}
+    for name, sync_method in vars(sync_class).items():
+        if name.startswith("_") or not callable(sync_method):
+            continue
+        stub_method = getattr(stub, name, None)
+        if stub_method is None:
+            continue
+        namespace[name] = _make_async_method(name, sync_method, stub_method)
+
+    async_class = type(sync_class.__name__, (_AsyncService,), namespace)
+    async_class.__module__ = __name__
+    _async_service_classes[sync_class] = async_class
+    return async_class
+
+
+def _service(
+    sync_class: type, channel: grpc.aio.Channel, service_name: str, **kwargs
+) -> _AsyncService:
+    return _async_service_class(sync_class)(channel, service_name, **kwargs)
+
+
+class Connection(object):
+    """An asyncio connection to a MinKNOW flow cell sequencing position via RPC.
+
+    This takes the same arguments as `minknow_api.Connection`, and has the same services as
+    attributes, but the methods on the services are async (see the module documentation). If
+    ``wrap_messages`` is False, streaming methods return the ``grpc.aio.Call`` itself. Unary calls
+    are retried according to ``retry_policy`` and ``retry_policies``, as for
+    `minknow_api.Connection`.
+
+    Unlike `minknow_api.Connection`, constructing this does not check that MinKNOW can be reached.
+    Use the connection as an async context manager (or await `wait_until_ready`) to do that:
+
+    >>> async with minknow_api.aio.Connection(port=8000) as connection:
+    >>>     await connection.protocol.start_protocol(identifier="my_script")
+
+    Attributes:
+        channel (grpc.aio.Channel): The gRPC channel used for communication.
+        host (str): The host MinKNOW is running on.
+        port (int): The port connected to.
+    """
+
+    def __init__(
+        self,
+        port: Optional[int] = None,
+        host: str = "127.0.0.1",
+        credentials: Optional[grpc.ChannelCredentials] = None,
+        developer_api_token: Optional[str] = None,
+        client_certificate_chain: Optional[bytes] = None,
+        client_private_key: Optional[bytes] = None,
+        ca_certificate: Optional[bytes] = None,
+        environ: Union[Dict[str, str], os._Environ] = os.environ,
+        wrap_messages: bool = True,
+        retry_policy: Optional[RetryPolicy] = None,
+        retry_policies: Optional[Dict[str, RetryPolicy]] = None,
+    ):
+        self.environ = environ
+        self.host = host
+        if port is None:
+            port = int(self.environ["MINKNOW_RPC_PORT_SECURE"])
+        self.port = port
+
+        credentials = minknow_api._connection_credentials(
+            host=host,
+            credentials=credentials,
+            developer_api_token=developer_api_token,
+            client_certificate_chain=client_certificate_chain,
+            client_private_key=client_private_key,
+            ca_certificate=ca_certificate,
+            environ=self.environ,
+            _warning_stacklevel=1,
+        )
+        self.channel = grpc.aio.secure_channel(
+            f"{host}:{port}",
+            credentials=credentials,
+            options=minknow_api.GRPC_CHANNEL_OPTIONS,
+        )
+
+        self._service_options = dict(
+            wrap_messages=wrap_messages,
+            retry_policy=retry_policy or DEFAULT_RETRY_POLICY,
+            retry_policies=retry_policies,
+        )
+
+    def __getattr__(self, name):
+        # One entry for each service, created when it is first used
+        if name not in minknow_api._services or "channel" not in self.__dict__:
+            raise AttributeError(
+                f"{type(self).__name__!r} object has no attribute {name!r}"
+            )
+        try:
+            module = minknow_api._service_module(name)
+        except ImportError:
+            if name not in minknow_api._optional_services:
+                raise
+            raise AttributeError(f"The {name!r} service is not available")
+        for svc_class_name in minknow_api._services[name].services:
+            service = _service(
+                getattr(module, svc_class_name),
+                self.channel,
+                name,
+                **self._service_options,
+            )
+            setattr(self, name, service)
+        return service
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(minknow_api._services))
+
+    async def wait_until_ready(self, retry_count: int = 5) -> None:
+        """Check that MinKNOW can be reached, retrying if the connection is not ready yet.
+
+        This retries in the same circumstances that constructing `minknow_api.Connection` does.
+
+        Args:
+            retry_count: How many attempts to make before giving up.
+
+        Raises:
+            grpc.RpcError: if MinKNOW could not be reached.
+        """
+        for i in range(retry_count):
+            try:
+                logger.debug("Calling get_version_info to test connection")
+                await self.instance.get_version_info()
+                return
+            except grpc.RpcError as e:
+                logger.info("Error received from rpc")
+                retryable = (
+                    e.code() == grpc.StatusCode.INTERNAL
+                    and e.details() == "GOAWAY received"
+                ) or e.code() == grpc.StatusCode.UNAVAILABLE
+                if not retryable or i == retry_count - 1:
+                    raise
+                logger.warning(
+                    "Failed to connect to minknow instance (retry %s/%s): %s",
+                    i + 1,
+                    retry_count,
+                    e.details(),
+                )
+            await asyncio.sleep(0.5)
+
+    async def close(self) -> None:
+        """Close the connection, cancelling any calls still in progress."""
+        await self.channel.close()
+
+    async def __aenter__(self) -> "Connection":
+        try:
+            await self.wait_until_ready()
+        except BaseException:
+            await self.close()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+class FlowCellPosition(minknow_api.manager.FlowCellPosition):
+    """A flow cell position, as returned by `Manager.flow_cell_positions`.
+
+    This is the same as `minknow_api.manager.FlowCellPosition`, except that `connect` returns an
+    asyncio `Connection`.
+    """
+
+    def __repr__(self) -> str:
+        return "aio.FlowCellPosition({!r}, {{{!r}}})".format(
+            self.host, self.description
+        )
+
+    def connect(
+        self, credentials: Optional[grpc.ChannelCredentials] = None
+    ) -> Connection:
+        """Connect to the position.
+
+        Only valid to do if `running` is True.
+
+        Args:
+            credentials: Override the credentials to be used for this particular
+                connection.
+
+        Returns:
+            A connection to the RPC interface. This should be used as an async context manager (or
+            `Connection.wait_until_ready` awaited) before use.
+        """
+        port = self.description.rpc_ports.secure
+        if credentials is None:
+            credentials = self.credentials
+
+        if port == 0:
+            raise RuntimeError(
+                "Invalid port for connection to '%s': '%s'" % (self.description, port)
+            )
+        return Connection(host=self.host, port=port, credentials=credentials)
+
+
+class Manager(object):
+    """An asyncio connection to the manager gRPC interface.
+
+    This takes the same arguments as `minknow_api.manager.Manager`. The version attributes are only
+    filled in once `wait_until_ready` has been awaited (which happens automatically when the manager
+    is used as an async context manager).
+
+    Only the most commonly-used helpers from `minknow_api.manager.Manager` are provided. Everything
+    else is available via the `rpc` attribute and the service accessors.
+
+    Attributes:
+        channel (grpc.aio.Channel): The gRPC channel used for communication.
+        credentials (grpc.ChannelCredentials): The credentials used for the gRPC connection. These
+            are also used for connections to flow cell positions.
+        host (str): The hostname used to connect.
+        port (int): The port used to connect.
+        rpc: The async version of `minknow_api.manager_service.ManagerService`.
+        core_version (str): The running version of MinKNOW Core.
+        core_version_components (tuple): The major, minor and patch parts of the core version.
+        version (str): The version of the MinKNOW distribution.
+    """
+
+    DEFAULT_TIMEOUT = minknow_api.manager.Manager.DEFAULT_TIMEOUT
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: Optional[int] = None,
+        developer_api_token: Optional[str] = None,
+        credentials: Optional[grpc.ChannelCredentials] = None,
+        client_certificate_chain: Optional[bytes] = None,
+        client_private_key: Optional[bytes] = None,
+        ca_certificate: Optional[bytes] = None,
+        environ: Union[Dict[str, str], os._Environ] = os.environ,
+    ):
+        self.host = host
+        self.port, self.credentials = minknow_api.manager._manager_port_and_credentials(
+            host=host,
+            port=port,
+            developer_api_token=developer_api_token,
+            credentials=credentials,
+            client_certificate_chain=client_certificate_chain,
+            client_private_key=client_private_key,
+            ca_certificate=ca_certificate,
+            environ=environ,
+            _warning_stacklevel=1,
+        )
+        self.channel = grpc.aio.secure_channel(
+            f"{host}:{self.port}",
+            self.credentials,
+            options=minknow_api.GRPC_CHANNEL_OPTIONS,
+        )
+        self.rpc = _service(
+            minknow_api.manager_service.ManagerService, self.channel, "manager"
+        )
+        self.analysis_workflows = _service(
+            minknow_api.analysis_workflows_service.AnalysisWorkflowsService,
+            self.channel,
+            "analysis_workflows",
+        )
+        self.core_version = None
+        self.core_version_components = None
+        self.version = None
+
+    def __repr__(self) -> str:
+        return "aio.Manager({!r}, {!r})".format(self.host, self.port)
+
+    async def wait_until_ready(self) -> None:
+        """Connect to the manager, and fetch its version information."""
+        version_info = await self.rpc.get_version_info()
+        self.core_version = version_info.minknow.full
+        self.core_version_components = (
+            version_info.minknow.major,
+            version_info.minknow.minor,
+            version_info.minknow.patch,
+        )
+        self.version = version_info.distribution_version
+
+    async def close(self) -> None:
+        """Close the RPC connection."""
+        await self.channel.close()
+
+    async def __aenter__(self) -> "Manager":
+        try:
+            await self.wait_until_ready()
+        except BaseException:
+            await self.close()
+            raise
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def hardware_check(self):
+        """The async version of the manager's hardware check service."""
+        return _service(
+            minknow_api.hardware_check_service.HardwareCheckService,
+            self.channel,
+            "hardware_check",
+        )
+
+    def keystore(self):
+        """The async version of the manager's keystore service."""
+        return _service(
+            minknow_api.keystore_service.KeyStoreService, self.channel, "keystore"
+        )
+
+    def log(self):
+        """The async version of the manager's log service."""
+        return _service(minknow_api.log_service.LogService, self.channel, "log")
+
+    def protocols(self):
+        """The async version of the manager's v2 protocols service."""
+        return _service(
+            minknow_api.v2.protocols_service.ProtocolsService, self.channel, "protocols"
+        )
+
+    def presets(self):
+        """The async version of the manager's presets service."""
+        return _service(
+            minknow_api.ui.sequencing_run.presets_service.PresetsService,
+            self.channel,
+            "presets",
+        )
+
+    async def flow_cell_positions(
+        self, timeout: float = DEFAULT_TIMEOUT
+    ) -> List[FlowCellPosition]:
+        """Get a list of flow cell positions.
+
+        Args:
+            timeout: The maximum time to wait for the call to complete. Should
+                usually be left at the default.
+
+        Returns:
+            The flow cell positions. Ordering is not guaranteed.
+        """
+        return [
+            FlowCellPosition(position, host=self.host, credentials=self.credentials)
+            async for msg in self.rpc.flow_cell_positions(_timeout=timeout)
+            for position in msg.positions
+        ]
+
+    async def connect_to(self, position: str) -> Connection:
+        """Connects to a position on the host.
+
+        Args:
+            position: The name of the position to connect to.
+
+        Returns:
+            The Connection object associated with the named position. This has been checked to be
+            ready for use.
+
+        Raises:
+            RuntimeError if the position cannot be found
+        """
+        for pos in await self.flow_cell_positions():
+            if pos.name == position:
+                connection = pos.connect()
+                try:
+                    await connection.wait_until_ready()
+                except BaseException:
+                    await connection.close()
+                    raise
+                return connection
+        raise RuntimeError(f"Cannot find position with name '{position}'")
+
+    async def connect_all(
+        self,
+        positions: Optional[Iterable[str]] = None,
+        max_concurrent: Optional[int] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> minknow_api.manager.ConnectAllResult:
+        """Connect to several positions at once.
+
+        This is the asyncio version of `minknow_api.manager.Manager.connect_all`. The connections
+        in the result have been checked to be ready for use.
+
+        Args:
+            positions: The names of the positions to connect to. If not provided, connects to all
+                the positions whose software is running.
+            max_concurrent: The maximum number of connections to make at the same time. By
+                default, all the connections are made at once.
+            timeout: The maximum time to wait for the list of positions. Should usually be left at
+                the default.
+
+        Returns:
+            The connections that were made, and the errors for the positions that could not be
+            connected to (including requested positions that do not exist).
+        """
+        to_connect, errors = minknow_api.manager._positions_to_connect(
+            await self.flow_cell_positions(timeout=timeout), positions
+        )
+        limit = asyncio.Semaphore(max_concurrent or max(len(to_connect), 1))
+
+        async def connect(position):
+            async with limit:
+                connection = position.connect()
+                try:
+                    await connection.wait_until_ready()
+                except BaseException:
+                    await connection.close()
+                    raise
+                return connection
+
+        results = await asyncio.gather(
+            *(connect(pos) for pos in to_connect), return_exceptions=True
+        )
+        connections = {}
+        for pos, result in zip(to_connect, results):
+            if isinstance(result, Exception):
+                errors[pos.name] = result
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                connections[pos.name] = result
+        return minknow_api.manager.ConnectAllResult(connections, errors)
+
+    async def describe_host(
+        self, timeout: float = DEFAULT_TIMEOUT
+    ) -> manager_pb2.DescribeHostResponse:
+        """Get information about the machine running MinKNOW.
+
+        Args:
+            timeout: The maximum time to wait for the call to complete. Should
+                usually be left at the default.
+        """
+        return await self.rpc.describe_host(_timeout=timeout)
+
+    async def reset_positions(
+        self,
+        positions: Iterable[str],
+        force: bool = False,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> None:
+        """Reset flow-cell positions.
+
+        Args:
+            positions: The names of the positions to reset.
+            force: Restart the position even if it seems to be running fine.
+            timeout: The maximum time to wait for the call to complete. Should
+                usually be left at the default.
+        """
+        await self.rpc.reset_position(
+            _timeout=timeout, positions=list(positions), force=force
+        )
@@ -0,0 +1,241 @@
+"""
+Sharing gRPC channels
+=====================
+
+Creating a `minknow_api.Connection` opens a new gRPC channel, which means a new TCP connection and
+TLS handshake, and then makes a call to check that MinKNOW is reachable. Applications that connect
+to the same positions repeatedly (for example, a dashboard polling every position on a PromethION)
+can avoid this cost by sharing channels through a `ChannelPool`.
+
+A pool hands out one channel per (host, port, credentials) combination, and counts how many
+connections are using it. A new channel is only shared once the connection that opened it has
+checked that MinKNOW is reachable: other connections to the same place wait for that check rather
+than skipping it. When the last connection using a channel is closed, the channel is kept open for
+at least ``idle_timeout`` seconds in case another connection wants it. There is no background
+thread, so the channel is actually closed the next time the pool is used after that (or by
+`ChannelPool.clear`).
+
+`minknow_api.manager.FlowCellPosition.connect` (and so `minknow_api.manager.Manager.connect_to`)
+uses `DEFAULT_CHANNEL_POOL`. Other connections can use a pool by passing it to
+`minknow_api.Connection`:
+
+>>> pool = ChannelPool(idle_timeout=30)
+>>> with Connection(port=8000, channel_pool=pool) as connection:
+>>>     connection.instance.get_version_info()
+>>> pool.get_stats()
+ChannelPoolStats(hits=0, misses=1, evictions=0, open_channels=1, in_use=0)
+
+Note that the credentials are compared by identity, not by value, so connections must use the same
+`grpc.ChannelCredentials` object to share a channel.
+
+Connections that share a channel must not close it directly: use `minknow_api.Connection.close`
+(or a ``with`` block) instead, which returns the channel to the pool.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+
+import grpc
+
+__all__ = [
+    "ChannelPool",
+    "ChannelPoolStats",
+    "DEFAULT_CHANNEL_POOL",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelPoolStats(NamedTuple):
+    """Usage statistics for a `ChannelPool`.
+
+    Attributes:
+        hits: How many times an existing channel was handed out.
+        misses: How many times a new channel had to be opened.
+        evictions: How many channels the pool has closed, whether because they were idle for too
+            long, could not be used to connect or were removed with `ChannelPool.clear`.
+        open_channels: How many channels the pool currently has open.
+        in_use: How many of the open channels are currently being used by a connection.
+    """
+
+    hits: int
+    misses: int
+    evictions: int
+    open_channels: int
+    in_use: int
+
+
+class _PooledChannel(object):
+    def __init__(self, key, channel: grpc.Channel, credentials):
+        self.key = key
+        self.channel = channel
+        # holding on to the credentials keeps their id (which is part of the key) from being reused
+        self.credentials = credentials
+        self.users = 0
+        self.idle_since: Optional[float] = None
+        # whether the channel has been used to connect successfully; until then, other acquirers
+        # wait for `ready` instead of being handed the channel
+        self.verified = False
+        self.ready = threading.Event()
+
+
+class ChannelPool(object):
+    """A reference-counted pool of gRPC secure channels.
+
+    Args:
+        idle_timeout: How long (in seconds) to keep a channel open once nothing is using it.
+            Idle channels are closed the next time the pool is used after this time has passed.
+        clock: The time source, for testing.
+    """
+
+    def __init__(self, idle_timeout: float = 60.0, clock=time.monotonic):
+        self.idle_timeout = idle_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, int], _PooledChannel] = {}
+        self._by_channel: Dict[int, _PooledChannel] = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def acquire(
+        self,
+        target: str,
+        credentials: grpc.ChannelCredentials,
+        options: Sequence[Tuple[str, object]] = (),
+    ) -> Tuple[grpc.Channel, bool]:
+        """Get a channel to ``target``, opening one if necessary.
+
+        Every call to `acquire` must be matched with a call to `release`. If this opens a new
+        channel, the caller must check that it works, and then call `confirm` (or `release` it
+        with ``discard=True`` if it does not). Meanwhile, other calls for the same target wait for
+        the result rather than being given the unchecked channel.
+
+        Args:
+            target: The address to connect to, in the form ``host:port``.
+            credentials: The credentials to connect with.
+            options: gRPC channel options. These are only used if a new channel is opened.
+
+        Returns:
+            A tuple of the channel and whether it was already open. A channel that was already open
+            has been used to connect successfully before.
+        """
+        # credentials are compared by identity; the entry keeps a reference to them, so their id
+        # cannot be reused by other credentials while the entry exists
+        key = (target, id(credentials))
+        while True:
+            to_close = []
+            try:
+                with self._lock:
+                    to_close = self._evict_idle_locked()
+                    entry = self._entries.get(key)
+                    if entry is None:
+                        self._misses += 1
+                        channel = grpc.secure_channel(
+                            target, credentials, options=options
+                        )
+                        entry = _PooledChannel(key, channel, credentials)
+                        entry.users = 1
+                        self._entries[key] = entry
+                        self._by_channel[id(channel)] = entry
+                        return channel, False
+                    if entry.verified:
+                        self._hits += 1
+                        entry.users += 1
+                        entry.idle_since = None
+                        return entry.channel, True
+            finally:
+                self._close_channels(to_close)
+            # another caller is still checking the channel; if the check fails, the entry is
+            # removed and the next time round opens a new channel
+            entry.ready.wait()
+
+    def confirm(self, channel: grpc.Channel) -> None:
+        """Record that a new channel from `acquire` has been used to connect successfully.
+
+        This allows the channel to be handed out to other callers.
+        """
+        with self._lock:
+            entry = self._by_channel.get(id(channel))
+            if entry is not None and entry.channel is channel:
+                entry.verified = True
+                entry.ready.set()
+
+    def release(self, channel: grpc.Channel, discard: bool = False) -> None:
+        """Stop using a channel obtained from `acquire`.
+
+        Args:
+            channel: The channel returned by `acquire`.
+            discard: Close the channel as soon as nothing else is using it, rather than keeping it
+                for reuse. Use this if the channel could not be used to connect. It also stops the
+                channel from being handed out by `acquire` again.
+        """
+        to_close = []
+        try:
+            with self._lock:
+                entry = self._by_channel.get(id(channel))
+                if entry is None or entry.channel is not channel:
+                    logger.debug("Released channel that does not belong to the pool")
+                    return
+                entry.users -= 1
+                if discard and self._entries.get(entry.key) is entry:
+                    del self._entries[entry.key]
+                elif not discard:
+                    # the channel was used without problems
+                    entry.verified = True
+                entry.ready.set()
+                if entry.users == 0:
+                    entry.idle_since = self._clock()
+                    if self._entries.get(entry.key) is not entry:
+                        to_close.append(self._remove_locked(entry))
+                to_close += self._evict_idle_locked()
+        finally:
+            self._close_channels(to_close)
+
+    def get_stats(self) -> ChannelPoolStats:
+        """Get usage statistics for the pool."""
+        with self._lock:
+            return ChannelPoolStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                open_channels=len(self._by_channel),
+                in_use=sum(1 for e in self._by_channel.values() if e.users > 0),
+            )
+
+    def clear(self) -> None:
+        """Close all the channels that are not currently being used."""
+        with self._lock:
+            to_close = [
+                self._remove_locked(entry)
+                for entry in list(self._by_channel.values())
+                if entry.users == 0
+            ]
+        self._close_channels(to_close)
+
+    def _remove_locked(self, entry: _PooledChannel) -> grpc.Channel:
+        self._evictions += 1
+        entry.ready.set()
+        del self._by_channel[id(entry.channel)]
+        if self._entries.get(entry.key) is entry:
+            del self._entries[entry.key]
+        return entry.channel
+
+    def _evict_idle_locked(self):
+        now = self._clock()
+        return [
+            self._remove_locked(entry)
+            for entry in list(self._by_channel.values())
+            if entry.users == 0 and now - entry.idle_since >= self.idle_timeout
+        ]
+
+    @staticmethod
+    def _close_channels(channels):
+        for channel in channels:
+            channel.close()
+
+
+#: The pool used by `minknow_api.manager.FlowCellPosition.connect`.
+DEFAULT_CHANNEL_POOL = ChannelPool()
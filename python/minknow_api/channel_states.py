@@ -0,0 +1,327 @@
+"""
+Tracking channel states
+=======================
+
+The ``get_channel_states`` RPC on the data service streams the changes to the state of each channel
+(eg: "pore", "strand" or "unavailable"). `ChannelStateTracker` applies those changes to a numpy
+array holding the current state of every channel, so that the state of the whole flow cell is
+always available without having to process the stream. It also keeps a count of the channels in
+each state, and a fixed-size history of the most recent transitions.
+
+The tracker requests numeric state IDs rather than names, and looks up the names with
+``analysis_configuration.get_channel_states_desc``. Each change only updates the channels it
+mentions, so the cost of keeping up with the stream depends on how many channels change, not on how
+many there are.
+
+>>> with ChannelStateTracker(connection, first_channel=1, last_channel=3000) as tracker:
+>>>     tracker.wait_until_ready()
+>>>     while tracker.is_running:
+>>>         print("pore:", tracker.count("pore"), "strand:", tracker.count("strand"))
+>>>         time.sleep(1)
+"""
+
+import collections
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+import grpc
+import numpy
+from google.protobuf import duration_pb2
+
+from ._support import raw_messages
+
+__all__ = [
+    "ChannelStateTracker",
+    "TRANSITION_DTYPE",
+    "UNKNOWN_STATE",
+]
+
+logger = logging.getLogger(__name__)
+
+#: The state ID of channels whose state has not been reported yet.
+UNKNOWN_STATE = numpy.iinfo(numpy.uint16).max
+
+#: The numpy type of the transitions returned by `ChannelStateTracker.get_transitions`.
+#:
+#: ``received`` is when the change was received (according to ``time.monotonic()``), ``previous``
+#: and ``state`` are state IDs, and ``acquisition_raw_index`` is the sample at which MinKNOW saw
+#: the new state.
+TRANSITION_DTYPE = numpy.dtype(
+    [
+        ("received", numpy.float64),
+        ("channel", numpy.uint32),
+        ("previous", numpy.uint16),
+        ("state", numpy.uint16),
+        ("acquisition_raw_index", numpy.uint64),
+    ]
+)
+
+
+class ChannelStateTracker(object):
+    """Keeps track of the current state of a range of channels.
+
+    The ``get_channel_states`` call is started by `start` (or by using the tracker as a context
+    manager) and runs on a background thread until `stop` is called or the call ends. Messages
+    from a call made elsewhere can be applied with `update` instead.
+
+    State IDs are stored as ``numpy.uint16`` values: MinKNOW's built-in states have IDs above 200,
+    and `UNKNOWN_STATE` is reserved for channels that have not been reported yet.
+
+    Args:
+        connection: Connection to a MinKNOW flow cell position.
+        first_channel: The first channel to track (channels start at 1).
+        last_channel: The last channel to track.
+        history_size: How many transitions to remember (see `get_transitions`).
+        heartbeat: If given, ask MinKNOW to send a message at least this often (in seconds), even
+            if nothing has changed.
+        wait_for_processing: If True, wait for MinKNOW to start acquiring data rather than
+            failing if it has not.
+
+    Attributes:
+        connection (minknow_api.Connection): The connection used for the call.
+        state_names (Dict[int, str]): The name of each state, keyed by state ID.
+    """
+
+    def __init__(
+        self,
+        connection: "minknow_api.Connection",
+        first_channel: int,
+        last_channel: int,
+        history_size: int = 10000,
+        heartbeat: Optional[float] = None,
+        wait_for_processing: bool = False,
+    ):
+        if last_channel < first_channel:
+            raise ValueError("last_channel must not be less than first_channel")
+        self.connection = connection
+        self.first_channel = first_channel
+        self.last_channel = last_channel
+        self._heartbeat = heartbeat
+        self._wait_for_processing = wait_for_processing
+
+        self._lock = threading.Lock()
+        self._updated = threading.Condition(self._lock)
+
+        self.state_names: Dict[int, str] = {}
+        self._state_ids: Dict[str, int] = {}
+        self.refresh_state_names()
+
+        channel_count = last_channel - first_channel + 1
+        self._states = numpy.full(channel_count, UNKNOWN_STATE, dtype=numpy.uint16)
+        self._counts: Dict[int, int] = collections.Counter(
+            {UNKNOWN_STATE: channel_count}
+        )
+        self._history = numpy.zeros(history_size, dtype=TRANSITION_DTYPE)
+        self._history_count = 0
+        self._message_count = 0
+
+        self._stopping = False
+        self._call = None
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[grpc.RpcError] = None
+
+    def __enter__(self) -> "ChannelStateTracker":
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def refresh_state_names(self) -> None:
+        """Fetch the state names again (eg: after a new protocol has started)."""
+        desc = self.connection.analysis_configuration.get_channel_states_desc()
+        names = {
+            state.id: state.name for group in desc.groups for state in group.states
+        }
+        with self._lock:
+            self.state_names = names
+            self._state_ids = {name: id for id, name in names.items()}
+
+    def start(self) -> None:
+        """Start the ``get_channel_states`` call."""
+        if self._thread is not None:
+            raise RuntimeError("ChannelStateTracker has already been started")
+        kwargs = {}
+        if self._heartbeat is not None:
+            kwargs["heartbeat"] = duration_pb2.Duration()
+            kwargs["heartbeat"].FromNanoseconds(int(self._heartbeat * 1e9))
+        self._call = raw_messages(
+            self.connection.data.get_channel_states(
+                first_channel=self.first_channel,
+                last_channel=self.last_channel,
+                use_channel_states_ids=True,
+                wait_for_processing=self._wait_for_processing,
+                **kwargs,
+            )
+        )
+        self._thread = threading.Thread(
+            target=self._receive,
+            name="minknow_api.channel_states receiver",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """End the ``get_channel_states`` call.
+
+        Args:
+            timeout: How long to wait for the background thread to finish.
+        """
+        with self._lock:
+            self._stopping = True
+            self._updated.notify_all()
+        if self._call is not None:
+            self._call.cancel()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the call is still running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def error(self) -> Optional[grpc.RpcError]:
+        """The error the call failed with, if any.
+
+        This is not set if the call was ended by `stop`.
+        """
+        return self._error
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the first message from MinKNOW, which has the state of every channel.
+
+        Returns:
+            True if the first message has been received, False if the timeout expired or the call
+            ended first.
+        """
+        with self._lock:
+            self._updated.wait_for(
+                lambda: self._message_count > 0
+                or self._stopping
+                or not self.is_running,
+                timeout,
+            )
+            return self._message_count > 0
+
+    def update(self, message) -> None:
+        """Apply a ``GetChannelStatesResponse`` message.
+
+        This is done automatically for the call made by `start`. The message must contain state
+        IDs (ie: be from a call with ``use_channel_states_ids`` set).
+        """
+        received = time.monotonic()
+        with self._lock:
+            states = self._states
+            counts = self._counts
+            history = self._history
+            size = len(history)
+            for change in message.channel_states:
+                index = change.channel - self.first_channel
+                if not 0 <= index < len(states):
+                    continue
+                previous = int(states[index])
+                state = change.state_id
+                if previous == state:
+                    continue
+                states[index] = state
+                counts[previous] -= 1
+                counts[state] += 1
+                if size:
+                    history[self._history_count % size] = (
+                        received,
+                        change.channel,
+                        previous,
+                        state,
+                        change.acquisition_raw_index,
+                    )
+                self._history_count += 1
+            self._message_count += 1
+            self._updated.notify_all()
+
+    def get_states(self) -> numpy.ndarray:
+        """Get the state ID of every channel.
+
+        Returns:
+            A copy of the state array. Element 0 is `first_channel`.
+        """
+        with self._lock:
+            return self._states.copy()
+
+    def state(self, channel: int) -> Optional[str]:
+        """Get the name of the state of a channel, or None if it is not known yet."""
+        with self._lock:
+            state = int(self._states[channel - self.first_channel])
+        if state == UNKNOWN_STATE:
+            return None
+        return self.state_names.get(state, str(state))
+
+    def count(self, state: str) -> int:
+        """Get the number of channels in a state, by name."""
+        state_id = self._state_ids.get(state)
+        if state_id is None:
+            return 0
+        with self._lock:
+            return self._counts[state_id]
+
+    def counts(self) -> Dict[str, int]:
+        """Get the number of channels in each state that at least one channel is in.
+
+        States with IDs not in `state_names` are given their ID as a name. Channels that have not
+        been reported yet are not included.
+        """
+        with self._lock:
+            counts = [(id, n) for id, n in self._counts.items() if n > 0]
+        return {
+            self.state_names.get(id, str(id)): n
+            for id, n in counts
+            if id != UNKNOWN_STATE
+        }
+
+    def channels_in(self, state: str) -> numpy.ndarray:
+        """Get the channels that are in a state, by name."""
+        state_id = self._state_ids.get(state)
+        if state_id is None:
+            return numpy.zeros(0, dtype=numpy.uint32)
+        with self._lock:
+            return numpy.flatnonzero(self._states == state_id) + self.first_channel
+
+    def get_transitions(self, since: Optional[float] = None) -> numpy.ndarray:
+        """Get the most recent transitions, oldest first.
+
+        Args:
+            since: Only return transitions received after this time (according to
+                ``time.monotonic()``).
+
+        Returns:
+            A numpy array of type `TRANSITION_DTYPE`. This holds at most ``history_size``
+            transitions.
+        """
+        with self._lock:
+            size = len(self._history)
+            count = self._history_count
+            if count <= size:
+                transitions = self._history[:count].copy()
+            else:
+                start = count % size
+                transitions = numpy.concatenate(
+                    (self._history[start:], self._history[:start])
+                )
+        if since is not None:
+            transitions = transitions[transitions["received"] > since]
+        return transitions
+
+    def _receive(self):
+        try:
+            for message in self._call:
+                self.update(message)
+        except grpc.RpcError as e:
+            with self._lock:
+                if not self._stopping:
+                    logger.warning("get_channel_states failed: %s", e.details())
+                    self._error = e
+        finally:
+            with self._lock:
+                self._updated.notify_all()
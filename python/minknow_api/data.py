@@ -6,24 +6,66 @@ The primary function this module provides is `get_signal` for getting live signa
 The ``get_signal_bytes`` RPC has been designed to be performant to use from Python, but this also
 makes it complex to use properly. `get_signal` provides an easy-to-use wrapper for the common case
 where you just want to obtain a fixed amount of data, to be processed after you have it all.
+
+If you want to process the data as it arrives (for example, because you want more data than will
+comfortably fit in memory), `iter_signal` provides the same data in fixed-size blocks. Alternatively,
+`capture_signal` writes the data straight to disk, where it can be read back with
+`open_signal_capture`.
+
+Calibrated (picoamp) data is twice the size of the raw ADC values it is calculated from. Passing
+``calibrate_on_client=True`` to `get_signal` or `iter_signal` fetches the raw values instead and
+calibrates them locally (see `calibrate_signal`), which halves the network traffic.
+
+Channel configuration changes can be converted into `ConfigTimeline` objects (see
+`SignalData.config_timelines`), which allow the configuration at any sample to be looked up, or
+signal to be masked by configuration, without scanning through the changes.
+
+If only summary statistics are needed (such as the mean, median and noise level of each channel),
+`get_signal_statistics` calculates them as the signal arrives, without keeping the signal itself.
 """
 
 import collections
+import concurrent.futures
+import json
+import logging
+import math
+import pathlib
+import threading
+import time
+import weakref
 
+import grpc
 import numpy
+from google.protobuf import json_format
 
-from ._support import ArgumentError
+from ._support import ArgumentError, raw_messages
 
 __all__ = [
+    "Calibration",
     "ChannelConfigChange",
     "ChannelSignalData",
+    "ConfigTimeline",
     "NumpyDTypes",
     "SignalData",
+    "SignalStatistics",
+    "SignalSummary",
     "api_types_to_numpy_types",
+    "cached_calibration",
+    "cached_numpy_types",
+    "calibrate_signal",
+    "capture_signal",
+    "clear_calibration_cache",
+    "clear_numpy_types_cache",
+    "get_calibration",
     "get_numpy_types",
     "get_signal",
+    "get_signal_statistics",
+    "iter_signal",
+    "open_signal_capture",
 ]
 
+logger = logging.getLogger(__name__)
+
 ChannelConfigChange = collections.namedtuple(
     "ChannelConfigChange", ["offset", "config"]
 )
@@ -36,27 +78,141 @@ Attributes:
         channel)
 """
 
-ChannelSignalData = collections.namedtuple(
-    "ChannelSignalData",
-    [
-        "name",
-        "signal",
-        "config_changes",
-    ],
-)
-ChannelSignalData.__doc__ = """\
-The per-channel data in SignalData.
 
-Attributes:
-    name (int): The channel this is the data for (channel numbers start at 1).
-    signal (numpy.ndarray): The signal data, as a 1-dimensional numpy array. If calibrated data was
-        requested, this will be floating-point data in picoamps. Otherwise, this will be integer
-        data (ADC values). Note that the exact type will depend on the sequencing device (and the
-        host machine in the case of MinIONs).
-    config_changes (list of ChannelConfigChange): If channel configuration changes were requested, a
-        list of those changes . This will contain at least one element, with offset 0, which is the configuration
-        that applies to the first sample returned.
-"""
+class ConfigTimeline(object):
+    """The channel configuration changes for a channel, indexed for lookup by sample.
+
+    Rather than a list of full configuration messages, this holds a sorted array of offsets and an
+    array of integer codes, which are indexes into a table of distinct configurations. The table
+    can be shared between channels (see `SignalData.config_timelines`), so that the same code means
+    the same configuration on every channel.
+
+    Attributes:
+        offsets (numpy.ndarray): The offset of each change into the signal array, in ascending
+            order.
+        codes (numpy.ndarray): The configuration each change switched to, as an index into
+            `configs`.
+        configs (list of minknow_api.device_pb2.ReturnedChannelConfiguration): The distinct
+            configurations.
+        length (int): The number of samples the timeline covers.
+    """
+
+    def __init__(self, offsets, codes, configs, length):
+        self.offsets = offsets
+        self.codes = codes
+        self.configs = configs
+        self.length = length
+
+    @classmethod
+    def from_changes(cls, config_changes, length, configs=None, config_codes=None):
+        """Build a timeline from a list of `ChannelConfigChange` objects.
+
+        Args:
+            config_changes (list of ChannelConfigChange): The changes, sorted by offset.
+            length (int): The number of samples the timeline covers.
+            configs (list, optional): A table of configurations to add to (and share).
+            config_codes (dict, optional): The index of each configuration in ``configs``, keyed by
+                its serialised form. Must be given if ``configs`` is.
+        """
+        if configs is None:
+            configs, config_codes = [], {}
+        codes = numpy.empty(len(config_changes), numpy.int32)
+        for i, change in enumerate(config_changes):
+            key = change.config.SerializeToString(deterministic=True)
+            code = config_codes.get(key)
+            if code is None:
+                code = config_codes[key] = len(configs)
+                configs.append(change.config)
+            codes[i] = code
+        offsets = numpy.fromiter(
+            (change.offset for change in config_changes),
+            numpy.int64,
+            count=len(config_changes),
+        )
+        return cls(offsets, codes, configs, length)
+
+    def config_at(self, offsets):
+        """Get the configuration that applied at some samples.
+
+        Args:
+            offsets (int or array-like): Offsets into the signal array.
+
+        Returns:
+            numpy.ndarray: The code of the configuration for each offset (see `configs`), or -1
+            for offsets before the first change.
+        """
+        index = numpy.searchsorted(self.offsets, offsets, side="right") - 1
+        if not len(self.codes):
+            return numpy.full(numpy.shape(index), -1, numpy.int32)
+        return numpy.where(index >= 0, self.codes[numpy.maximum(index, 0)], -1)
+
+    def segments(self):
+        """Get the ranges of samples each configuration applied to.
+
+        Changes that are immediately replaced by another change at the same offset are left out.
+
+        Returns:
+            tuple: The ``starts``, ``ends`` and ``codes`` of the segments, as numpy arrays.
+        """
+        starts = numpy.minimum(self.offsets, self.length)
+        ends = numpy.append(starts[1:], self.length)
+        keep = ends > starts
+        return starts[keep], ends[keep], self.codes[keep]
+
+    def mask(self, predicate):
+        """Find the samples with a configuration that matches a condition.
+
+        ``predicate`` is only called once for each distinct configuration, so this is cheap even
+        for long timelines.
+
+        Args:
+            predicate (callable): Called with a ``ReturnedChannelConfiguration``, returning True
+                if it should be included (eg: ``lambda config: config.well == 1``).
+
+        Returns:
+            numpy.ndarray: A boolean array with one element for each sample.
+        """
+        matches = numpy.fromiter(
+            (bool(predicate(config)) for config in self.configs),
+            bool,
+            count=len(self.configs),
+        )
+        mask = numpy.zeros(self.length, bool)
+        starts, ends, codes = self.segments()
+        if len(starts):
+            mask[starts[0] :] = numpy.repeat(matches[codes], ends - starts)
+        return mask
+
+
+class ChannelSignalData(
+    collections.namedtuple(
+        "ChannelSignalData",
+        [
+            "name",
+            "signal",
+            "config_changes",
+        ],
+    )
+):
+    """The per-channel data in SignalData.
+
+    Attributes:
+        name (int): The channel this is the data for (channel numbers start at 1).
+        signal (numpy.ndarray): The signal data, as a 1-dimensional numpy array. If calibrated data
+            was requested, this will be floating-point data in picoamps. Otherwise, this will be
+            integer data (ADC values). Note that the exact type will depend on the sequencing
+            device (and the host machine in the case of MinIONs).
+        config_changes (list of ChannelConfigChange): If channel configuration changes were
+            requested, a list of those changes . This will contain at least one element, with
+            offset 0, which is the configuration that applies to the first sample returned.
+    """
+
+    __slots__ = ()
+
+    def config_timeline(self):
+        """The configuration changes as a `ConfigTimeline` covering the signal."""
+        return ConfigTimeline.from_changes(self.config_changes, len(self.signal))
+
 
 NumpyDTypes = collections.namedtuple(
     "NumpyDTypes",
@@ -69,7 +225,7 @@ NumpyDTypes = collections.namedtuple(
 NumpyDTypes.__doc__ = """\
 The types of data returned by the data.get_signal_bytes() RPC, as numpy dtypes.
 
-See api_types_to_numpy_types() and get_numpy_types().
+See api_types_to_numpy_types(), get_numpy_types() and cached_numpy_types().
 
 Note that there are no guarantees about the endianness of these data types.
 
@@ -82,24 +238,66 @@ Attributes:
         integer type.
 """
 
-SignalData = collections.namedtuple(
-    "SignalData",
-    ["samples_since_start", "seconds_since_start", "channels", "bias_voltages"],
+
+class SignalData(
+    collections.namedtuple(
+        "SignalData",
+        ["samples_since_start", "seconds_since_start", "channels", "bias_voltages"],
+    )
+):
+    """The results of get_signal().
+
+    Attributes:
+        samples_since_start (int): The number of samples collected before the first returned
+            sample.
+        seconds_since_start (int): As samples_since_start, but expressed in seconds.
+        channels (list of ChannelSignalData): The per-channel data (signal and configuration
+            changes).
+        bias_voltages (numpy.ndarray): A numpy array of bias voltages in millivolts. This will
+            be the same length as the ``signal`` array on each channel. Note that there should be
+            no need to apply any further corrections to the value (eg: the 5x amplifier on a
+            MinION is already accounted for). Be aware that the types stored in this array will be
+            different for MinION-like devices (integers) and PromethION-like devices
+            (floating-point).
+
+            May be empty if no bias voltages were requested.
+    """
+
+    __slots__ = ()
+
+    def config_timelines(self):
+        """The configuration changes of every channel, as `ConfigTimeline` objects.
+
+        The timelines share a single table of configurations, so their codes can be compared
+        across channels.
+
+        Returns:
+            list of ConfigTimeline: A timeline for each element of `channels`.
+        """
+        configs, config_codes = [], {}
+        return [
+            ConfigTimeline.from_changes(
+                ch.config_changes, len(ch.signal), configs, config_codes
+            )
+            for ch in self.channels
+        ]
+
+
+Calibration = collections.namedtuple(
+    "Calibration", ["first_channel", "offsets", "scales"]
 )
-SignalData.__doc__ = """\
-The results of get_signal().
+Calibration.__doc__ = """\
+The calibration for a range of channels, as returned by get_calibration().
+
+The calibrated value of an ADC sample on channel ``first_channel + i`` is
+``(adc + offsets[i]) * scales[i]`` picoamps. See calibrate_signal().
 
 Attributes:
-    samples_since_start (int): The number of samples collected before the first returned sample.
-    seconds_since_start (int): As samples_since_start, but expressed in seconds.
-    channels (list of ChannelSignalData): The per-channel data (signal and configuration changes).
-    bias_voltages (numpy.ndarray): A numpy array of bias voltages in millivolts. This will
-        be the same length as the ``signal`` array on each channel. Note that there should be no
-        need to apply any further corrections to the value (eg: the 5x amplifier on a MinION is
-        already accounted for). Be aware that the types stored in this array will be different for
-        MinION-like devices (integers) and PromethION-like devices (floating-point).
-
-        May be empty if no bias voltages were requested.
+    first_channel (int): The channel the first element of each array is for.
+    offsets (numpy.ndarray): The ADC value adjustment to reach 0pA on each channel, as float32
+        values.
+    scales (numpy.ndarray): The change in picoamps represented by a change of 1 ADC on each
+        channel (the channel's pA range divided by the device's digitisation), as float32 values.
 """
 
 
@@ -149,7 +347,692 @@ def get_numpy_types(connection):
     return api_types_to_numpy_types(data_types)
 
 
-def get_signal(connection, on_started=None, numpy_dtypes=None, **kwargs):
+class _AcquisitionCache(object):
+    """Values fetched over a connection, remembered until a new acquisition starts.
+
+    New acquisitions are spotted by watching ``acquisition.watch_current_acquisition_run`` from a
+    background thread, which is stopped when the connection is closed (see `stop`). If that stream
+    fails, nothing is cached (so every lookup makes its RPC) until it can be restarted, and
+    restarting it is backed off so that a connection that cannot watch acquisitions does not start
+    a new stream for every lookup.
+    """
+
+    #: The longest wait (in seconds) before trying to watch acquisitions again.
+    MAX_BACKOFF = 60.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._watching = False
+        self._call = None
+        self._stopped = False
+        # when the watch may next be started (according to time.monotonic()), after a failure
+        self._retry_at = 0.0
+        self._backoff = 0.0
+        # incremented whenever the cached values become invalid
+        self._generation = 0
+        self._watch_ready = False
+
+    def get(self, connection, key, fetch):
+        """Get the value for ``key``, calling ``fetch(connection)`` if it is not cached."""
+        with self._lock:
+            value = self._values.get(key)
+            if value is not None:
+                return value
+            if not self._watching and not self._stopped:
+                self._start_watching(connection)
+            generation = self._generation
+
+        value = fetch(connection)
+
+        with self._lock:
+            if self._watch_ready and self._generation == generation:
+                self._values[key] = value
+        return value
+
+    def clear(self, predicate=None):
+        """Forget the values whose keys match ``predicate``, or all of them if it is None."""
+        with self._lock:
+            if predicate is None:
+                self._values.clear()
+            else:
+                for key in [key for key in self._values if predicate(key)]:
+                    del self._values[key]
+            self._generation += 1
+
+    def stop(self):
+        """Stop watching acquisitions, and stop caching values."""
+        with self._lock:
+            self._stopped = True
+            call = self._call
+        if call is not None:
+            call.cancel()
+
+    def _failed_locked(self):
+        self._backoff = min(max(2 * self._backoff, 1.0), self.MAX_BACKOFF)
+        self._retry_at = time.monotonic() + self._backoff
+
+    def _start_watching(self, connection):
+        # must be called with the lock held
+        if time.monotonic() < self._retry_at:
+            return
+        try:
+            call = connection.acquisition.watch_current_acquisition_run()
+        except grpc.RpcError:
+            self._failed_locked()
+            return
+        self._watching = True
+        self._watch_ready = False
+        self._call = call
+        thread = threading.Thread(
+            target=self._watch,
+            args=(call,),
+            name="minknow_api.data acquisition watcher",
+            daemon=True,
+        )
+        thread.start()
+
+    def _watch(self, call):
+        run_id = None
+        try:
+            for info in call:
+                if run_id is not None and info.run_id != run_id:
+                    self.clear()
+                else:
+                    with self._lock:
+                        self._watch_ready = True
+                        self._backoff = 0.0
+                run_id = info.run_id
+        except grpc.RpcError:
+            pass
+        finally:
+            with self._lock:
+                self._watching = False
+                self._watch_ready = False
+                self._call = None
+                self._values.clear()
+                self._generation += 1
+                self._failed_locked()
+
+
+_acquisition_caches = weakref.WeakKeyDictionary()
+_acquisition_caches_lock = threading.Lock()
+
+
+def _acquisition_cache(connection, create=True):
+    with _acquisition_caches_lock:
+        cache = _acquisition_caches.get(connection)
+        if cache is None and create:
+            cache = _AcquisitionCache()
+            _acquisition_caches[connection] = cache
+            # stop the watcher when the connection is closed, or if it is never closed, when it is
+            # garbage-collected (the finalizer must not refer to the connection)
+            stop = weakref.finalize(connection, cache.stop)
+            on_close = getattr(connection, "_on_close", None)
+            if on_close is not None:
+                on_close(stop)
+    return cache
+
+
+def cached_numpy_types(connection):
+    """The data types provided by the data RPC service, in numpy format, cached per connection.
+
+    This is the same as `get_numpy_types`, but the result is remembered until a new acquisition
+    is started on the flow cell position, so repeated calls don't need an RPC each time. The other
+    helpers in this module use this when they are not given the types explicitly.
+
+    Args:
+        connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
+
+    Result:
+        NumpyDTypes: The numpy dtypes that will be returned over `connection`.
+    """
+    return _acquisition_cache(connection).get(
+        connection, "numpy_types", get_numpy_types
+    )
+
+
+def clear_numpy_types_cache(connection):
+    """Forget the types remembered by `cached_numpy_types` for a connection.
+
+    Args:
+        connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
+    """
+    cache = _acquisition_cache(connection, create=False)
+    if cache is not None:
+        cache.clear(lambda key: key == "numpy_types")
+
+
+def get_calibration(connection, first_channel, last_channel):
+    """The calibration used to convert ADC values into picoamps, in numpy format.
+
+    Args:
+        connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
+        first_channel (int): The first channel to get the calibration for. Channels start at 1.
+        last_channel (int): The last channel to get the calibration for.
+
+    Result:
+        Calibration: The calibration for the channels.
+
+    Raises:
+        RuntimeError: If no calibration has been set.
+    """
+    response = connection.device.get_calibration(
+        first_channel=first_channel, last_channel=last_channel
+    )
+    if not response.has_calibration:
+        raise RuntimeError("No calibration has been set for this flow cell position")
+    return Calibration(
+        first_channel,
+        numpy.array(response.offsets, dtype=numpy.float32),
+        numpy.array(response.pa_ranges, dtype=numpy.float32)
+        / numpy.float32(response.digitisation),
+    )
+
+
+def cached_calibration(connection, first_channel, last_channel):
+    """The calibration for a range of channels, cached per connection.
+
+    This is the same as `get_calibration`, but the result is remembered until a new acquisition
+    is started on the flow cell position (in the same way as `cached_numpy_types`).
+
+    Args:
+        connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
+        first_channel (int): The first channel to get the calibration for. Channels start at 1.
+        last_channel (int): The last channel to get the calibration for.
+
+    Result:
+        Calibration: The calibration for the channels.
+    """
+    return _acquisition_cache(connection).get(
+        connection,
+        ("calibration", first_channel, last_channel),
+        lambda conn: get_calibration(conn, first_channel, last_channel),
+    )
+
+
+def clear_calibration_cache(connection):
+    """Forget the calibrations remembered by `cached_calibration` for a connection.
+
+    This should be called if the calibration is changed with ``device.set_calibration`` without
+    starting a new acquisition.
+
+    Args:
+        connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
+    """
+    cache = _acquisition_cache(connection, create=False)
+    if cache is not None:
+        cache.clear(lambda key: key[0] == "calibration")
+
+
+def calibrate_signal(signal, calibration, dtype=numpy.float32, out=None):
+    """Convert ADC values into picoamps.
+
+    This applies the same conversion MinKNOW does for ``calibrated_data``:
+    ``(adc + offset) * pa_range / digitisation``, calculated in single precision.
+
+    Args:
+        signal (numpy.ndarray): The uncalibrated signal, as a ``(channels, samples)`` array, where
+            row ``i`` is for channel ``calibration.first_channel + i``. A 1-dimensional array is
+            treated as the signal for ``calibration.first_channel``.
+        calibration (Calibration): The calibration to apply (see `cached_calibration`).
+        dtype (numpy.dtype, optional): The floating-point type to return. Types smaller than
+            ``float32`` (such as ``float16``) save memory, but the values are still calculated in
+            single precision first.
+        out (numpy.ndarray, optional): An array of the same shape as ``signal`` to write the
+            result into, instead of allocating a new one.
+
+    Returns:
+        numpy.ndarray: The calibrated signal (``out``, if it was given).
+    """
+    rows = 1 if signal.ndim == 1 else signal.shape[0]
+    if rows > len(calibration.offsets):
+        raise ArgumentError(
+            "Calibration has {} channels, but signal has {}".format(
+                len(calibration.offsets), rows
+            )
+        )
+    if out is None:
+        out = numpy.empty(signal.shape, dtype)
+    offsets = calibration.offsets[:rows]
+    scales = calibration.scales[:rows]
+    if signal.ndim == 2:
+        offsets = offsets[:, numpy.newaxis]
+        scales = scales[:, numpy.newaxis]
+
+    if out.dtype.itemsize >= 4:
+        # two passes over the output, with no temporaries
+        numpy.add(signal, offsets, out=out, dtype=numpy.float32)
+        numpy.multiply(out, scales, out=out, dtype=numpy.float32)
+    else:
+        # rounding to the smaller type between the steps would lose precision, so go through a
+        # single-precision row at a time
+        out_rows = out.reshape((rows, -1))
+        signal_rows = signal.reshape((rows, -1))
+        scratch = numpy.empty(out_rows.shape[1], numpy.float32)
+        for i in range(rows):
+            numpy.add(signal_rows[i], calibration.offsets[i], out=scratch)
+            numpy.multiply(scratch, calibration.scales[i], out=scratch)
+            out_rows[i] = scratch
+    return out
+
+
+class _SignalBuffer(object):
+    """Fixed-capacity storage for streamed signal, with one row per channel.
+
+    Incoming chunks are copied straight into a single preallocated ``(rows, capacity)`` array,
+    rather than being collected and joined at the end. If more data arrives than was expected,
+    the array is grown (this should not normally happen).
+
+    An existing array (such as a slice of a larger array, or a memory-mapped file) can be passed
+    as ``data`` to write into that instead. If ``growable`` is False, any data that does not fit
+    is discarded instead of growing the array, and counted in ``dropped``.
+    """
+
+    def __init__(self, rows, capacity, dtype, data=None, growable=True):
+        self.dtype = numpy.dtype(dtype)
+        if data is None:
+            data = numpy.empty((max(rows, 0), max(capacity, 0)), self.dtype)
+        self.data = data
+        self.lengths = numpy.zeros(self.data.shape[0], dtype=numpy.int64)
+        self.growable = growable
+        self.dropped = 0
+
+    def append(self, row, chunk):
+        """Copy a chunk of bytes onto the end of a row."""
+        values = numpy.frombuffer(chunk, self.dtype)
+        start = self.lengths[row]
+        end = start + len(values)
+        if end > self.data.shape[1]:
+            if self.growable:
+                self._grow(end)
+            else:
+                end = self.data.shape[1]
+                self.dropped += len(values) - (end - start)
+                values = values[: end - start]
+        self.data[row, start:end] = values
+        self.lengths[row] = end
+
+    def _grow(self, min_capacity):
+        capacity = max(min_capacity, 2 * self.data.shape[1])
+        data = numpy.empty((self.data.shape[0], capacity), self.dtype)
+        data[:, : self.data.shape[1]] = self.data
+        self.data = data
+
+    def row(self, row):
+        """The data received for a row, as a view into the underlying array."""
+        return self.data[row, : self.lengths[row]]
+
+    def rows(self):
+        """The data received for each row, as views into the underlying array."""
+        return [self.row(i) for i in range(self.data.shape[0])]
+
+    def available(self):
+        """The number of samples that have been received for every row."""
+        if len(self.lengths) == 0:
+            return 0
+        return int(self.lengths.min())
+
+    def split(self, count):
+        """Remove the first ``count`` samples from every row.
+
+        Any data after those samples is moved into fresh storage, so the returned array is not
+        modified by later calls to `append`.
+
+        Returns:
+            numpy.ndarray: A ``(rows, count)`` array with the removed samples.
+        """
+        head = self.data[:, :count]
+        self.lengths = numpy.maximum(self.lengths - count, 0)
+        remaining = int(self.lengths.max()) if len(self.lengths) else 0
+        data = numpy.empty(
+            (self.data.shape[0], max(self.data.shape[1], remaining)), self.dtype
+        )
+        data[:, :remaining] = self.data[:, count : count + remaining]
+        self.data = data
+        return head
+
+
+def _config_changes(channel_data, offset):
+    """The configuration changes in a GetSignalBytesResponse.ChannelData message, with ``offset``
+    added to each of their offsets."""
+    return [
+        ChannelConfigChange(change.offset + offset, change.config)
+        for change in channel_data.config_changes
+    ]
+
+
+def _signal_dtype(numpy_dtypes, kwargs):
+    """The dtype of the signal that a ``get_signal_bytes`` call with ``kwargs`` will return."""
+    if kwargs.get("calibrated_data", False):
+        return numpy_dtypes.calibrated_signal
+    return numpy_dtypes.uncalibrated_signal
+
+
+def _cached_sample_rate(connection):
+    """The sample rate of the device, remembered until a new acquisition is started."""
+    return _acquisition_cache(connection).get(
+        connection,
+        "sample_rate",
+        lambda conn: conn.device.get_sample_rate().sample_rate,
+    )
+
+
+def _expected_samples(connection, sample_rate, kwargs):
+    """The number of samples that a ``get_signal_bytes`` call with ``kwargs`` will return."""
+    if "samples" in kwargs:
+        return kwargs["samples"]
+    if "seconds" in kwargs:
+        if sample_rate is None:
+            sample_rate = _cached_sample_rate(connection)
+        # MinKNOW returns just enough samples to cover the requested time
+        return int(math.ceil(kwargs["seconds"] * sample_rate))
+    raise ArgumentError("Expected 'samples' or 'seconds' argument")
+
+
+def _client_calibration(connection, calibrate_on_client, kwargs):
+    """If calibrated data should be calibrated on the client, change ``kwargs`` to request
+    uncalibrated data instead, and return the calibration to apply. Otherwise, return None.
+    """
+    if not calibrate_on_client or not kwargs.get("calibrated_data", False):
+        return None
+    if "first_channel" not in kwargs or "last_channel" not in kwargs:
+        raise ArgumentError(
+            "calibrate_on_client requires 'first_channel' and 'last_channel' arguments"
+        )
+    calibration = cached_calibration(
+        connection, kwargs["first_channel"], kwargs["last_channel"]
+    )
+    kwargs["calibrated_data"] = False
+    return calibration
+
+
+def _calibrated_rows(signal, calibration, dtype, out=None):
+    """Calibrate the data in a `_SignalBuffer`.
+
+    Returns:
+        list of numpy.ndarray: The calibrated data for each row, as views into ``out`` (or a new
+        array, if ``out`` is not given).
+    """
+    length = int(signal.lengths.max()) if len(signal.lengths) else 0
+    if out is None:
+        out = numpy.empty((signal.data.shape[0], length), dtype)
+    else:
+        out = out[:, :length]
+    calibrate_signal(signal.data[:, :length], calibration, out=out)
+    return [out[i, :n] for i, n in enumerate(signal.lengths)]
+
+
+def _receive_signal(call, signal, bias_voltages, channel_configs, on_started):
+    """Copy the data from a ``get_signal_bytes`` call into buffers.
+
+    Configuration changes are added to ``channel_configs``, with offsets relative to the first
+    message.
+
+    Returns:
+        tuple: The ``samples_since_start`` and ``seconds_since_start`` of the first message (or
+        None for both if there were no messages).
+    """
+    start_samples = None
+    start_seconds = None
+
+    for msg in call:
+
+        if on_started:
+            on_started()
+            on_started = None
+
+        if start_samples is None:
+            offset = 0
+            start_samples = msg.samples_since_start
+            start_seconds = msg.seconds_since_start
+        else:
+            offset = msg.samples_since_start - start_samples
+        for i, c in enumerate(msg.channels, start=msg.skipped_channels):
+            signal.append(i, c.data)
+            if len(c.config_changes):
+                channel_configs[i].extend(_config_changes(c, offset))
+        if len(msg.bias_voltages):
+            bias_voltages.append(0, msg.bias_voltages)
+
+    return start_samples, start_seconds
+
+
+def _window_config_changes(changes, start, end):
+    """Select the configuration changes that apply to the samples in ``[start, end)``.
+
+    ``changes`` must be sorted by offset. The offsets of the returned changes are relative to
+    ``start``, and the change that was in effect at ``start`` (if any) is included with an offset
+    of 0.
+    """
+    window = []
+    for change in changes:
+        if change.offset >= end:
+            break
+        offset = max(change.offset - start, 0)
+        if window and window[-1].offset == offset:
+            window[-1] = ChannelConfigChange(offset, change.config)
+        else:
+            window.append(ChannelConfigChange(offset, change.config))
+    return window
+
+
+class _ShardAlignment(object):
+    """Lets the shards of a sharded `get_signal` call agree on a common window of samples.
+
+    Each shard's stream will start at a slightly different point, so every shard keeps streaming
+    until it has covered ``samples`` samples from the latest start of any shard.
+    """
+
+    def __init__(self, shards, samples, on_started=None):
+        self.samples = samples
+        self.start = None
+        self.stopped = False
+        self._on_started = on_started
+        self._starts = [None] * shards
+        self._calls = []
+        self._lock = threading.Lock()
+
+    def add_call(self, call):
+        with self._lock:
+            self._calls.append(call)
+            stopped = self.stopped
+        if stopped:
+            call.cancel()
+
+    def stop(self):
+        """Make all the shards give up."""
+        with self._lock:
+            self.stopped = True
+            calls = list(self._calls)
+        for call in calls:
+            call.cancel()
+
+    def shard_started(self, shard, samples_since_start):
+        with self._lock:
+            on_started, self._on_started = self._on_started, None
+            self._starts[shard] = samples_since_start
+            if None not in self._starts:
+                self.start = max(self._starts)
+        if on_started:
+            on_started()
+
+    def shard_done(self, start_samples, available):
+        """Whether a shard that started at ``start_samples`` and has ``available`` samples for
+        every channel has all the data it needs."""
+        if self.start is None:
+            return False
+        return start_samples + available >= self.start + self.samples
+
+
+def _fetch_signal_shard(connection, shard, alignment, signal, bias_voltages, kwargs):
+    """Stream one shard of a sharded `get_signal` call into its buffers.
+
+    Returns:
+        tuple: The ``samples_since_start`` and ``seconds_since_start`` of the first message, and
+        the configuration changes for each channel (with offsets relative to the first message).
+        None is returned if the shard was stopped because another shard failed.
+    """
+    channel_configs = [[] for i in range(signal.data.shape[0])]
+    start_samples = None
+    start_seconds = None
+
+    try:
+        call = raw_messages(connection.data.get_signal_bytes(**kwargs))
+        alignment.add_call(call)
+        try:
+            for msg in call:
+                if start_samples is None:
+                    start_samples = msg.samples_since_start
+                    start_seconds = msg.seconds_since_start
+                    alignment.shard_started(shard, start_samples)
+                offset = msg.samples_since_start - start_samples
+                for i, c in enumerate(msg.channels, start=msg.skipped_channels):
+                    signal.append(i, c.data)
+                    if len(c.config_changes):
+                        channel_configs[i].extend(_config_changes(c, offset))
+                if bias_voltages is not None and len(msg.bias_voltages):
+                    bias_voltages.append(0, msg.bias_voltages)
+
+                if alignment.shard_done(start_samples, signal.available()):
+                    break
+        finally:
+            call.cancel()
+    except grpc.RpcError as e:
+        if alignment.stopped and e.code() == grpc.StatusCode.CANCELLED:
+            return None
+        alignment.stop()
+        raise
+    except BaseException:
+        alignment.stop()
+        raise
+
+    if alignment.stopped:
+        return None
+    if start_samples is None:
+        alignment.stop()
+        raise RuntimeError(
+            "Signal stream for channels {}-{} ended without returning any data".format(
+                kwargs["first_channel"], kwargs["last_channel"]
+            )
+        )
+    return start_samples, start_seconds, channel_configs
+
+
+def _get_signal_sharded(
+    connection,
+    shards,
+    signal_dtype,
+    bias_voltages_dtype,
+    expected_samples,
+    on_started,
+    calibration,
+    calibrated_dtype,
+    kwargs,
+):
+    """Implementation of `get_signal` for ``shards > 1``."""
+    first_channel = kwargs["first_channel"]
+    channel_count = kwargs["last_channel"] + 1 - first_channel
+    shards = max(1, min(shards, channel_count))
+    include_bias_voltages = kwargs.get("include_bias_voltages", False)
+
+    # each shard streams until the shards agree on a common window, so ask for open-ended streams
+    shard_kwargs = dict(kwargs)
+    shard_kwargs.pop("samples", None)
+    shard_kwargs.pop("seconds", None)
+
+    # leave a little room for the difference in start times between shards
+    capacity = expected_samples + max(expected_samples // 16, 1)
+    signal_data = numpy.empty((channel_count, capacity), signal_dtype)
+    shard_bounds = [channel_count * i // shards for i in range(shards + 1)]
+
+    alignment = _ShardAlignment(shards, expected_samples, on_started)
+    buffers = []
+    for shard in range(shards):
+        lo, hi = shard_bounds[shard], shard_bounds[shard + 1]
+        signal = _SignalBuffer(hi - lo, capacity, signal_dtype, signal_data[lo:hi])
+        bias_voltages = None
+        if shard == 0 and include_bias_voltages:
+            bias_voltages = _SignalBuffer(1, capacity, bias_voltages_dtype)
+        buffers.append((signal, bias_voltages))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=shards) as executor:
+        futures = []
+        for shard, (signal, bias_voltages) in enumerate(buffers):
+            lo, hi = shard_bounds[shard], shard_bounds[shard + 1]
+            shard_request = dict(
+                shard_kwargs,
+                first_channel=first_channel + lo,
+                last_channel=first_channel + hi - 1,
+                include_bias_voltages=bias_voltages is not None,
+            )
+            futures.append(
+                executor.submit(
+                    _fetch_signal_shard,
+                    connection,
+                    shard,
+                    alignment,
+                    signal,
+                    bias_voltages,
+                    shard_request,
+                )
+            )
+        # a shard that was stopped because of another shard's failure returns None; the shard
+        # that failed will raise here
+        results = [f.result() for f in futures]
+
+    if calibration is not None:
+        length = max(int(signal.lengths.max()) for signal, _ in buffers)
+        calibrated = numpy.empty((channel_count, length), calibrated_dtype)
+
+    start_samples = alignment.start
+    start_seconds = None
+    channels = []
+    bias_voltages = numpy.empty(0, bias_voltages_dtype)
+    for shard, (shard_start, shard_seconds, channel_configs) in enumerate(results):
+        lead = start_samples - shard_start
+        end = lead + expected_samples
+        if lead == 0:
+            start_seconds = shard_seconds
+        signal, shard_bias_voltages = buffers[shard]
+        lo, hi = shard_bounds[shard], shard_bounds[shard + 1]
+        if calibration is None:
+            rows = signal.rows()
+        else:
+            rows = _calibrated_rows(
+                signal,
+                Calibration(
+                    first_channel + lo,
+                    calibration.offsets[lo:hi],
+                    calibration.scales[lo:hi],
+                ),
+                calibrated_dtype,
+                calibrated[lo:hi],
+            )
+        for i, (ch_signal, configs) in enumerate(zip(rows, channel_configs)):
+            channels.append(
+                ChannelSignalData(
+                    first_channel + shard_bounds[shard] + i,
+                    ch_signal[lead:end],
+                    _window_config_changes(configs, lead, end),
+                )
+            )
+        if shard_bias_voltages is not None:
+            bias_voltages = shard_bias_voltages.row(0)[lead:end]
+
+    return SignalData(start_samples, start_seconds, channels, bias_voltages)
+
+
+def get_signal(
+    connection,
+    on_started=None,
+    numpy_dtypes=None,
+    sample_rate=None,
+    shards=1,
+    calibrate_on_client=False,
+    calibrated_dtype=None,
+    **kwargs
+):
     """Get signal data from the flow cell.
 
     This can be used to sample the signal being produced by the flow cell. The signal can be
@@ -170,8 +1053,22 @@ def get_signal(connection, on_started=None, numpy_dtypes=None, **kwargs):
         connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
         on_started (callable, optional): Called as soon as the first message is received.
         numpy_dtypes (NumpyDTypes, optional): The result of ``get_numpy_types(connection)``.
-            Providing this avoids an extra RPC to determine this information - if making frequent
-            calls to `get_signal`, it may be worth caching this information.
+            If this is not provided, `cached_numpy_types` will be used.
+        sample_rate (int, optional): The sample rate of the device. This is only used when
+            ``seconds`` is provided, to preallocate storage for the returned signal. If it is not
+            provided, it will be obtained with an extra RPC (which is cached until a new
+            acquisition is started).
+        shards (int, optional): Split the requested channels into this many groups, and fetch
+            each group with its own concurrent ``get_signal_bytes`` call (on the same connection).
+            This can increase throughput when requesting data from a large number of channels.
+            The streams are aligned so that the returned data for every channel covers the same
+            samples. Note that ``on_started`` will be called from a worker thread in this case.
+            Defaults to 1 (a single call).
+        calibrate_on_client (bool, optional): If ``calibrated_data`` is set, request uncalibrated
+            data and calibrate it locally with `calibrate_signal` and `cached_calibration`. The
+            uncalibrated data is half the size, so this reduces the network bandwidth needed.
+        calibrated_dtype (numpy.dtype, optional): The type of locally-calibrated data (eg:
+            ``numpy.float16`` to save memory). Defaults to the type MinKNOW would have returned.
         seconds (float): Amount of data to collect in seconds.
         samples (int): Amount of data to collect in samples.
         first_channel (int): The first channel to collect data from. Channels start at 1.
@@ -185,62 +1082,672 @@ def get_signal(connection, on_started=None, numpy_dtypes=None, **kwargs):
             `on_started`.
 
     Returns:
-        SignalData: The returned data.
+        SignalData: The returned data. The signal for all the channels is stored in a single
+        two-dimensional numpy array, and the ``signal`` array on each channel is a view into it.
     """
     if numpy_dtypes is None:
-        numpy_dtypes = get_numpy_types(connection)
-
-    if "samples" not in kwargs and "seconds" not in kwargs:
-        raise ArgumentError("Expected 'samples' or 'seconds' argument")
+        numpy_dtypes = cached_numpy_types(connection)
+    if calibrated_dtype is None:
+        calibrated_dtype = numpy_dtypes.calibrated_signal
 
-    if kwargs.get("calibrated_data", False):
-        signal_dtype = numpy_dtypes.calibrated_signal
-    else:
-        signal_dtype = numpy_dtypes.uncalibrated_signal
+    expected_samples = _expected_samples(connection, sample_rate, kwargs)
+    calibration = _client_calibration(connection, calibrate_on_client, kwargs)
+    signal_dtype = _signal_dtype(numpy_dtypes, kwargs)
 
     # don't raise here when these keys are missing - let the RPC call raise the correct error
     # instead
     first_channel = kwargs.get("first_channel", 0)
     channel_count = kwargs.get("last_channel", 0) + 1 - first_channel
 
-    bias_voltages = []
-    channel_configs = [[] for i in range(channel_count)]
-    signal = [[] for i in range(channel_count)]
+    if shards < 1:
+        raise ArgumentError("'shards' must be at least 1")
+    if shards > 1:
+        if "first_channel" not in kwargs or "last_channel" not in kwargs:
+            raise ArgumentError(
+                "get_signal requires 'first_channel' and 'last_channel' arguments"
+            )
+        return _get_signal_sharded(
+            connection,
+            shards,
+            signal_dtype,
+            numpy_dtypes.bias_voltages,
+            expected_samples,
+            on_started,
+            calibration,
+            calibrated_dtype,
+            kwargs,
+        )
 
-    start_samples = None
+    call = raw_messages(connection.data.get_signal_bytes(**kwargs))
 
-    for msg in connection.data.get_signal_bytes(**kwargs):
+    signal = _SignalBuffer(channel_count, expected_samples, signal_dtype)
+    if kwargs.get("include_bias_voltages", False):
+        bias_voltages = _SignalBuffer(1, expected_samples, numpy_dtypes.bias_voltages)
+    else:
+        bias_voltages = _SignalBuffer(1, 0, numpy_dtypes.bias_voltages)
+    channel_configs = [[] for i in range(channel_count)]
 
-        if on_started:
-            on_started()
-            on_started = None
+    start_samples, start_seconds = _receive_signal(
+        call, signal, bias_voltages, channel_configs, on_started
+    )
 
-        if start_samples is None:
-            offset = 0
-            start_samples = msg.samples_since_start
-            start_seconds = msg.seconds_since_start
-        else:
-            offset = msg.samples_since_start - start_samples
-        for i, c in enumerate(msg.channels, start=msg.skipped_channels):
-            signal[i].append(c.data)
-            if len(c.config_changes):
-                for change in c.config_changes:
-                    channel_configs[i].append(
-                        ChannelConfigChange(change.offset + offset, change.config)
-                    )
-        if len(msg.bias_voltages):
-            bias_voltages.append(msg.bias_voltages)
+    if calibration is None:
+        rows = signal.rows()
+    else:
+        rows = _calibrated_rows(signal, calibration, calibrated_dtype)
 
     return SignalData(
         start_samples,
         start_seconds,
         [
-            ChannelSignalData(
-                channel, numpy.frombuffer(b"".join(ch_signal), signal_dtype), configs
-            )
+            ChannelSignalData(channel, ch_signal, configs)
             for channel, (ch_signal, configs) in enumerate(
-                zip(signal, channel_configs), start=first_channel
+                zip(rows, channel_configs), start=first_channel
             )
         ],
-        numpy.frombuffer(b"".join(bias_voltages), numpy_dtypes.bias_voltages),
+        bias_voltages.row(0),
+    )
+
+
+def iter_signal(
+    connection,
+    block_size,
+    on_started=None,
+    numpy_dtypes=None,
+    sample_rate=None,
+    calibrate_on_client=False,
+    calibrated_dtype=None,
+    **kwargs
+):
+    """Get signal data from the flow cell in fixed-size blocks, as it arrives.
+
+    This is like `get_signal`, but rather than returning all the data once it has been received,
+    it yields the data in blocks of ``block_size`` samples as soon as each block is complete. Only
+    one block is held in memory at a time (in addition to the ones the caller keeps hold of), so
+    this can be used to process signal over long periods of time.
+
+    If neither ``seconds`` nor ``samples`` is provided, data will be streamed until the generator
+    is closed (or garbage-collected), at which point the underlying RPC will be cancelled.
+
+    Args:
+        connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
+        block_size (int): The number of samples in each yielded block. Note that the final block
+            may be shorter than this if ``seconds`` or ``samples`` was given.
+        on_started (callable, optional): Called as soon as the first message is received.
+        numpy_dtypes (NumpyDTypes, optional): The result of ``get_numpy_types(connection)``.
+            If this is not provided, `cached_numpy_types` will be used.
+        sample_rate (int, optional): The sample rate of the device. This is used to calculate
+            ``seconds_since_start`` for each block. If it is not provided, it will be obtained
+            with an extra RPC (which is cached until a new acquisition is started).
+        calibrate_on_client (bool, optional): As for `get_signal`.
+        calibrated_dtype (numpy.dtype, optional): As for `get_signal`.
+        seconds (float, optional): Amount of data to collect in seconds.
+        samples (int, optional): Amount of data to collect in samples.
+        first_channel (int): The first channel to collect data from. Channels start at 1.
+        last_channel (int): The last channel to collect data from.
+        include_channel_configs (bool): Whether to return changes in channel configurations.
+        include_bias_voltages (bool): Whether to return bias voltage information.
+        calibrated_data (bool): Return the data in picoamps rather than raw ADC values. Requires
+            that a calibration has been set.
+
+    Yields:
+        SignalData: The data for each block. ``samples_since_start`` and ``seconds_since_start``
+        refer to the first sample of the block. Configuration change offsets are relative to the
+        start of the block and, if channel configurations were requested, each channel's changes
+        will start with the configuration that applied to the first sample of the block.
+    """
+    if block_size <= 0:
+        raise ArgumentError("'block_size' must be positive")
+
+    if numpy_dtypes is None:
+        numpy_dtypes = cached_numpy_types(connection)
+    if sample_rate is None:
+        sample_rate = _cached_sample_rate(connection)
+    if calibrated_dtype is None:
+        calibrated_dtype = numpy_dtypes.calibrated_signal
+
+    calibration = _client_calibration(connection, calibrate_on_client, kwargs)
+    signal_dtype = _signal_dtype(numpy_dtypes, kwargs)
+
+    first_channel = kwargs.get("first_channel", 0)
+    channel_count = kwargs.get("last_channel", 0) + 1 - first_channel
+    include_bias_voltages = kwargs.get("include_bias_voltages", False)
+
+    call = raw_messages(connection.data.get_signal_bytes(**kwargs))
+
+    signal = _SignalBuffer(channel_count, block_size, signal_dtype)
+    bias_voltages = _SignalBuffer(
+        1 if include_bias_voltages else 0, block_size, numpy_dtypes.bias_voltages
+    )
+    # config changes are kept with absolute offsets (ie: samples since start)
+    channel_configs = [[] for i in range(channel_count)]
+    block_start = None
+
+    def make_block(length):
+        block_end = block_start + length
+        channel_signal = signal.split(length)
+        if calibration is not None:
+            channel_signal = calibrate_signal(
+                channel_signal, calibration, calibrated_dtype
+            )
+        if include_bias_voltages:
+            block_bias_voltages = bias_voltages.split(length)[0]
+        else:
+            block_bias_voltages = numpy.empty(0, numpy_dtypes.bias_voltages)
+
+        channels = []
+        for i in range(channel_count):
+            changes = channel_configs[i]
+            configs = _window_config_changes(changes, block_start, block_end)
+            # forget everything except the change in effect at the start of the next block
+            while len(changes) > 1 and changes[1].offset <= block_end:
+                changes.pop(0)
+            channels.append(
+                ChannelSignalData(i + first_channel, channel_signal[i], configs)
+            )
+
+        return SignalData(
+            block_start,
+            block_start / sample_rate if sample_rate else 0.0,
+            channels,
+            block_bias_voltages,
+        )
+
+    try:
+        for msg in call:
+            if on_started:
+                on_started()
+                on_started = None
+
+            if block_start is None:
+                block_start = msg.samples_since_start
+            for i, c in enumerate(msg.channels, start=msg.skipped_channels):
+                signal.append(i, c.data)
+                if len(c.config_changes):
+                    channel_configs[i].extend(
+                        _config_changes(c, msg.samples_since_start)
+                    )
+            if include_bias_voltages and len(msg.bias_voltages):
+                bias_voltages.append(0, msg.bias_voltages)
+
+            while signal.available() >= block_size:
+                block = make_block(block_size)
+                block_start += block_size
+                yield block
+
+        remaining = signal.available()
+        if remaining:
+            yield make_block(remaining)
+    finally:
+        call.cancel()
+
+
+SignalSummary = collections.namedtuple(
+    "SignalSummary",
+    [
+        "channels",
+        "count",
+        "mean",
+        "std",
+        "min",
+        "max",
+        "median",
+        "mad",
+        "saturated",
+    ],
+)
+SignalSummary.__doc__ = """\
+Per-channel statistics from SignalStatistics.summary().
+
+Each attribute other than ``channels`` is a numpy array with one element per channel. Channels that
+have not received any data have a ``count`` of 0 and NaN for the other statistics.
+
+Attributes:
+    channels (numpy.ndarray): The channel numbers.
+    count (numpy.ndarray): The number of samples seen on each channel.
+    mean (numpy.ndarray): The mean of the signal.
+    std (numpy.ndarray): The (population) standard deviation of the signal.
+    min (numpy.ndarray): The smallest sample.
+    max (numpy.ndarray): The largest sample.
+    median (numpy.ndarray): The approximate median of the signal (see SignalStatistics).
+    mad (numpy.ndarray): The approximate median absolute deviation from the median, a measure of
+        noise that is not affected by occasional spikes.
+    saturated (numpy.ndarray): The number of samples at or beyond the saturation limits (always
+        zero if no limits were given).
+"""
+
+
+class SignalStatistics(object):
+    """Per-channel signal statistics, updated as the signal arrives.
+
+    Only fixed-size per-channel state is kept, so the memory used does not depend on how much
+    signal is added. The mean, standard deviation, minimum and maximum are exact (the moments are
+    combined with Chan et al's parallel algorithm). The median and MAD are calculated from a
+    per-channel histogram with ``bins`` equal-width bins over ``value_range``, so they are only as
+    precise as the bin width; samples outside the range are counted in the first or last bin.
+
+    Every update is vectorised across the channels it covers. Use `get_signal_statistics` to
+    collect statistics straight from MinKNOW, or `add` to feed in signal from elsewhere.
+
+    Args:
+        first_channel (int): The first channel (channels start at 1).
+        last_channel (int): The last channel.
+        value_range (tuple): The ``(low, high)`` range of values to build the histograms over. For
+            ADC data, the device's ADC range is a good choice; for calibrated data, something like
+            ``(-100, 400)`` picoamps.
+        bins (int, optional): The number of histogram bins for each channel.
+        saturation_limits (tuple, optional): ``(low, high)`` values; samples at or beyond either
+            limit are counted as saturated.
+    """
+
+    def __init__(
+        self,
+        first_channel,
+        last_channel,
+        value_range,
+        bins=1024,
+        saturation_limits=None,
+    ):
+        if bins < 1:
+            raise ArgumentError("'bins' must be positive")
+        low, high = value_range
+        if not high > low:
+            raise ArgumentError("'value_range' must be a (low, high) pair")
+        self.first_channel = first_channel
+        self.last_channel = last_channel
+        self.value_range = (float(low), float(high))
+        self.bins = bins
+        self.saturation_limits = saturation_limits
+
+        rows = last_channel - first_channel + 1
+        self._count = numpy.zeros(rows, numpy.int64)
+        self._mean = numpy.zeros(rows, numpy.float64)
+        self._m2 = numpy.zeros(rows, numpy.float64)
+        self._min = numpy.full(rows, numpy.inf)
+        self._max = numpy.full(rows, -numpy.inf)
+        self._saturated = numpy.zeros(rows, numpy.int64)
+        self._histogram = numpy.zeros((rows, bins), numpy.int64)
+        self._bin_width = (self.value_range[1] - self.value_range[0]) / bins
+
+    def add(self, signal, first_channel=None):
+        """Add a block of signal.
+
+        Args:
+            signal (numpy.ndarray): A ``(channels, samples)`` array.
+            first_channel (int, optional): The channel of the first row of ``signal``. Defaults to
+                `first_channel`.
+        """
+        if first_channel is None:
+            first_channel = self.first_channel
+        start = first_channel - self.first_channel
+        if start < 0 or start + signal.shape[0] > len(self._count):
+            raise ArgumentError("Signal has channels outside of the tracked range")
+        self._add(numpy.arange(start, start + signal.shape[0]), signal)
+
+    def add_message(self, message, dtype, first_channel):
+        """Add the signal from a ``GetSignalBytesResponse`` message.
+
+        Args:
+            message (minknow_api.data_pb2.GetSignalBytesResponse): The message.
+            dtype (numpy.dtype): The type of the signal in the message (see `get_numpy_types`).
+            first_channel (int): The ``first_channel`` argument of the ``get_signal_bytes`` call.
+        """
+        start = first_channel + message.skipped_channels - self.first_channel
+        chunks = [c.data for c in message.channels]
+        if not chunks:
+            return
+        if len(set(len(chunk) for chunk in chunks)) == 1:
+            # the usual case: one array for the whole message
+            signal = numpy.frombuffer(b"".join(chunks), dtype).reshape(len(chunks), -1)
+            self._add(numpy.arange(start, start + len(chunks)), signal)
+        else:
+            for i, chunk in enumerate(chunks, start=start):
+                self._add(
+                    numpy.array([i]), numpy.frombuffer(chunk, dtype).reshape(1, -1)
+                )
+
+    def _add(self, rows, signal):
+        n = signal.shape[1]
+        if n == 0:
+            return
+        signal = signal.astype(numpy.float64, copy=False)
+
+        chunk_mean = signal.mean(axis=1)
+        chunk_m2 = numpy.square(signal - chunk_mean[:, numpy.newaxis]).sum(axis=1)
+        count = self._count[rows]
+        total = count + n
+        delta = chunk_mean - self._mean[rows]
+        self._mean[rows] += delta * (n / total)
+        self._m2[rows] += chunk_m2 + delta * delta * (count * n / total)
+        self._count[rows] = total
+
+        self._min[rows] = numpy.minimum(self._min[rows], signal.min(axis=1))
+        self._max[rows] = numpy.maximum(self._max[rows], signal.max(axis=1))
+        if self.saturation_limits is not None:
+            low, high = self.saturation_limits
+            self._saturated[rows] += numpy.count_nonzero(
+                (signal <= low) | (signal >= high), axis=1
+            )
+
+        bins = ((signal - self.value_range[0]) / self._bin_width).astype(numpy.int64)
+        numpy.clip(bins, 0, self.bins - 1, out=bins)
+        # only touches the bins the samples fall into, rather than building (and adding) a whole
+        # histogram for each row
+        numpy.add.at(self._histogram, (rows[:, numpy.newaxis], bins), 1)
+
+    def _histogram_quantile(self, histogram, values, fraction):
+        """The value at ``fraction`` of the way through each row of a histogram, interpolating
+        within bins. ``values`` are the lower edges of the bins for each row."""
+        cumulative = numpy.cumsum(histogram, axis=1)
+        target = cumulative[:, -1] * fraction
+        index = numpy.argmax(cumulative >= target[:, numpy.newaxis], axis=1)
+        index = index[:, numpy.newaxis]
+        in_bin = numpy.take_along_axis(histogram, index, axis=1)[:, 0]
+        before = numpy.take_along_axis(cumulative, index, axis=1)[:, 0] - in_bin
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            within = numpy.where(in_bin > 0, (target - before) / in_bin, 0.0)
+        return numpy.take_along_axis(values, index, axis=1)[:, 0] + within * (
+            self._bin_width
+        )
+
+    def summary(self):
+        """Get the statistics so far.
+
+        Returns:
+            SignalSummary: The statistics for each channel.
+        """
+        count = self._count.copy()
+        empty = count == 0
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            std = numpy.sqrt(self._m2 / count)
+        rows = len(count)
+        edges = self.value_range[0] + self._bin_width * numpy.arange(self.bins)
+
+        median = self._histogram_quantile(
+            self._histogram, numpy.broadcast_to(edges, (rows, self.bins)), 0.5
+        )
+        # the distance of each bin from the median, sorted, gives a histogram of the deviations
+        deviations = numpy.abs(edges + self._bin_width / 2 - median[:, numpy.newaxis])
+        order = numpy.argsort(deviations, axis=1)
+        sorted_deviations = numpy.take_along_axis(deviations, order, axis=1)
+        mad = self._histogram_quantile(
+            numpy.take_along_axis(self._histogram, order, axis=1),
+            sorted_deviations - self._bin_width / 2,
+            0.5,
+        )
+        mad = numpy.maximum(mad, 0.0)
+
+        def masked(values):
+            return numpy.where(empty, numpy.nan, values)
+
+        return SignalSummary(
+            channels=numpy.arange(self.first_channel, self.last_channel + 1),
+            count=count,
+            mean=masked(self._mean),
+            std=masked(std),
+            min=masked(self._min),
+            max=masked(self._max),
+            median=masked(median),
+            mad=masked(mad),
+            saturated=self._saturated.copy(),
+        )
+
+
+def get_signal_statistics(
+    connection,
+    value_range,
+    bins=1024,
+    saturation_limits=None,
+    on_started=None,
+    numpy_dtypes=None,
+    **kwargs
+):
+    """Collect per-channel statistics about the signal, without keeping the signal.
+
+    This takes the same arguments as `get_signal`, but rather than storing the signal, each
+    message is added to a `SignalStatistics` as it arrives and then discarded, so the memory used
+    is the same however much signal is requested.
+
+    Args:
+        connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
+        value_range (tuple): The range of the median and MAD histograms (see `SignalStatistics`).
+        bins (int, optional): The number of histogram bins for each channel.
+        saturation_limits (tuple, optional): ``(low, high)`` values; samples at or beyond either
+            limit are counted as saturated.
+        on_started (callable, optional): Called as soon as the first message is received.
+        numpy_dtypes (NumpyDTypes, optional): The result of ``get_numpy_types(connection)``.
+            If this is not provided, `cached_numpy_types` will be used.
+        **kwargs: The ``seconds`` or ``samples``, ``first_channel``, ``last_channel`` and
+            ``calibrated_data`` arguments, as for `get_signal`. If neither ``seconds`` nor
+            ``samples`` is given, data is collected until the call is ended by MinKNOW.
+
+    Returns:
+        SignalSummary: The statistics for each channel.
+    """
+    if "first_channel" not in kwargs or "last_channel" not in kwargs:
+        raise ArgumentError(
+            "get_signal_statistics requires 'first_channel' and 'last_channel' arguments"
+        )
+    if numpy_dtypes is None:
+        numpy_dtypes = cached_numpy_types(connection)
+    signal_dtype = _signal_dtype(numpy_dtypes, kwargs)
+    first_channel = kwargs["first_channel"]
+
+    stats = SignalStatistics(
+        first_channel,
+        kwargs["last_channel"],
+        value_range,
+        bins=bins,
+        saturation_limits=saturation_limits,
+    )
+    call = raw_messages(connection.data.get_signal_bytes(**kwargs))
+    try:
+        for msg in call:
+            if on_started:
+                on_started()
+                on_started = None
+            stats.add_message(msg, signal_dtype, first_channel)
+    finally:
+        call.cancel()
+    return stats.summary()
+
+
+_CAPTURE_INFO_FILE = "capture.json"
+_CAPTURE_SIGNAL_FILE = "signal.npy"
+_CAPTURE_BIAS_VOLTAGES_FILE = "bias_voltages.npy"
+_CAPTURE_FORMAT_VERSION = 1
+
+
+def capture_signal(
+    connection, path, on_started=None, numpy_dtypes=None, sample_rate=None, **kwargs
+):
+    """Get signal data from the flow cell, writing it straight to disk.
+
+    This takes the same arguments as `get_signal`, but rather than collecting the data in memory,
+    each chunk of data is copied into a memory-mapped file as it arrives. This allows large
+    amounts of data to be captured with very little memory.
+
+    The capture is written to a directory containing:
+
+    ``signal.npy``
+        The signal, as a ``(channels, samples)`` array in numpy's ``.npy`` format.
+    ``bias_voltages.npy``
+        The bias voltages, if they were requested.
+    ``capture.json``
+        Everything else: the channel range, ``samples_since_start`` and ``seconds_since_start``,
+        the numpy dtypes (as returned by `api_types_to_numpy_types`), the number of samples
+        received for each channel and any channel configuration changes. This is written last, so
+        a capture without it is incomplete.
+
+    Use `open_signal_capture` to read the capture back.
+
+    Args:
+        connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
+        path (str or os.PathLike): The directory to write the capture to. It will be created if
+            it does not exist, and any existing capture in it will be overwritten.
+        on_started (callable, optional): Called as soon as the first message is received.
+        numpy_dtypes (NumpyDTypes, optional): The result of ``get_numpy_types(connection)``.
+            If this is not provided, `cached_numpy_types` will be used.
+        sample_rate (int, optional): The sample rate of the device. This is only used when
+            ``seconds`` is provided, to size the file. If it is not provided, it will be obtained
+            with an extra RPC (which is cached until a new acquisition is started).
+        **kwargs: The ``seconds`` or ``samples``, ``first_channel``, ``last_channel`` and other
+            arguments, as for `get_signal`.
+
+    Returns:
+        SignalData: The captured data, as returned by ``open_signal_capture(path)``.
+    """
+    if numpy_dtypes is None:
+        numpy_dtypes = cached_numpy_types(connection)
+
+    expected_samples = _expected_samples(connection, sample_rate, kwargs)
+    signal_dtype = _signal_dtype(numpy_dtypes, kwargs)
+    include_bias_voltages = kwargs.get("include_bias_voltages", False)
+
+    first_channel = kwargs["first_channel"]
+    channel_count = kwargs["last_channel"] + 1 - first_channel
+
+    path = pathlib.Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    info_path = path / _CAPTURE_INFO_FILE
+    if info_path.exists():
+        info_path.unlink()
+
+    signal_file = numpy.lib.format.open_memmap(
+        path / _CAPTURE_SIGNAL_FILE,
+        mode="w+",
+        dtype=signal_dtype,
+        shape=(channel_count, expected_samples),
+    )
+    signal = _SignalBuffer(
+        channel_count, expected_samples, signal_dtype, signal_file, growable=False
+    )
+    if include_bias_voltages:
+        bias_voltages_file = numpy.lib.format.open_memmap(
+            path / _CAPTURE_BIAS_VOLTAGES_FILE,
+            mode="w+",
+            dtype=numpy_dtypes.bias_voltages,
+            shape=(expected_samples,),
+        )
+        bias_voltages = _SignalBuffer(
+            1,
+            expected_samples,
+            numpy_dtypes.bias_voltages,
+            bias_voltages_file.reshape((1, expected_samples)),
+            growable=False,
+        )
+    else:
+        bias_voltages_file = None
+        bias_voltages = _SignalBuffer(1, 0, numpy_dtypes.bias_voltages, growable=False)
+    channel_configs = [[] for i in range(channel_count)]
+
+    # only start the call once the files are ready, so it is not left streaming if they can't be
+    # created
+    call = raw_messages(connection.data.get_signal_bytes(**kwargs))
+    try:
+        start_samples, start_seconds = _receive_signal(
+            call, signal, bias_voltages, channel_configs, on_started
+        )
+    finally:
+        call.cancel()
+
+    if signal.dropped or bias_voltages.dropped:
+        logger.warning(
+            "More data was received than expected for the capture in %s: discarded %d signal "
+            "samples and %d bias voltage samples",
+            path,
+            signal.dropped,
+            bias_voltages.dropped,
+        )
+
+    signal_file.flush()
+    del signal_file
+    if bias_voltages_file is not None:
+        bias_voltages_file.flush()
+        del bias_voltages_file
+
+    info = {
+        "version": _CAPTURE_FORMAT_VERSION,
+        "first_channel": first_channel,
+        "last_channel": first_channel + channel_count - 1,
+        "samples_since_start": start_samples,
+        "seconds_since_start": start_seconds,
+        "calibrated_data": kwargs.get("calibrated_data", False),
+        "numpy_dtypes": {
+            name: numpy.dtype(dtype).str
+            for name, dtype in numpy_dtypes._asdict().items()
+        },
+        "channel_lengths": signal.lengths.tolist(),
+        "bias_voltages_length": int(bias_voltages.lengths[0]),
+        "config_changes": [
+            [
+                {
+                    "offset": change.offset,
+                    "config": json_format.MessageToDict(change.config),
+                }
+                for change in configs
+            ]
+            for configs in channel_configs
+        ],
+    }
+    with open(info_path, "w") as f:
+        json.dump(info, f)
+
+    return open_signal_capture(path)
+
+
+def open_signal_capture(path, mode="r"):
+    """Open a capture written by `capture_signal`.
+
+    The signal is memory-mapped rather than read into memory, so this is cheap even for very large
+    captures.
+
+    Args:
+        path (str or os.PathLike): The directory the capture was written to.
+        mode (str, optional): The mode to memory-map the data files with (see ``numpy.memmap``).
+            Defaults to read-only.
+
+    Returns:
+        SignalData: The captured data. The ``signal`` array on each channel (and the
+        ``bias_voltages`` array) are views into memory-mapped arrays.
+    """
+    from .device_pb2 import ReturnedChannelConfiguration
+
+    path = pathlib.Path(path)
+    with open(path / _CAPTURE_INFO_FILE, "r") as f:
+        info = json.load(f)
+    if info["version"] != _CAPTURE_FORMAT_VERSION:
+        raise RuntimeError(
+            "Unsupported signal capture version {}".format(info["version"])
+        )
+
+    signal = numpy.load(path / _CAPTURE_SIGNAL_FILE, mmap_mode=mode)
+    bias_voltages_path = path / _CAPTURE_BIAS_VOLTAGES_FILE
+    if info["bias_voltages_length"] and bias_voltages_path.exists():
+        bias_voltages = numpy.load(bias_voltages_path, mmap_mode=mode)[
+            : info["bias_voltages_length"]
+        ]
+    else:
+        bias_voltages = numpy.empty(0, info["numpy_dtypes"]["bias_voltages"])
+
+    channels = []
+    for i, (length, changes) in enumerate(
+        zip(info["channel_lengths"], info["config_changes"])
+    ):
+        configs = [
+            ChannelConfigChange(
+                change["offset"],
+                json_format.ParseDict(change["config"], ReturnedChannelConfiguration()),
+            )
+            for change in changes
+        ]
+        channels.append(
+            ChannelSignalData(info["first_channel"] + i, signal[i, :length], configs)
+        )
+
+    return SignalData(
+        info["samples_since_start"],
+        info["seconds_since_start"],
+        channels,
+        bias_voltages,
     )
@@ -0,0 +1,348 @@
+"""
+Querying many hosts
+===================
+
+Sites with several sequencers usually want to ask the same question of every host (eg: "which flow
+cell positions are running?"). Doing this one `minknow_api.manager.Manager` at a time means the
+total time is the sum of the time taken for each host, and a single unreachable host holds up all
+the ones after it.
+
+`Fleet` holds a manager for each host, and runs calls against all of them at once on a thread
+pool. Each result comes back as a `HostResult`, which records how long the call took and any error
+it raised, so that one failing host does not affect the results from the others.
+
+>>> with Fleet(["sequencer-1", "sequencer-2", "sequencer-3"]) as fleet:
+>>>     for host, result in fleet.flow_cell_positions(timeout=10).items():
+>>>         if result.ok:
+>>>             print(host, [pos.name for pos in result.value])
+>>>         else:
+>>>             print(host, "failed:", result.error)
+
+Any other query can be run with `Fleet.map`, which calls a function with each host's manager:
+
+>>> fleet.map(lambda manager: manager.rpc.get_disk_space_info(_timeout=10), timeout=10)
+
+The fleet cannot interrupt a query that is already running, so the ``timeout`` only limits how long
+the fleet waits for results. The built-in queries pass the remaining time on to their calls (and to
+connecting to the host), but a function given to `Fleet.map` should set its own timeouts. While a
+host is still running a query that timed out, it is skipped by later queries rather than having
+another query queued up behind it.
+"""
+
+import concurrent.futures
+import logging
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from minknow_api.manager import Manager
+
+__all__ = [
+    "Fleet",
+    "HostResult",
+]
+
+logger = logging.getLogger(__name__)
+
+HostSpec = Union[str, Tuple[str, int]]
+
+
+class HostResult(NamedTuple):
+    """The result of a query run on one host of a `Fleet`.
+
+    Attributes:
+        host: The host, as named in the fleet.
+        value: The value returned by the query, or None if it failed.
+        error: The exception raised by the query (or by connecting to the host), or None if it
+            succeeded. If the query did not finish in time, or the host was skipped because it was
+            still running an earlier query, this is a `TimeoutError`.
+        latency: How long (in seconds) the query took, including connecting to the host if that
+            had not been done yet.
+    """
+
+    host: str
+    value: Any
+    error: Optional[Exception]
+    latency: float
+
+    @property
+    def ok(self) -> bool:
+        """Whether the query succeeded."""
+        return self.error is None
+
+
+class _Host(object):
+    def __init__(self, name: str, host: str, port: Optional[int]):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.manager = None  # type: Optional[Manager]
+        # held while connecting, so that concurrent queries only connect once
+        self.lock = threading.Lock()
+        # the last query submitted for the host, which may still be running after timing out
+        self.query = None  # type: Optional[concurrent.futures.Future]
+
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    """The time left before a deadline (from ``time.monotonic()``), if there is one."""
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.0)
+
+
+def _or_default(timeout: Optional[float]) -> float:
+    """A timeout for the `minknow_api.manager.Manager` methods, which require one."""
+    return Manager.DEFAULT_TIMEOUT if timeout is None else timeout
+
+
+class Fleet(object):
+    """Managers for many hosts, which can be queried in parallel.
+
+    The managers are only created when a host is first queried (see `Fleet.manager`). A host that
+    cannot be connected to is retried on the next query.
+
+    Args:
+        hosts: The hosts to query. Each is either a hostname, or a tuple of hostname and manager
+            port.
+        max_workers: The maximum number of hosts to query at once. Defaults to the number of hosts,
+            so every host can be queried at the same time.
+        **manager_args: Passed to `minknow_api.manager.Manager` for every host (eg: ``credentials``
+            or ``developer_api_token``).
+    """
+
+    def __init__(
+        self,
+        hosts: Iterable[HostSpec],
+        max_workers: Optional[int] = None,
+        **manager_args,
+    ):
+        self._hosts = {}  # type: Dict[str, _Host]
+        for spec in hosts:
+            if isinstance(spec, str):
+                host = _Host(spec, spec, None)
+            else:
+                host = _Host("{}:{}".format(*spec), *spec)
+            self._hosts[host.name] = host
+        self._manager_args = manager_args
+        self._closed = False
+        # held while submitting queries, so that each host only runs one at a time
+        self._submit_lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers or max(len(self._hosts), 1),
+            thread_name_prefix="minknow_api.fleet",
+        )
+
+    def __repr__(self) -> str:
+        return "Fleet({!r})".format(list(self._hosts))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def hosts(self) -> List[str]:
+        """The names of the hosts in the fleet (as used to key results)."""
+        return list(self._hosts)
+
+    def close(self) -> None:
+        """Close the connections to all the hosts.
+
+        This does not wait for queries that are still running on unresponsive hosts.
+        """
+        self._closed = True
+        self._executor.shutdown(wait=False)
+        for host in self._hosts.values():
+            # not under the lock, which may be held by a connection attempt that is not responding
+            manager, host.manager = host.manager, None
+            if manager is not None:
+                manager.close()
+
+    def manager(self, host: str, timeout: Optional[float] = None) -> Manager:
+        """Get the manager for a host, connecting to it if necessary.
+
+        Args:
+            host: The name of the host, as listed in `hosts`.
+            timeout: The maximum time to wait for the host to respond when connecting to it. If
+                None, there is no limit.
+
+        Raises:
+            KeyError: if the host is not part of the fleet.
+        """
+        entry = self._hosts[host]
+        with entry.lock:
+            manager = entry.manager
+            if manager is None:
+                manager = Manager(
+                    host=entry.host,
+                    port=entry.port,
+                    timeout=timeout,
+                    **self._manager_args,
+                )
+                if self._closed:
+                    manager.close()
+                    raise RuntimeError("The fleet has been closed")
+                entry.manager = manager
+            return manager
+
+    def _run(
+        self,
+        host: str,
+        func: Callable[[Manager, Optional[float]], Any],
+        deadline: Optional[float],
+    ) -> HostResult:
+        start = time.monotonic()
+        try:
+            manager = self.manager(host, timeout=_remaining(deadline))
+            value = func(manager, _remaining(deadline))
+        except Exception as e:
+            logger.debug("Query failed on %s: %r", host, e)
+            return HostResult(host, None, e, time.monotonic() - start)
+        return HostResult(host, value, None, time.monotonic() - start)
+
+    def as_completed(
+        self, func: Callable[[Manager], Any], timeout: Optional[float] = None
+    ) -> Iterator[HostResult]:
+        """Run a query on every host, yielding the results as they arrive.
+
+        Args:
+            func: The query. This is called with the `minknow_api.manager.Manager` for each host,
+                from a worker thread. It should set its own timeouts on any calls it makes (see
+                below).
+            timeout: The maximum time (in seconds) to wait for all the results. Hosts that have not
+                responded by then are given a `TimeoutError` result. This does not stop ``func``,
+                which is left to finish in the background, and the host will be skipped by any
+                queries made before it does.
+
+        Yields:
+            A `HostResult` for each host.
+        """
+        return self._as_completed(lambda manager, _remaining: func(manager), timeout)
+
+    def _as_completed(
+        self,
+        func: Callable[[Manager, Optional[float]], Any],
+        timeout: Optional[float],
+    ) -> Iterator[HostResult]:
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        futures = {}  # type: Dict[concurrent.futures.Future, str]
+        busy = []  # type: List[str]
+        with self._submit_lock:
+            for name, host in self._hosts.items():
+                if host.query is not None and not host.query.done():
+                    # another query would just queue up behind the one that is not responding
+                    busy.append(name)
+                    continue
+                host.query = self._executor.submit(self._run, name, func, deadline)
+                futures[host.query] = name
+
+        for host in busy:
+            yield HostResult(
+                host,
+                None,
+                TimeoutError(f"{host} is still running an earlier query"),
+                0.0,
+            )
+        try:
+            for future in concurrent.futures.as_completed(futures, timeout=timeout):
+                del futures[future]
+                yield future.result()
+        except concurrent.futures.TimeoutError:
+            for future, host in futures.items():
+                if future.done():
+                    # finished after the timeout was reached
+                    yield future.result()
+                    continue
+                future.cancel()
+                yield HostResult(
+                    host,
+                    None,
+                    TimeoutError(f"No response from {host} within {timeout}s"),
+                    time.monotonic() - start,
+                )
+
+    def map(
+        self, func: Callable[[Manager], Any], timeout: Optional[float] = None
+    ) -> Dict[str, HostResult]:
+        """Run a query on every host.
+
+        This takes about as long as the slowest host, rather than the total of all the hosts.
+
+        Args:
+            func: The query. This is called with the `minknow_api.manager.Manager` for each host,
+                from a worker thread. It should set its own timeouts on any calls it makes (see
+                `as_completed`).
+            timeout: The maximum time (in seconds) to wait for all the results. Hosts that have not
+                responded by then are given a `TimeoutError` result.
+
+        Returns:
+            A `HostResult` for each host, keyed by host name (in the order the hosts were given).
+        """
+        return self._map(lambda manager, _remaining: func(manager), timeout)
+
+    def _map(
+        self,
+        func: Callable[[Manager, Optional[float]], Any],
+        timeout: Optional[float],
+    ) -> Dict[str, HostResult]:
+        results = {result.host: result for result in self._as_completed(func, timeout)}
+        return {host: results[host] for host in self._hosts}
+
+    def flow_cell_positions(
+        self, timeout: Optional[float] = None
+    ) -> Dict[str, HostResult]:
+        """List the flow cell positions on every host.
+
+        Each successful result's value is a list of `minknow_api.manager.FlowCellPosition`.
+        """
+        return self._map(
+            lambda manager, remaining: list(
+                manager.flow_cell_positions(timeout=_or_default(remaining))
+            ),
+            timeout,
+        )
+
+    def describe_host(self, timeout: Optional[float] = None) -> Dict[str, HostResult]:
+        """Describe every host (see `minknow_api.manager.Manager.describe_host`)."""
+        return self._map(
+            lambda manager, remaining: manager.describe_host(
+                timeout=_or_default(remaining)
+            ),
+            timeout,
+        )
+
+    def get_version_info(
+        self, timeout: Optional[float] = None
+    ) -> Dict[str, HostResult]:
+        """Get the version information of every host.
+
+        The managers fetch this when they connect, but this makes a fresh call.
+        """
+        return self._map(
+            lambda manager, remaining: manager.rpc.get_version_info(_timeout=remaining),
+            timeout,
+        )
+
+    def get_disk_space_info(
+        self, timeout: Optional[float] = None
+    ) -> Dict[str, HostResult]:
+        """Get the disk space information of every host."""
+        return self._map(
+            lambda manager, remaining: manager.rpc.get_disk_space_info(
+                _timeout=remaining
+            ),
+            timeout,
+        )
@@ -0,0 +1,312 @@
+"""
+Read length and q-score histograms
+==================================
+
+The statistics service streams histograms of read lengths (``stream_read_length_histogram``),
+q-scores (``stream_q_score_histogram``) and q-accuracies (``stream_q_accuracy_histogram``), with
+each update holding the whole histogram as lists of buckets. `decode_histograms` converts an update
+into `Histogram` objects, which hold numpy arrays of bucket edges and values and can calculate
+summaries such as the mean, percentiles and N50 locally. This means one stream can provide all the
+summaries, rather than calling ``read_length_n50`` and other RPCs as well.
+
+Histograms can also be combined (eg: across flow cell positions or acquisition periods) with
+`merge_histograms`, even if their buckets do not line up:
+
+>>> for histograms in stream_read_length_histograms(connection, run_id):
+>>>     overall = histograms[()]
+>>>     print("N50:", overall.n50(), "mean:", overall.mean())
+"""
+
+import collections
+import logging
+from typing import Dict, Iterable, Iterator, Tuple
+
+import numpy
+
+from . import statistics_pb2
+from ._support import raw_messages
+
+__all__ = [
+    "Histogram",
+    "decode_histograms",
+    "merge_histograms",
+    "stream_q_accuracy_histograms",
+    "stream_q_score_histograms",
+    "stream_read_length_histograms",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram(object):
+    """A histogram, as numpy arrays.
+
+    Values within a bucket are assumed to be spread evenly across it, so summaries are
+    interpolated within buckets.
+
+    Args:
+        edges: The ``n + 1`` edges of the ``n`` buckets, in ascending order. Bucket ``i`` covers
+            ``[edges[i], edges[i + 1])``.
+        values: The value of each bucket.
+        weighted: Whether each value is the total of the measured quantity in the bucket (eg: the
+            total length of the reads, for ``ReadLengths`` bucket values) rather than a count (or
+            other weight) of the reads in it.
+
+    Attributes:
+        edges (numpy.ndarray): The bucket edges.
+        values (numpy.ndarray): The bucket values.
+        weighted (bool): Whether the values are totals rather than read counts.
+    """
+
+    def __init__(self, edges, values, weighted: bool = False):
+        self.edges = numpy.asarray(edges, dtype=numpy.float64)
+        self.values = numpy.asarray(values)
+        self.weighted = weighted
+        if self.edges.shape != (len(self.values) + 1,):
+            raise ValueError("There must be one more edge than there are values")
+
+    def __repr__(self):
+        return "Histogram({} buckets from {} to {}, weighted={})".format(
+            len(self.values), self.edges[0], self.edges[-1], self.weighted
+        )
+
+    def __add__(self, other: "Histogram") -> "Histogram":
+        return merge_histograms([self, other])
+
+    @property
+    def midpoints(self) -> numpy.ndarray:
+        """The middle of each bucket."""
+        return (self.edges[:-1] + self.edges[1:]) / 2
+
+    def total(self):
+        """The total of the values (ie: the number of reads, or the total read length if
+        `weighted`)."""
+        return self.values.sum()
+
+    def counts(self) -> numpy.ndarray:
+        """The (approximate, if `weighted`) number of reads in each bucket."""
+        if self.weighted:
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                return numpy.where(self.values > 0, self.values / self.midpoints, 0.0)
+        return self.values
+
+    def weights(self) -> numpy.ndarray:
+        """The (approximate, if not `weighted`) total of the measured quantity in each bucket."""
+        if self.weighted:
+            return self.values
+        return self.values * self.midpoints
+
+    def mean(self) -> float:
+        """The mean of the measured quantity over all the reads."""
+        counts = self.counts()
+        total = counts.sum()
+        if not total:
+            return float("nan")
+        return float((counts * self.midpoints).sum() / total)
+
+    def mode(self) -> float:
+        """The midpoint of the bucket with the most reads."""
+        if not len(self.values):
+            return float("nan")
+        return float(self.midpoints[numpy.argmax(self.counts())])
+
+    def percentile(self, q):
+        """The value that ``q`` percent of the reads are below.
+
+        Args:
+            q: A percentage, or an array of them.
+
+        Returns:
+            A float, or an array if ``q`` was an array.
+        """
+        return self._quantile(self.counts(), numpy.asarray(q) / 100)
+
+    def nx(self, x):
+        """The N-x statistic: the length such that reads at least that long account for ``x``
+        percent of the total length.
+
+        Args:
+            x: A percentage (eg: 50 for the N50), or an array of them.
+        """
+        return self._quantile(self.weights(), 1 - numpy.asarray(x) / 100)
+
+    def n50(self) -> float:
+        """The N50 (see `nx`)."""
+        return float(self.nx(50))
+
+    def _quantile(self, weights, fraction):
+        cumulative = numpy.concatenate(
+            ([0.0], numpy.cumsum(weights, dtype=numpy.float64))
+        )
+        if not cumulative[-1]:
+            return numpy.full(numpy.shape(fraction), numpy.nan)[()]
+        # the first bucket that reaches the target, so empty buckets before it are skipped
+        target = fraction * cumulative[-1]
+        index = numpy.clip(
+            numpy.searchsorted(cumulative, target, side="left"), 1, len(weights)
+        )
+        before = cumulative[index - 1]
+        in_bucket = cumulative[index] - before
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            within = numpy.where(in_bucket > 0, (target - before) / in_bucket, 0.0)
+        lower = self.edges[index - 1]
+        return (lower + within * (self.edges[index] - lower))[()]
+
+    def rebin(self, edges) -> "Histogram":
+        """Spread the values over different buckets.
+
+        Each bucket's value is shared between the new buckets in proportion to how much of it
+        they cover. Values outside the new edges are lost.
+
+        Returns:
+            A new histogram with floating-point values.
+        """
+        edges = numpy.asarray(edges, dtype=numpy.float64)
+        cumulative = numpy.concatenate(
+            ([0.0], numpy.cumsum(self.values, dtype=numpy.float64))
+        )
+        return Histogram(
+            edges,
+            numpy.diff(numpy.interp(edges, self.edges, cumulative)),
+            self.weighted,
+        )
+
+
+def merge_histograms(histograms: Iterable[Histogram]) -> Histogram:
+    """Add histograms together.
+
+    If the histograms all have the same buckets, their values are simply added. Otherwise, they
+    are all spread over buckets with every edge any of them has (see `Histogram.rebin`) first.
+
+    Raises:
+        ValueError: If there are no histograms, or some are weighted and others are not.
+    """
+    histograms = list(histograms)
+    if not histograms:
+        raise ValueError("No histograms to merge")
+    weighted = histograms[0].weighted
+    if any(h.weighted != weighted for h in histograms):
+        raise ValueError("Cannot merge weighted and unweighted histograms")
+
+    edges = histograms[0].edges
+    if all(numpy.array_equal(h.edges, edges) for h in histograms):
+        return Histogram(edges, sum(h.values for h in histograms), weighted)
+    edges = numpy.unique(numpy.concatenate([h.edges for h in histograms]))
+    return Histogram(edges, sum(h.rebin(edges).values for h in histograms), weighted)
+
+
+_key_types = {}
+
+
+def _filter_key(filtering) -> Tuple:
+    """A hashable version of the ``filtering`` field of some histogram data."""
+    key = []
+    for f in filtering:
+        descriptor = f.DESCRIPTOR
+        key_type = _key_types.get(descriptor.full_name)
+        if key_type is None:
+            key_type = _key_types[descriptor.full_name] = collections.namedtuple(
+                descriptor.name, [field.name for field in descriptor.fields]
+            )
+        key.append(key_type(*(getattr(f, name) for name in key_type._fields)))
+    return tuple(key)
+
+
+def decode_histograms(response) -> Dict[Tuple, Histogram]:
+    """Convert a ``StreamReadLengthHistogramResponse``, ``StreamQScoreHistogramResponse`` or
+    ``StreamQAccuracyHistogramResponse`` message into `Histogram` objects.
+
+    Read length histograms with ``ReadLengths`` bucket values are `Histogram.weighted`. Q-score
+    histograms with ``QScore_BasecalledBases`` values are not: their values are used as the weight
+    of each bucket, so (for example) `Histogram.mean` gives the mean q-score of all the bases.
+
+    Returns:
+        A histogram for each element of the message's ``histogram_data`` field, keyed by its
+        ``filtering`` field. Each key is a tuple with a named tuple for each filter (eg:
+        ``(ReadLengthHistogramKey(read_end_reason=...),)``), and is empty if the data is not
+        filtered.
+    """
+    ranges = response.bucket_ranges
+    count = len(ranges)
+    starts = numpy.fromiter((r.start for r in ranges), numpy.float64, count)
+    ends = numpy.fromiter((r.end for r in ranges), numpy.float64, count)
+    if not numpy.array_equal(starts[1:], ends[:-1]):
+        raise ValueError("Histogram buckets are not contiguous")
+    edges = numpy.append(starts, ends[-1:]) if count else numpy.zeros(1)
+
+    # a q-score histogram's QScore_BasecalledBases values just weight each read by its length, but
+    # ReadLengths values are totals of the quantity being bucketed
+    weighted = (
+        isinstance(response, statistics_pb2.StreamReadLengthHistogramResponse)
+        and response.bucket_value_type == statistics_pb2.ReadLengths
+    )
+    return {
+        _filter_key(data.filtering): Histogram(
+            edges, numpy.array(data.bucket_values, dtype=numpy.uint64), weighted
+        )
+        for data in response.histogram_data
+    }
+
+
+def _stream_histograms(method, acquisition_run_id, kwargs):
+    call = raw_messages(method(acquisition_run_id=acquisition_run_id, **kwargs))
+    try:
+        for response in call:
+            yield decode_histograms(response)
+    finally:
+        call.cancel()
+
+
+def stream_read_length_histograms(
+    connection, acquisition_run_id: str, **kwargs
+) -> Iterator[Dict[Tuple, Histogram]]:
+    """Stream read length histograms, decoded with `decode_histograms`.
+
+    Args:
+        connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
+        acquisition_run_id: The acquisition period to get the histograms for.
+        **kwargs: Other arguments to ``stream_read_length_histogram`` (eg: ``read_length_type``,
+            ``bucket_value_type`` and ``split``).
+
+    Yields:
+        The histograms from each update.
+    """
+    return _stream_histograms(
+        connection.statistics.stream_read_length_histogram, acquisition_run_id, kwargs
+    )
+
+
+def stream_q_score_histograms(
+    connection, acquisition_run_id: str, **kwargs
+) -> Iterator[Dict[Tuple, Histogram]]:
+    """Stream q-score histograms, decoded with `decode_histograms`.
+
+    Args:
+        connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
+        acquisition_run_id: The acquisition period to get the histograms for.
+        **kwargs: Other arguments to ``stream_q_score_histogram``.
+
+    Yields:
+        The histograms from each update.
+    """
+    return _stream_histograms(
+        connection.statistics.stream_q_score_histogram, acquisition_run_id, kwargs
+    )
+
+
+def stream_q_accuracy_histograms(
+    connection, acquisition_run_id: str, **kwargs
+) -> Iterator[Dict[Tuple, Histogram]]:
+    """Stream q-accuracy histograms, decoded with `decode_histograms`.
+
+    Args:
+        connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
+        acquisition_run_id: The acquisition period to get the histograms for.
+        **kwargs: Other arguments to ``stream_q_accuracy_histogram``.
+
+    Yields:
+        The histograms from each update.
+    """
+    return _stream_histograms(
+        connection.statistics.stream_q_accuracy_histogram, acquisition_run_id, kwargs
+    )
@@ -0,0 +1,525 @@
+"""
+Helpers for adaptive sampling
+=============================
+
+The ``get_live_reads`` RPC on the data service streams chunks of in-progress reads to the client,
+and accepts actions (such as unblocking a read) in return. It is a bidirectional streaming RPC,
+which means the client has to provide an iterator of requests that keeps running for as long as
+the call does, as well as consuming the responses.
+
+`LiveReadsClient` takes care of this. It sends the stream setup, decodes the raw data for each read
+chunk into a numpy array, keeps the most recent chunk for each channel until it is collected with
+`LiveReadsClient.get_read_chunks`, and sends any actions requested with `LiveReadsClient.unblock` or
+`LiveReadsClient.stop_receiving`.
+
+Actions are sent in batches: all the actions requested since the last message was sent are combined
+into a single message. When decisions are being made at a high rate, the ``max_batch_delay`` and
+``max_batch_size`` arguments can be used to trade a little latency for fewer, larger messages.
+Repeated requests for the same action on the same read are only sent once, and actions for a read
+are dropped without being sent if a later chunk shows that the read has already finished. The
+latency of each batch can be monitored with `LiveReadsClient.get_batch_metrics`.
+
+>>> with LiveReadsClient(connection, first_channel=1, last_channel=512) as client:
+>>>     while client.is_running:
+>>>         for chunk in client.get_read_chunks():
+>>>             if should_reject(chunk.signal):
+>>>                 client.unblock(chunk.channel, chunk.read.id)
+>>>             else:
+>>>                 client.stop_receiving(chunk.channel, chunk.read.id)
+
+Decisions should be made as quickly as possible: the longer it takes to decide, the more of the
+read will have been sequenced already.
+"""
+
+import collections
+import itertools
+import logging
+import threading
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import grpc
+import numpy
+
+import minknow_api.data
+from minknow_api._support import raw_messages
+from minknow_api.data_pb2 import GetLiveReadsRequest, GetLiveReadsResponse
+
+__all__ = [
+    "ActionBatchMetrics",
+    "LiveReadsClient",
+    "RawDataType",
+    "ReadChunk",
+]
+
+logger = logging.getLogger(__name__)
+
+RawDataType = GetLiveReadsRequest.RawDataType
+ActionResponse = GetLiveReadsResponse.ActionResponse
+
+
+class ReadChunk(NamedTuple):
+    """A chunk of an in-progress read, as received from ``get_live_reads``.
+
+    Attributes:
+        channel: The channel the read is on (channel numbers start at 1).
+        read: The read information sent by MinKNOW. Note that ``read.raw_data`` contains the
+            undecoded bytes of `signal`.
+        signal: The raw data for the chunk. This will be empty if no raw data was requested.
+        samples_since_start: The ``samples_since_start`` of the message the chunk was received in.
+        received: When the chunk was received, according to ``time.monotonic()``.
+    """
+
+    channel: int
+    read: GetLiveReadsResponse.ReadData
+    signal: numpy.ndarray
+    samples_since_start: int
+    received: float
+
+
+class ActionBatchMetrics(NamedTuple):
+    """Timings for a batch of actions sent by `LiveReadsClient`.
+
+    Attributes:
+        size: The number of actions in the batch.
+        sent: When the batch was sent, according to ``time.monotonic()``.
+        queue_latency: How long the oldest action in the batch waited before being sent, in
+            seconds.
+        response_latency: How long it took for responses to all the actions in the batch to be
+            received after the batch was sent, in seconds.
+    """
+
+    size: int
+    sent: float
+    queue_latency: float
+    response_latency: float
+
+
+class _QueuedAction(NamedTuple):
+    message: GetLiveReadsRequest.Action
+    key: Tuple[int, str, str]
+    queued: float
+
+
+class _SentBatch(object):
+    """An `ActionBatchMetrics` that is waiting for action responses."""
+
+    def __init__(self, size: int, sent: float, queue_latency: float):
+        self.size = size
+        self.sent = sent
+        self.queue_latency = queue_latency
+        self.outstanding = size
+
+
+class LiveReadsClient(object):
+    """A client for the ``get_live_reads`` RPC.
+
+    The call is started by `start` (or by using the client as a context manager) and runs on a
+    background thread until `stop` is called or the call ends.
+
+    Args:
+        connection: Connection to a MinKNOW flow cell position.
+        first_channel: The first channel to receive reads from (channels start at 1).
+        last_channel: The last channel to receive reads from.
+        raw_data_type: What sort of raw data to receive with each read chunk.
+        sample_minimum_chunk_size: The minimum size of the read chunks MinKNOW should send.
+        max_unblock_read_length_samples: Reads longer than this (in samples) will not be
+            unblocked, but further data from them will not be sent either. Cannot be used with
+            `max_unblock_read_length_seconds`.
+        max_unblock_read_length_seconds: As `max_unblock_read_length_samples`, but in seconds.
+        accepted_first_chunk_classifications: If given, only send reads that start with one of
+            these classifications (see ``analysis_configuration.get_read_classifications``).
+        numpy_dtypes: The numpy data types for the connection. If not given,
+            `minknow_api.data.cached_numpy_types` will be used.
+        max_tracked_actions: How many action responses to remember (see `action_response`).
+        max_batch_delay: How long to wait for more actions before sending a batch, in seconds.
+            This is measured from when the oldest action in the batch was requested.
+        max_batch_size: The maximum number of actions to send in one message. A batch is sent
+            as soon as it reaches this size, even if `max_batch_delay` has not passed.
+        max_tracked_batches: How many batches to keep metrics for (see `get_batch_metrics`).
+
+    Attributes:
+        connection (minknow_api.Connection): The connection used for the call.
+        signal_dtype (numpy.dtype): The type of the `ReadChunk.signal` arrays.
+    """
+
+    def __init__(
+        self,
+        connection: "minknow_api.Connection",
+        first_channel: int,
+        last_channel: int,
+        raw_data_type: int = RawDataType.CALIBRATED,
+        sample_minimum_chunk_size: int = 0,
+        max_unblock_read_length_samples: Optional[int] = None,
+        max_unblock_read_length_seconds: Optional[float] = None,
+        accepted_first_chunk_classifications: Sequence[int] = (),
+        numpy_dtypes: Optional[minknow_api.data.NumpyDTypes] = None,
+        max_tracked_actions: int = 100000,
+        max_batch_delay: float = 0,
+        max_batch_size: Optional[int] = None,
+        max_tracked_batches: int = 1000,
+    ):
+        if (
+            max_unblock_read_length_samples is not None
+            and max_unblock_read_length_seconds is not None
+        ):
+            raise ValueError(
+                "Cannot specify both max_unblock_read_length_samples and "
+                "max_unblock_read_length_seconds"
+            )
+        if max_batch_size is not None and max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+
+        self.connection = connection
+        self.first_channel = first_channel
+        self.last_channel = last_channel
+
+        setup = GetLiveReadsRequest.StreamSetup(
+            first_channel=first_channel,
+            last_channel=last_channel,
+            raw_data_type=raw_data_type,
+            sample_minimum_chunk_size=sample_minimum_chunk_size,
+            accepted_first_chunk_classifications=accepted_first_chunk_classifications,
+        )
+        if max_unblock_read_length_samples is not None:
+            setup.max_unblock_read_length_samples = max_unblock_read_length_samples
+        if max_unblock_read_length_seconds is not None:
+            setup.max_unblock_read_length_seconds = max_unblock_read_length_seconds
+        self._setup = setup
+
+        if raw_data_type in (RawDataType.CALIBRATED, RawDataType.UNCALIBRATED):
+            if numpy_dtypes is None:
+                numpy_dtypes = minknow_api.data.cached_numpy_types(connection)
+            if raw_data_type == RawDataType.CALIBRATED:
+                self.signal_dtype = numpy_dtypes.calibrated_signal
+            else:
+                self.signal_dtype = numpy_dtypes.uncalibrated_signal
+        else:
+            # no raw data will be sent
+            self.signal_dtype = numpy.dtype(numpy.float32)
+
+        self._lock = threading.Lock()
+        # signalled when there are actions to send, or the client is stopping
+        self._wakeup = threading.Condition(self._lock)
+        self._pending_actions: List[_QueuedAction] = []
+        # (channel, read id, action type) -> action id, for actions without a response yet
+        self._action_keys: Dict[Tuple[int, str, str], str] = {}
+        # channel -> id of the latest read seen on that channel
+        self._current_reads: Dict[int, str] = {}
+        self._latest_chunks: "collections.OrderedDict[int, ReadChunk]" = (
+            collections.OrderedDict()
+        )
+        self._sent_actions: Dict[str, Tuple[_QueuedAction, _SentBatch]] = {}
+        self._action_responses: "collections.OrderedDict[str, int]" = (
+            collections.OrderedDict()
+        )
+        self._max_tracked_actions = max_tracked_actions
+        self._action_ids = itertools.count()
+        self._max_batch_delay = max_batch_delay
+        self._max_batch_size = max_batch_size
+        self._batch_metrics: "collections.deque[ActionBatchMetrics]" = (
+            collections.deque(maxlen=max_tracked_batches)
+        )
+        self._dropped_action_count = 0
+
+        self._stopping = False
+        self._call = None
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[grpc.RpcError] = None
+
+    def __enter__(self) -> "LiveReadsClient":
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self) -> None:
+        """Start the ``get_live_reads`` call."""
+        if self._thread is not None:
+            raise RuntimeError("LiveReadsClient has already been started")
+        # the responses are read directly, so there is no need to wrap each one
+        self._call = raw_messages(self.connection.data.get_live_reads(self._requests()))
+        self._thread = threading.Thread(
+            target=self._receive,
+            name="minknow_api.live_reads receiver",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """End the ``get_live_reads`` call.
+
+        Any actions that have been requested but not yet sent (including any waiting for
+        ``max_batch_delay`` to pass) will be discarded.
+
+        Args:
+            timeout: How long to wait for the background thread to finish.
+        """
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify_all()
+        if self._call is not None:
+            self._call.cancel()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the call is still running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def error(self) -> Optional[grpc.RpcError]:
+        """The error the call failed with, if any.
+
+        This is not set if the call was ended by `stop`.
+        """
+        return self._error
+
+    def get_read_chunks(
+        self, max_count: Optional[int] = None, last: bool = True
+    ) -> List[ReadChunk]:
+        """Collect the most recent chunk received for each channel.
+
+        Each channel only has its latest chunk kept: if a new chunk arrives for a channel before
+        the previous one was collected, the previous one is discarded (but the new chunk's
+        ``read.id`` will show whether it is for the same read). Collected chunks are removed from
+        the cache.
+
+        Args:
+            max_count: The maximum number of chunks to return.
+            last: If True, return the most recently received chunks first. Otherwise, return the
+                chunks that have been waiting longest first.
+
+        Returns:
+            The collected read chunks.
+        """
+        with self._lock:
+            count = len(self._latest_chunks)
+            if max_count is not None:
+                count = min(count, max_count)
+            return [self._latest_chunks.popitem(last=last)[1] for _ in range(count)]
+
+    def unblock(self, channel: int, read_id: str, duration: float = 0.1) -> str:
+        """Unblock a read, ejecting it from the pore, and stop receiving further data from it.
+
+        Args:
+            channel: The channel the read is on.
+            read_id: The ``id`` of the read (see `ReadChunk.read`).
+            duration: How long to apply the unblock voltage for, in seconds.
+
+        Returns:
+            The ID of the action. This can be passed to `action_response` to find out whether it
+            succeeded. If the read has already been unblocked, and no response has been received
+            yet, the ID of the existing action is returned.
+        """
+        return self._queue_action(
+            channel,
+            read_id,
+            unblock=GetLiveReadsRequest.UnblockAction(duration=duration),
+        )
+
+    def stop_receiving(self, channel: int, read_id: str) -> str:
+        """Stop receiving data for a read, leaving it to be sequenced.
+
+        Args:
+            channel: The channel the read is on.
+            read_id: The ``id`` of the read (see `ReadChunk.read`).
+
+        Returns:
+            The ID of the action. This can be passed to `action_response` to find out whether it
+            succeeded. If this has already been requested for the read, and no response has been
+            received yet, the ID of the existing action is returned.
+        """
+        return self._queue_action(
+            channel,
+            read_id,
+            stop_further_data=GetLiveReadsRequest.StopFurtherData(),
+        )
+
+    def action_response(self, action_id: str) -> Optional[int]:
+        """Find out what happened to an action.
+
+        Args:
+            action_id: The ID returned by `unblock` or `stop_receiving`.
+
+        Returns:
+            The response (a ``GetLiveReadsResponse.ActionResponse.Response`` value), or None if no
+            response has been received yet (or it has been forgotten - see the
+            ``max_tracked_actions`` constructor argument). Actions that were dropped without being
+            sent, because the read had already finished, have a response of
+            ``FAILED_READ_FINISHED``.
+        """
+        with self._lock:
+            return self._action_responses.get(action_id)
+
+    @property
+    def pending_action_count(self) -> int:
+        """The number of actions that have been sent, but not responded to."""
+        with self._lock:
+            return len(self._sent_actions)
+
+    @property
+    def dropped_action_count(self) -> int:
+        """The number of actions dropped without being sent, because the read had finished."""
+        with self._lock:
+            return self._dropped_action_count
+
+    def get_batch_metrics(self) -> List[ActionBatchMetrics]:
+        """Collect the metrics for batches of actions that have been fully responded to.
+
+        Collected metrics are removed from the client. Only the most recent batches are kept (see
+        the ``max_tracked_batches`` constructor argument).
+
+        Returns:
+            The metrics for each batch, in the order they were completed.
+        """
+        with self._lock:
+            metrics = list(self._batch_metrics)
+            self._batch_metrics.clear()
+            return metrics
+
+    def _queue_action(self, channel: int, read_id: str, **action) -> str:
+        [action_type] = action.keys()
+        key = (channel, read_id, action_type)
+        with self._lock:
+            existing = self._action_keys.get(key)
+            if existing is not None:
+                return existing
+            action_id = str(next(self._action_ids))
+            message = GetLiveReadsRequest.Action(
+                action_id=action_id, channel=channel, id=read_id, **action
+            )
+            self._action_keys[key] = action_id
+            current_read = self._current_reads.get(channel)
+            if current_read is not None and current_read != read_id:
+                # we've already seen a later read on this channel
+                self._drop_action(action_id, key)
+            else:
+                self._pending_actions.append(
+                    _QueuedAction(message, key, time.monotonic())
+                )
+                self._wakeup.notify()
+        return action_id
+
+    def _drop_action(self, action_id: str, key: Tuple[int, str, str]) -> None:
+        # must be called with the lock held
+        del self._action_keys[key]
+        self._record_response(action_id, ActionResponse.FAILED_READ_FINISHED)
+        self._dropped_action_count += 1
+
+    def _record_response(self, action_id: str, response: int) -> None:
+        # must be called with the lock held
+        self._action_responses[action_id] = response
+        while len(self._action_responses) > self._max_tracked_actions:
+            self._action_responses.popitem(last=False)
+
+    def _batch_ready(self) -> bool:
+        # must be called with the lock held
+        if self._max_batch_size is not None:
+            if len(self._pending_actions) >= self._max_batch_size:
+                return True
+        deadline = self._pending_actions[0].queued + self._max_batch_delay
+        return time.monotonic() >= deadline
+
+    def _requests(self) -> Iterator[GetLiveReadsRequest]:
+        """The request iterator for the call.
+
+        This is run on a thread owned by gRPC.
+        """
+        yield GetLiveReadsRequest(setup=self._setup)
+        while True:
+            with self._lock:
+                while not self._stopping:
+                    if not self._pending_actions:
+                        self._wakeup.wait()
+                    elif self._batch_ready():
+                        break
+                    else:
+                        self._wakeup.wait(
+                            self._pending_actions[0].queued
+                            + self._max_batch_delay
+                            - time.monotonic()
+                        )
+                if self._stopping:
+                    return
+                batch = self._pending_actions[: self._max_batch_size]
+                del self._pending_actions[: len(batch)]
+                sent = time.monotonic()
+                sent_batch = _SentBatch(len(batch), sent, sent - batch[0].queued)
+                for queued in batch:
+                    self._sent_actions[queued.message.action_id] = (queued, sent_batch)
+            yield GetLiveReadsRequest(
+                actions=GetLiveReadsRequest.Actions(
+                    actions=[queued.message for queued in batch]
+                )
+            )
+
+    def _receive(self) -> None:
+        try:
+            for response in self._call:
+                self._handle_response(response, time.monotonic())
+        except grpc.RpcError as e:
+            if not (self._stopping and e.code() == grpc.StatusCode.CANCELLED):
+                logger.warning("get_live_reads failed: %s", e)
+                self._error = e
+        finally:
+            with self._lock:
+                self._stopping = True
+                self._wakeup.notify_all()
+
+    def _handle_response(self, response: GetLiveReadsResponse, received: float):
+        chunks = [
+            ReadChunk(
+                channel,
+                read,
+                numpy.frombuffer(read.raw_data, self.signal_dtype),
+                response.samples_since_start,
+                received,
+            )
+            for channel, read in response.channels.items()
+        ]
+        with self._lock:
+            finished_reads = False
+            for chunk in chunks:
+                # move the channel to the end, so the cache stays in order of arrival
+                self._latest_chunks.pop(chunk.channel, None)
+                self._latest_chunks[chunk.channel] = chunk
+                previous_read = self._current_reads.get(chunk.channel)
+                if previous_read is not None and previous_read != chunk.read.id:
+                    finished_reads = True
+                self._current_reads[chunk.channel] = chunk.read.id
+            if finished_reads:
+                self._drop_finished_actions()
+
+            for action_response in response.action_responses:
+                self._record_response(
+                    action_response.action_id, action_response.response
+                )
+                sent = self._sent_actions.pop(action_response.action_id, None)
+                if sent is None:
+                    continue
+                queued, batch = sent
+                self._action_keys.pop(queued.key, None)
+                batch.outstanding -= 1
+                if batch.outstanding == 0:
+                    self._batch_metrics.append(
+                        ActionBatchMetrics(
+                            size=batch.size,
+                            sent=batch.sent,
+                            queue_latency=batch.queue_latency,
+                            response_latency=received - batch.sent,
+                        )
+                    )
+
+    def _drop_finished_actions(self) -> None:
+        # must be called with the lock held
+        still_pending = []
+        for queued in self._pending_actions:
+            channel, read_id, _ = queued.key
+            if self._current_reads.get(channel, read_id) != read_id:
+                self._drop_action(queued.message.action_id, queued.key)
+            else:
+                still_pending.append(queued)
+        self._pending_actions = still_pending
@@ -12,10 +12,25 @@ usually constructing using methods on ``Manager``.
 
 """
 
+from concurrent.futures import ThreadPoolExecutor
 import datetime
+import logging
 import os
+import threading
 import warnings
-from typing import Dict, Iterator, Optional, NamedTuple, Sequence, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    NamedTuple,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import grpc
 from google.protobuf import timestamp_pb2
@@ -32,15 +47,21 @@ import minknow_api.manager_service
 import minknow_api.v2.protocols_service
 import minknow_api.protocol_settings_pb2 as protocol_settings_pb2
 
-from minknow_api import Connection, get_local_authentication_token_file
+from minknow_api import Connection, get_local_authentication_token_file, raw_messages
+from minknow_api.channel_pool import ChannelPool, DEFAULT_CHANNEL_POOL
 
 __all__ = [
     "Basecaller",
+    "ConnectAllResult",
     "FlowCellPosition",
     "Manager",
+    "PositionChange",
+    "PositionRegistry",
     "get_local_authentication_token_file",  # Moved to minknow_api.__init__, but we export here for backwards compat for now
 ]
 
+logger = logging.getLogger(__name__)
+
 
 class ServiceBase(object):
     """Implementation detail for Manager and Basecaller - do not use directly."""
@@ -181,15 +202,23 @@ class FlowCellPosition(object):
         )
 
     def connect(
-        self, credentials: Optional[grpc.ChannelCredentials] = None
+        self,
+        credentials: Optional[grpc.ChannelCredentials] = None,
+        channel_pool: Optional[ChannelPool] = DEFAULT_CHANNEL_POOL,
     ) -> Connection:
         """Connect to the position.
 
         Only valid to do if `running` is True.
 
+        By default, the gRPC channel is shared with other connections to the same position (see
+        `minknow_api.channel_pool`), so connecting to a position repeatedly is cheap. Close the
+        connection when it is no longer needed to let the channel be closed when it becomes idle.
+
         Args:
             credentials: Override the credentials to be used for this particular
                 connection.
+            channel_pool: The pool to get the gRPC channel from. Pass None to use a new channel
+                that is not shared with any other connection.
 
         Returns:
             A connection to the RPC interface.
@@ -206,6 +235,7 @@ class FlowCellPosition(object):
             host=self.host,
             port=port,
             credentials=credentials,
+            channel_pool=channel_pool,
         )
 
 
@@ -243,6 +273,92 @@ class Basecaller(ServiceBase):
         return "Basecaller({!r}, {!r})".format(self.host, self.port)
 
 
+class ConnectAllResult(NamedTuple):
+    """The result of connecting to several positions at once (see `Manager.connect_all`).
+
+    Attributes:
+        connections: The connection to each position that could be connected to, keyed by position
+            name.
+        errors: The exception raised for each position that could not be connected to, keyed by
+            position name.
+    """
+
+    connections: Dict[str, Connection]
+    errors: Dict[str, Exception]
+
+
+def _positions_to_connect(
+    available: Iterable[FlowCellPosition], names: Optional[Iterable[str]]
+) -> Tuple[List[FlowCellPosition], Dict[str, Exception]]:
+    """Pick the positions `Manager.connect_all` should connect to.
+
+    Returns:
+        The positions to connect to, and an error for each requested position that does not exist.
+    """
+    if names is None:
+        return [pos for pos in available if pos.running], {}
+    by_name = {pos.name: pos for pos in available}
+    positions = []
+    errors = {}
+    for name in names:
+        if name in by_name:
+            positions.append(by_name[name])
+        else:
+            errors[name] = RuntimeError(f"Cannot find position with name '{name}'")
+    return positions, errors
+
+
+def _manager_port_and_credentials(
+    host: str,
+    port: Optional[int],
+    developer_api_token: Optional[str],
+    credentials: Optional[grpc.ChannelCredentials],
+    client_certificate_chain: Optional[bytes],
+    client_private_key: Optional[bytes],
+    ca_certificate: Optional[bytes],
+    environ: Union[Dict[str, str], os._Environ],
+    _warning_stacklevel: int = 0,
+) -> Tuple[int, grpc.ChannelCredentials]:
+    """Get the port and credentials for a connection to the manager.
+
+    This is shared by `Manager` and `minknow_api.aio.Manager` - see those for a description of
+    the arguments.
+    """
+    if port is None:
+        if (
+            client_certificate_chain is not None
+            or "MINKNOW_API_CLIENT_CERTIFICATE_CHAIN" in environ
+        ):
+            # client certificates won't work on 9502
+            port = 9501
+        else:
+            # pre-5.5 versions of MinKNOW Core don't listen on 9501
+            port = 9502
+
+    if credentials is not None:
+        if developer_api_token is not None:
+            warnings.warn("`developer_api_token` ignored as `credentials` was provided")
+        if client_certificate_chain is not None or client_private_key is not None:
+            warnings.warn(
+                "`client_certificate_chain` and `client_private_key` ignored as `credentials` was provided"
+            )
+        if ca_certificate is not None:
+            warnings.warn("`ca_certificate` ignored as `credentials` was provided")
+
+    if credentials is None:
+        credentials = minknow_api.grpc_credentials(
+            manager_port=port,
+            developer_api_token=developer_api_token,
+            host=host,
+            client_certificate_chain=client_certificate_chain,
+            client_private_key=client_private_key,
+            ca_certificate=ca_certificate,
+            _warning_stacklevel=_warning_stacklevel + 1,
+            environ=environ,
+        )
+    return port, credentials
+
+
 class Manager(ServiceBase):
     """A connection to the manager gRPC interface.
 
@@ -265,6 +381,8 @@ class Manager(ServiceBase):
             parameter is ignored.
         ca_certificate: The (PEM-encoded) root CA certificate. Note: if `credentials`
             is provided, this parameter is ignored.
+        timeout: The maximum time to wait for the version information that is fetched when
+            connecting. If None, there is no limit.
 
     Attributes:
         bream_version (str): The version of Bream that is installed.
@@ -303,41 +421,19 @@ class Manager(ServiceBase):
         client_private_key: Optional[bytes] = None,
         ca_certificate: Optional[bytes] = None,
         environ: Union[Dict[str, str], os._Environ] = os.environ,
+        timeout: Optional[float] = None,
     ):
-        if port is None:
-            if (
-                client_certificate_chain is not None
-                or "MINKNOW_API_CLIENT_CERTIFICATE_CHAIN" in environ
-            ):
-                # client certificates won't work on 9502
-                port = 9501
-            else:
-                # pre-5.5 versions of MinKNOW Core don't listen on 9501
-                port = 9502
-
-        if credentials is not None:
-            if developer_api_token is not None:
-                warnings.warn(
-                    "`developer_api_token` ignored as `credentials` was provided"
-                )
-            if client_certificate_chain is not None or client_private_key is not None:
-                warnings.warn(
-                    "`client_certificate_chain` and `client_private_key` ignored as `credentials` was provided"
-                )
-            if ca_certificate is not None:
-                warnings.warn("`ca_certificate` ignored as `credentials` was provided")
-
-        if credentials is None:
-            credentials = minknow_api.grpc_credentials(
-                manager_port=port,
-                developer_api_token=developer_api_token,
-                host=host,
-                client_certificate_chain=client_certificate_chain,
-                client_private_key=client_private_key,
-                ca_certificate=ca_certificate,
-                _warning_stacklevel=1,
-                environ=environ,
-            )
+        port, credentials = _manager_port_and_credentials(
+            host=host,
+            port=port,
+            developer_api_token=developer_api_token,
+            credentials=credentials,
+            client_certificate_chain=client_certificate_chain,
+            client_private_key=client_private_key,
+            ca_certificate=ca_certificate,
+            environ=environ,
+            _warning_stacklevel=1,
+        )
         super(Manager, self).__init__(
             minknow_api.manager_service.ManagerService,
             host=host,
@@ -350,8 +446,10 @@ class Manager(ServiceBase):
                 self.channel
             )
         )
+        self._position_registry = None
+        self._position_registry_lock = threading.Lock()
 
-        version_info = self.rpc.get_version_info()
+        version_info = self.rpc.get_version_info(_timeout=timeout)
         self.bream_version = version_info.bream
         self.config_version = version_info.protocol_configuration
         self.core_version = version_info.minknow.full
@@ -439,6 +537,28 @@ class Manager(ServiceBase):
             self.channel
         )
 
+    def close(self) -> None:
+        """Close the RPC connection, and stop updating `position_registry`."""
+        with self._position_registry_lock:
+            if self._position_registry is not None:
+                self._position_registry.close()
+        super(Manager, self).close()
+
+    def position_registry(self) -> "PositionRegistry":
+        """Get a live view of the flow cell positions on the host.
+
+        The first call starts watching for changes to the positions (which blocks until the current
+        positions are known). Later calls return the same registry, so looking up positions in it
+        does not require any RPC calls.
+
+        Returns:
+            The registry for this manager. This is closed when the manager is closed.
+        """
+        with self._position_registry_lock:
+            if self._position_registry is None or self._position_registry.closed:
+                self._position_registry = PositionRegistry(self)
+            return self._position_registry
+
     def connect_to(self, position: str) -> Connection:
         """Connects to a position on the host
 
@@ -456,6 +576,48 @@ class Manager(ServiceBase):
                 return conn.connect()
         return RuntimeError(f"Cannot find position with name '{position}'")
 
+    def connect_all(
+        self,
+        positions: Optional[Iterable[str]] = None,
+        max_workers: Optional[int] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> ConnectAllResult:
+        """Connect to several positions at once.
+
+        The connections are made in parallel, so this takes about as long as connecting to the
+        slowest position, rather than to all of them in turn.
+
+        Args:
+            positions: The names of the positions to connect to. If not provided, connects to all
+                the positions whose software is running (see `FlowCellPosition.running`).
+            max_workers: The maximum number of connections to make at the same time. By default,
+                all the connections are made at once.
+            timeout: The maximum time to wait for the list of positions. Should usually be left at
+                the default.
+
+        Returns:
+            The connections that were made, and the errors for the positions that could not be
+            connected to (including requested positions that do not exist).
+        """
+        to_connect, errors = _positions_to_connect(
+            self.flow_cell_positions(timeout=timeout), positions
+        )
+        connections = {}
+        if not to_connect:
+            return ConnectAllResult(connections, errors)
+
+        with ThreadPoolExecutor(
+            max_workers=max_workers or len(to_connect),
+            thread_name_prefix="minknow_api.connect_all",
+        ) as executor:
+            futures = [(pos.name, executor.submit(pos.connect)) for pos in to_connect]
+            for name, future in futures:
+                try:
+                    connections[name] = future.result()
+                except Exception as e:
+                    errors[name] = e
+        return ConnectAllResult(connections, errors)
+
     def create_directory(
         self, name: str, parent_path: str = "", timeout: float = DEFAULT_TIMEOUT
     ) -> str:
@@ -799,3 +961,264 @@ class Manager(ServiceBase):
             include_outdated=include_outdated,
             **kwargs,
         ).configurations
+
+
+class PositionChange(NamedTuple):
+    """A change to the positions known to a `PositionRegistry`.
+
+    Attributes:
+        kind: One of "added", "changed" or "removed".
+        position: The position after the change. For "removed", this is the last known state of the
+            position.
+    """
+
+    kind: str
+    position: FlowCellPosition
+
+
+class PositionRegistry(object):
+    """An up-to-date view of the flow cell positions on a host.
+
+    You should not normally construct this directly - use `Manager.position_registry` instead.
+
+    The registry watches ``watch_flow_cell_positions`` on the manager from a background thread,
+    so the lookup methods return the latest known state without making any RPC calls. If the
+    watch fails after it has started, it is restarted after ``reconnect_delay`` seconds (and the
+    positions are left as they were until then).
+
+    Callbacks registered with `add_callback` are called from the background thread with a
+    `PositionChange` for each change. They should return quickly, as no further updates are
+    processed until they do.
+
+    >>> registry = manager.position_registry()
+    >>> registry.wait_for(lambda r: "MN12345" in r and r["MN12345"].running, timeout=60)
+    >>> connection = registry["MN12345"].connect()
+
+    Args:
+        manager: The manager to watch.
+        timeout: How long to wait for the initial list of positions.
+        reconnect_delay: How long to wait before restarting the watch if it fails.
+
+    Raises:
+        grpc.RpcError: if the watch could not be started.
+        TimeoutError: if the initial list of positions did not arrive in time.
+    """
+
+    def __init__(
+        self,
+        manager: Manager,
+        timeout: float = Manager.DEFAULT_TIMEOUT,
+        reconnect_delay: float = 1.0,
+    ):
+        self._manager = manager
+        self._reconnect_delay = reconnect_delay
+        # re-entrant, so that wait_for predicates can use the lookup methods
+        self._condition = threading.Condition(threading.RLock())
+        self._positions = {}  # type: Dict[str, FlowCellPosition]
+        self._by_state = {}  # type: Dict[str, Dict[str, FlowCellPosition]]
+        self._callbacks = []  # type: List[Callable[[PositionChange], None]]
+        self._ready = False
+        self._error = None  # type: Optional[grpc.RpcError]
+        self._closed = False
+        self._call = raw_messages(manager.rpc.watch_flow_cell_positions())
+
+        thread = threading.Thread(
+            target=self._watch,
+            name="minknow_api.manager position registry",
+            daemon=True,
+        )
+        thread.start()
+
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._ready or self._error is not None, timeout
+            )
+            error = self._error
+            ready = self._ready
+        if not ready:
+            self.close()
+            if error is not None:
+                raise error
+            raise TimeoutError("Timed out waiting for the list of flow cell positions")
+
+    def __repr__(self) -> str:
+        return "PositionRegistry({!r}, {!r})".format(
+            self._manager.host, sorted(self._positions)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def closed(self) -> bool:
+        """Whether `close` has been called."""
+        return self._closed
+
+    def close(self) -> None:
+        """Stop watching for changes."""
+        with self._condition:
+            self._closed = True
+            call = self._call
+            self._condition.notify_all()
+        if call is not None:
+            call.cancel()
+
+    def __getitem__(self, name: str) -> FlowCellPosition:
+        with self._condition:
+            return self._positions[name]
+
+    def __contains__(self, name: str) -> bool:
+        with self._condition:
+            return name in self._positions
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._positions)
+
+    def __iter__(self) -> Iterator[FlowCellPosition]:
+        return iter(self.positions())
+
+    def get(self, name: str) -> Optional[FlowCellPosition]:
+        """Get a position by name, or None if there is no such position."""
+        with self._condition:
+            return self._positions.get(name)
+
+    def positions(self) -> List[FlowCellPosition]:
+        """Get all the known positions. Ordering is not guaranteed."""
+        with self._condition:
+            return list(self._positions.values())
+
+    def with_state(self, *states: str) -> List[FlowCellPosition]:
+        """Get the positions that are in any of the given states.
+
+        Args:
+            states: Values of `FlowCellPosition.state` (eg: "running" or "hardware_error").
+        """
+        with self._condition:
+            return [
+                pos
+                for state in states
+                for pos in self._by_state.get(state, {}).values()
+            ]
+
+    def add_callback(self, callback: Callable[[PositionChange], None]) -> None:
+        """Call ``callback`` with a `PositionChange` whenever a position changes."""
+        with self._condition:
+            self._callbacks.append(callback)
+
+    def remove_callback(self, callback: Callable[[PositionChange], None]) -> None:
+        """Stop calling a callback registered with `add_callback`."""
+        with self._condition:
+            self._callbacks.remove(callback)
+
+    def wait_for(
+        self,
+        predicate: Callable[["PositionRegistry"], Any],
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """Wait until ``predicate(registry)`` returns a true value.
+
+        The predicate is checked straight away, and then again every time the positions change.
+
+        Args:
+            predicate: The condition to wait for. This is passed the registry.
+            timeout: The maximum time to wait (in seconds). Waits forever if not provided.
+
+        Returns:
+            The (true) value returned by the predicate.
+
+        Raises:
+            TimeoutError: if the timeout expired before the predicate returned a true value.
+            RuntimeError: if the registry was closed while waiting.
+        """
+        with self._condition:
+            result = self._condition.wait_for(
+                lambda: predicate(self) or self._closed, timeout
+            )
+            if result is True and self._closed and not predicate(self):
+                raise RuntimeError("The position registry was closed")
+            if not result:
+                raise TimeoutError("Timed out waiting for flow cell positions")
+            return result
+
+    def _watch(self):
+        call = self._call
+        while True:
+            try:
+                first = True
+                for msg in call:
+                    self._update(msg, reset=first)
+                    first = False
+            except grpc.RpcError as e:
+                with self._condition:
+                    if self._closed:
+                        return
+                    if not self._ready:
+                        self._error = e
+                        self._condition.notify_all()
+                        return
+                logger.warning(
+                    "Lost connection to watch_flow_cell_positions: %s", e.details()
+                )
+
+            with self._condition:
+                self._condition.wait_for(lambda: self._closed, self._reconnect_delay)
+                if self._closed:
+                    return
+                call = self._call = raw_messages(
+                    self._manager.rpc.watch_flow_cell_positions()
+                )
+
+    def _update(self, msg, reset: bool) -> None:
+        changes = []
+        with self._condition:
+            if reset:
+                # the first message of a call lists every position, so anything else has gone
+                seen = {desc.name for desc in msg.additions}
+                for name in list(self._positions):
+                    if name not in seen:
+                        changes.append(PositionChange("removed", self._remove(name)))
+            for desc in msg.additions:
+                previous = self._positions.get(desc.name)
+                if previous is None:
+                    changes.append(PositionChange("added", self._store(desc)))
+                elif previous.description != desc:
+                    changes.append(PositionChange("changed", self._store(desc)))
+            for desc in msg.changes:
+                changes.append(PositionChange("changed", self._store(desc)))
+            for name in msg.removals:
+                if name in self._positions:
+                    changes.append(PositionChange("removed", self._remove(name)))
+            callbacks = list(self._callbacks)
+
+        for change in changes:
+            for callback in callbacks:
+                try:
+                    callback(change)
+                except Exception:
+                    logger.exception("Error in position registry callback")
+
+        # waiters are woken after the callbacks, so they see the effects of them
+        with self._condition:
+            self._ready = True
+            self._condition.notify_all()
+
+    def _store(self, desc: manager_pb2.FlowCellPosition) -> FlowCellPosition:
+        # must be called with the lock held
+        if desc.name in self._positions:
+            self._remove(desc.name)
+        position = FlowCellPosition(
+            desc, host=self._manager.host, credentials=self._manager.credentials
+        )
+        self._positions[desc.name] = position
+        self._by_state.setdefault(position.state, {})[desc.name] = position
+        return position
+
+    def _remove(self, name: str) -> FlowCellPosition:
+        # must be called with the lock held
+        position = self._positions.pop(name)
+        del self._by_state[position.state][name]
+        return position
@@ -0,0 +1,384 @@
+"""
+Downsampled monitoring history
+==============================
+
+Temperatures and bias voltages are streamed for as long as a device or acquisition period runs,
+which can be weeks. `TieredHistory` keeps them in a fixed amount of memory: each sample is added
+to several ring buffers of time buckets at different resolutions (by default one second, one minute
+and one hour), which record the number of samples and the minimum, total and maximum of each
+column. The fine-grained tiers only cover the recent past, and the coarse ones cover much longer.
+
+Adding a sample and querying a range both take time proportional to the number of buckets
+involved, not to the length of the history.
+
+The ``stream_*_history`` functions follow the relevant RPC and add everything it sends to a
+history, yielding it after each message:
+
+>>> for history in stream_device_temperature_history(connection):
+>>>     recent = history.query(time.time() - 3600)
+>>>     print(history.columns, recent.minimum.min(axis=0), recent.maximum.max(axis=0))
+"""
+
+import collections
+import logging
+import time
+from typing import Iterator, Optional, Sequence, Tuple
+
+import numpy
+
+from . import statistics_pb2
+from ._support import raw_messages
+
+__all__ = [
+    "DEFAULT_TIERS",
+    "HistoryRange",
+    "TieredHistory",
+    "stream_bias_voltage_history",
+    "stream_device_temperature_history",
+    "stream_temperature_history",
+]
+
+logger = logging.getLogger(__name__)
+
+#: The default `TieredHistory` tiers, as ``(resolution in seconds, number of buckets)`` pairs: an
+#: hour of one-second buckets, a day of one-minute buckets and four weeks of one-hour buckets.
+DEFAULT_TIERS = ((1.0, 3600), (60.0, 1440), (3600.0, 24 * 28))
+
+HistoryRange = collections.namedtuple(
+    "HistoryRange", ["times", "resolution", "count", "minimum", "mean", "maximum"]
+)
+HistoryRange.__doc__ = """A range of buckets from a `TieredHistory`.
+
+Only buckets with at least one sample are included.
+
+Attributes:
+    times (numpy.ndarray): The start time of each bucket.
+    resolution (float): The length of each bucket, in seconds.
+    count (numpy.ndarray): The number of samples in each bucket.
+    minimum (numpy.ndarray): The smallest value of each column in each bucket, with one row per
+        bucket and one column per `TieredHistory.columns` entry.
+    mean (numpy.ndarray): The mean value of each column in each bucket.
+    maximum (numpy.ndarray): The largest value of each column in each bucket.
+"""
+
+
+class _Tier(object):
+    def __init__(self, resolution: float, capacity: int, columns: int):
+        self.resolution = resolution
+        self.capacity = capacity
+        # the bucket number (time // resolution) held in each slot, or -1 for none
+        self.buckets = numpy.full(capacity, -1, numpy.int64)
+        self.count = numpy.zeros(capacity, numpy.int64)
+        self.minimum = numpy.zeros((capacity, columns))
+        self.maximum = numpy.zeros((capacity, columns))
+        self.total = numpy.zeros((capacity, columns))
+        self.latest = -1
+
+    def add(self, times, values):
+        buckets = numpy.floor(times / self.resolution).astype(numpy.int64)
+        latest = max(self.latest, int(buckets.max()))
+        # samples in buckets that have already been overwritten are dropped
+        keep = buckets > latest - self.capacity
+        buckets, values = buckets[keep], values[keep]
+
+        # every bucket in the window has its own slot, so these slots are all different
+        new = numpy.unique(buckets)
+        new_slots = new % self.capacity
+        replace = self.buckets[new_slots] < new
+        new, new_slots = new[replace], new_slots[replace]
+        self.buckets[new_slots] = new
+        self.count[new_slots] = 0
+        self.minimum[new_slots] = numpy.inf
+        self.maximum[new_slots] = -numpy.inf
+        self.total[new_slots] = 0
+
+        slots = buckets % self.capacity
+        current = self.buckets[slots] == buckets
+        slots, values = slots[current], values[current]
+        numpy.add.at(self.count, slots, 1)
+        numpy.minimum.at(self.minimum, slots, values)
+        numpy.maximum.at(self.maximum, slots, values)
+        numpy.add.at(self.total, slots, values)
+        self.latest = latest
+
+    def earliest(self) -> float:
+        """The start of the oldest bucket this tier can still hold."""
+        return max(self.latest - self.capacity + 1, 0) * self.resolution
+
+
+class TieredHistory(object):
+    """A fixed-size history of some values, downsampled to several resolutions.
+
+    Each tier is a ring buffer of time buckets: a sample whose bucket is newer than the tier's
+    newest one overwrites the oldest bucket, and samples for buckets that have already been
+    overwritten are ignored by that tier. Samples can otherwise be added out of order.
+
+    Args:
+        columns: The name of each value in a sample.
+        tiers: The ``(resolution, capacity)`` of each tier, finest first. ``resolution`` is the
+            length of each bucket (in the same units as the sample times, normally seconds) and
+            ``capacity`` is the number of buckets kept.
+
+    Attributes:
+        columns (List[str]): The names of the values.
+    """
+
+    def __init__(
+        self,
+        columns: Sequence[str],
+        tiers: Sequence[Tuple[float, int]] = DEFAULT_TIERS,
+    ):
+        if not tiers:
+            raise ValueError("At least one tier is required")
+        self.columns = list(columns)
+        self._tiers = [
+            _Tier(float(resolution), int(capacity), len(self.columns))
+            for resolution, capacity in tiers
+        ]
+
+    @property
+    def resolutions(self):
+        """The bucket length of each tier, finest first."""
+        return [tier.resolution for tier in self._tiers]
+
+    @property
+    def latest_time(self) -> Optional[float]:
+        """The start of the most recent bucket, or None if there are no samples."""
+        tier = self._tiers[0]
+        if tier.latest < 0:
+            return None
+        return tier.latest * tier.resolution
+
+    def add(self, timestamp: float, values) -> None:
+        """Add a sample.
+
+        Args:
+            timestamp: When the sample was taken.
+            values: A value for each entry in `columns`.
+        """
+        self.add_many([timestamp], [values])
+
+    def add_many(self, times, values) -> None:
+        """Add several samples at once.
+
+        Args:
+            times: When each sample was taken.
+            values: An array with a row for each sample and a column for each entry in `columns`.
+        """
+        times = numpy.asarray(times, numpy.float64)
+        if not len(times):
+            return
+        values = numpy.asarray(values, numpy.float64).reshape(
+            len(times), len(self.columns)
+        )
+        for tier in self._tiers:
+            tier.add(times, values)
+
+    def query(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        resolution: Optional[float] = None,
+    ) -> HistoryRange:
+        """Get the buckets that cover a time range.
+
+        Args:
+            start: The start of the range. Defaults to the oldest data.
+            end: The end of the range (the bucket containing it is included). Defaults to the
+                newest data.
+            resolution: Which tier to use. Defaults to the finest tier that still covers
+                ``start`` (or the coarsest tier, if none do).
+
+        Raises:
+            ValueError: If there is no tier with the requested resolution.
+        """
+        if resolution is None:
+            candidates = [
+                t for t in self._tiers if start is not None and t.earliest() <= start
+            ]
+            tier = candidates[0] if candidates else self._tiers[-1]
+        else:
+            matching = [t for t in self._tiers if t.resolution == resolution]
+            if not matching:
+                raise ValueError("No tier has a resolution of {}".format(resolution))
+            tier = matching[0]
+
+        first = tier.latest - tier.capacity + 1
+        if start is not None:
+            first = max(first, int(numpy.floor(start / tier.resolution)))
+        last = tier.latest
+        if end is not None:
+            last = min(last, int(numpy.floor(end / tier.resolution)))
+        buckets = numpy.arange(max(first, 0), last + 1)
+        slots = buckets % tier.capacity
+        present = (tier.buckets[slots] == buckets) & (tier.count[slots] > 0)
+        buckets, slots = buckets[present], slots[present]
+        count = tier.count[slots]
+        return HistoryRange(
+            times=buckets * tier.resolution,
+            resolution=tier.resolution,
+            count=count,
+            minimum=tier.minimum[slots],
+            mean=tier.total[slots] / count[:, numpy.newaxis],
+            maximum=tier.maximum[slots],
+        )
+
+
+def _sensor_columns(message):
+    """The names and values of the fields of the message in the ``temperature`` oneof.
+
+    Unset ``google.protobuf.FloatValue`` fields are given as NaN.
+    """
+    which = message.WhichOneof("temperature")
+    if which is None:
+        return [], []
+    sensors = getattr(message, which)
+    columns = []
+    values = []
+    for field in sensors.DESCRIPTOR.fields:
+        columns.append(field.name)
+        if field.message_type is None:
+            values.append(getattr(sensors, field.name))
+        elif sensors.HasField(field.name):
+            values.append(getattr(sensors, field.name).value)
+        else:
+            values.append(numpy.nan)
+    return columns, values
+
+
+def _history_for(history, columns, tiers):
+    if history is None:
+        return TieredHistory(columns, tiers)
+    if history.columns != columns:
+        raise ValueError(
+            "The history has columns {}, but the data has {}".format(
+                history.columns, columns
+            )
+        )
+    return history
+
+
+def stream_device_temperature_history(
+    connection,
+    history: Optional[TieredHistory] = None,
+    tiers: Sequence[Tuple[float, int]] = DEFAULT_TIERS,
+    **kwargs
+) -> Iterator[TieredHistory]:
+    """Follow ``device.stream_temperature``, adding each reading to a history.
+
+    The readings are timed by when they are received, in seconds since the epoch. The columns are
+    the temperatures the device reports (eg: ``flowcell_temperature`` and
+    ``chamber_temperature`` for a PromethION).
+
+    Args:
+        connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
+        history: The history to add to. Defaults to one with ``tiers`` and the columns of the
+            first reading.
+        tiers: The tiers of a new history.
+        **kwargs: Other arguments to ``stream_temperature`` (ie: ``period_seconds``).
+
+    Yields:
+        TieredHistory: The history, after each reading has been added.
+    """
+    call = raw_messages(connection.device.stream_temperature(**kwargs))
+    try:
+        for message in call:
+            columns, values = _sensor_columns(message)
+            if not columns:
+                continue
+            history = _history_for(history, columns, tiers)
+            history.add(time.time(), values)
+            yield history
+    finally:
+        call.cancel()
+
+
+def stream_temperature_history(
+    connection,
+    acquisition_run_id: str,
+    history: Optional[TieredHistory] = None,
+    tiers: Sequence[Tuple[float, int]] = ((60.0, 1440), (3600.0, 24 * 28)),
+    **kwargs
+) -> Iterator[TieredHistory]:
+    """Follow ``statistics.stream_temperature``, adding each packet to a history.
+
+    MinKNOW sends one packet for each minute of the acquisition period, starting from
+    ``data_selection.start``, so the samples are timed in seconds since the start of the
+    acquisition period. Because of that, the default tiers start at one minute.
+
+    Args:
+        connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
+        acquisition_run_id: The acquisition period to get the temperatures of.
+        history: The history to add to. Defaults to one with ``tiers`` and the columns of the
+            first packet.
+        tiers: The tiers of a new history.
+        **kwargs: Other arguments to ``stream_temperature`` (ie: ``data_selection``).
+
+    Yields:
+        TieredHistory: The history, after each message has been added.
+    """
+    selection = kwargs.get("data_selection")
+    if isinstance(selection, dict):
+        selection = kwargs["data_selection"] = statistics_pb2.DataSelection(**selection)
+    start = selection.start if selection is not None else 0
+    received = 0
+    call = raw_messages(
+        connection.statistics.stream_temperature(
+            acquisition_run_id=acquisition_run_id, **kwargs
+        )
+    )
+    try:
+        for message in call:
+            rows = []
+            for packet in message.temperatures:
+                columns, values = _sensor_columns(packet)
+                if columns:
+                    history = _history_for(history, columns, tiers)
+                    rows.append((start + 60 * received, values))
+                received += 1
+            if rows:
+                times, values = zip(*rows)
+                history.add_many(times, values)
+                yield history
+    finally:
+        call.cancel()
+
+
+def stream_bias_voltage_history(
+    connection,
+    acquisition_run_id: str,
+    history: Optional[TieredHistory] = None,
+    tiers: Sequence[Tuple[float, int]] = DEFAULT_TIERS,
+) -> Iterator[TieredHistory]:
+    """Follow ``statistics.stream_bias_voltages``, adding each change to a history.
+
+    The history has a single ``bias_voltage`` column, timed in seconds since the start of the
+    acquisition period. MinKNOW only reports changes, so each bucket summarises the voltages that
+    were set during it (a bucket with no changes has no samples).
+
+    Args:
+        connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
+        acquisition_run_id: The acquisition period to get the bias voltages of.
+        history: The history to add to. Defaults to one with ``tiers``.
+        tiers: The tiers of a new history.
+
+    Yields:
+        TieredHistory: The history, after each message has been added.
+    """
+    history = _history_for(history, ["bias_voltage"], tiers)
+    call = raw_messages(
+        connection.statistics.stream_bias_voltages(
+            acquisition_run_id=acquisition_run_id
+        )
+    )
+    try:
+        for message in call:
+            packets = message.bias_voltages
+            count = len(packets)
+            history.add_many(
+                numpy.fromiter((p.time_seconds for p in packets), numpy.float64, count),
+                numpy.fromiter((p.bias_voltage for p in packets), numpy.float64, count),
+            )
+            yield history
+    finally:
+        call.cancel()
@@ -0,0 +1,347 @@
+"""
+Summarised signal for visualisation
+===================================
+
+The ``get_signal_min_max`` RPC on the data service divides the signal on each channel into
+fixed-size windows and sends the minimum and maximum of each window, which is what a trace viewer
+needs to draw the signal. `iter_signal_min_max` makes the call and decodes each message into numpy
+arrays, with one row per channel.
+
+`SignalMinMaxCache` keeps the most recent windows for each channel, along with coarser
+summaries (each window of level ``n + 1`` covers ``zoom_factor`` windows of level ``n``) that are
+built up as the data arrives. This means any time range that is still in the cache can be drawn at
+any zoom level without requesting the signal again:
+
+>>> cache = SignalMinMaxCache(first_channel=1, last_channel=512, window_size=100)
+>>> for block in iter_signal_min_max(connection, first_channel=1, last_channel=512, window_size=100):
+>>>     cache.add(block)
+>>>     view = cache.get(start_sample, end_sample, max_windows=screen_width)
+>>>     draw(view.minima, view.maxima)
+"""
+
+import itertools
+import logging
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+import numpy
+
+from ._support import raw_messages
+
+__all__ = [
+    "MinMaxData",
+    "SignalMinMaxCache",
+    "decode_signal_min_max",
+    "iter_signal_min_max",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class MinMaxData(NamedTuple):
+    """Summarised signal for a range of channels.
+
+    Attributes:
+        channels: The channel numbers of the rows of `minima` and `maxima`.
+        samples_since_start: The number of samples collected before the first window.
+        window_size: How many samples each window covers.
+        minima: The minimum value in each window, as a ``(channels, windows)`` array. This is
+            floating-point data in picoamps for calibrated data, and integer ADC values otherwise.
+        maxima: The maximum value in each window, in the same form as `minima`.
+    """
+
+    channels: numpy.ndarray
+    samples_since_start: int
+    window_size: int
+    minima: numpy.ndarray
+    maxima: numpy.ndarray
+
+
+def decode_signal_min_max(message, first_channel: int, window_size: int) -> MinMaxData:
+    """Decode a ``GetSignalMinMaxResponse`` message into numpy arrays.
+
+    Args:
+        message: The message to decode.
+        first_channel: The ``first_channel`` argument of the ``get_signal_min_max`` call.
+        window_size: The ``window_size`` argument of the ``get_signal_min_max`` call.
+
+    Returns:
+        The decoded data. If the channels in the message have different numbers of windows (which
+        MinKNOW should not do), only as many windows as the shortest channel has are included.
+    """
+    channels = message.channels
+    calibrated = any(len(ch.calibrated_minima) for ch in channels)
+    if calibrated:
+        dtype, min_field, max_field = (
+            numpy.float32,
+            "calibrated_minima",
+            "calibrated_maxima",
+        )
+    else:
+        dtype, min_field, max_field = numpy.int32, "raw_minima", "raw_maxima"
+
+    rows = len(channels)
+    windows = min((len(getattr(ch, min_field)) for ch in channels), default=0)
+    if any(len(getattr(ch, min_field)) != windows for ch in channels):
+        logger.debug("Channels have different numbers of windows; truncating")
+        values = [
+            getattr(ch, field)[:windows]
+            for field in (min_field, max_field)
+            for ch in channels
+        ]
+    else:
+        values = [
+            getattr(ch, field) for field in (min_field, max_field) for ch in channels
+        ]
+
+    # one pass over all the repeated fields, rather than one array per channel
+    decoded = numpy.fromiter(
+        itertools.chain.from_iterable(values), dtype=dtype, count=2 * rows * windows
+    ).reshape(2, rows, windows)
+    first = first_channel + message.skipped_channels
+    return MinMaxData(
+        channels=numpy.arange(first, first + rows),
+        samples_since_start=message.samples_since_start,
+        window_size=window_size,
+        minima=decoded[0],
+        maxima=decoded[1],
+    )
+
+
+def iter_signal_min_max(
+    connection,
+    first_channel: int,
+    last_channel: int,
+    window_size: int,
+    calibrated_data: bool = False,
+):
+    """Stream summarised signal from MinKNOW.
+
+    The call runs until the generator is closed (or garbage collected).
+
+    Args:
+        connection: Connection to a MinKNOW flow cell position.
+        first_channel: The first channel to get data for (channels start at 1).
+        last_channel: The last channel to get data for.
+        window_size: How many samples to summarise in each window.
+        calibrated_data: Whether to get calibrated (picoamp) values rather than ADC values.
+
+    Yields:
+        MinMaxData: The data from each message. Each message may only cover some of the
+        channels.
+    """
+    call = raw_messages(
+        connection.data.get_signal_min_max(
+            first_channel=first_channel,
+            last_channel=last_channel,
+            window_size=window_size,
+            calibrated_data=calibrated_data,
+        )
+    )
+    try:
+        for message in call:
+            yield decode_signal_min_max(message, first_channel, window_size)
+    finally:
+        call.cancel()
+
+
+class SignalMinMaxCache(object):
+    """The most recent summarised signal for a range of channels, at several zoom levels.
+
+    Level 0 holds the windows as received. Each window of level ``n + 1`` holds the minimum and
+    maximum of ``zoom_factor`` windows of level ``n``, and is added as soon as those windows have
+    all been received. Every level holds up to ``capacity`` windows per channel, so coarser levels
+    cover longer periods of time.
+
+    If the data for a channel jumps backwards or forwards (eg: because a new acquisition period
+    started, or data was missed), the older data for that channel is discarded.
+
+    The memory used is ``channels * capacity * levels * 8`` bytes.
+
+    Args:
+        first_channel: The first channel to cache (channels start at 1).
+        last_channel: The last channel to cache.
+        window_size: The window size of the data that will be added.
+        calibrated_data: Whether the data will be calibrated (floating-point) values.
+        capacity: How many windows to keep for each channel at each level.
+        zoom_factor: How many windows of each level are summarised by one window of the next.
+        levels: How many zoom levels to keep.
+    """
+
+    def __init__(
+        self,
+        first_channel: int,
+        last_channel: int,
+        window_size: int,
+        calibrated_data: bool = False,
+        capacity: int = 2048,
+        zoom_factor: int = 4,
+        levels: int = 4,
+    ):
+        if zoom_factor < 2:
+            raise ValueError("zoom_factor must be at least 2")
+        if levels < 1:
+            raise ValueError("levels must be at least 1")
+        self.first_channel = first_channel
+        self.last_channel = last_channel
+        self.window_size = window_size
+        self.capacity = capacity
+        self.zoom_factor = zoom_factor
+        self.levels = levels
+
+        rows = last_channel - first_channel + 1
+        dtype = numpy.float32 if calibrated_data else numpy.int32
+        self._minima = [numpy.zeros((rows, capacity), dtype) for _ in range(levels)]
+        self._maxima = [numpy.zeros((rows, capacity), dtype) for _ in range(levels)]
+        # the first valid window index on each level, for each channel
+        self._starts = numpy.zeros((levels, rows), numpy.int64)
+        # the index of the next level-0 window for each channel
+        self._end = numpy.zeros(rows, numpy.int64)
+
+    def level_window_size(self, level: int) -> int:
+        """The number of samples covered by each window on a level."""
+        return self.window_size * self.zoom_factor**level
+
+    def add(self, data: MinMaxData) -> None:
+        """Add data from `iter_signal_min_max` (or `decode_signal_min_max`).
+
+        Channels outside the cached range are ignored.
+        """
+        if data.window_size != self.window_size:
+            raise ValueError(
+                "Expected window size {}, got {}".format(
+                    self.window_size, data.window_size
+                )
+            )
+        keep = (data.channels >= self.first_channel) & (
+            data.channels <= self.last_channel
+        )
+        rows = data.channels[keep] - self.first_channel
+        minima = data.minima[keep]
+        maxima = data.maxima[keep]
+        start = data.samples_since_start // self.window_size
+        # never write more than the ring buffer holds in one go, or the coarser levels would be
+        # built from overwritten data
+        for offset in range(0, minima.shape[1], self.capacity):
+            chunk = slice(offset, offset + self.capacity)
+            self._add(rows, start + offset, minima[:, chunk], maxima[:, chunk])
+
+    def _add(self, rows, start, minima, maxima):
+        count = minima.shape[1]
+        if not len(rows) or not count:
+            return
+        factor = self.zoom_factor
+
+        # channels that do not continue on from their previous data start again
+        restart = rows[self._end[rows] != start]
+        for level in range(self.levels):
+            level_factor = factor**level
+            self._starts[level, restart] = -(-start // level_factor)
+
+        end = start + count
+        columns = numpy.arange(start, end) % self.capacity
+        self._minima[0][numpy.ix_(rows, columns)] = minima
+        self._maxima[0][numpy.ix_(rows, columns)] = maxima
+        self._end[rows] = end
+
+        for level in range(1, self.levels):
+            level_factor = factor**level
+            new_end = end // level_factor
+            old_ends = numpy.maximum(self._starts[level, rows], start // level_factor)
+            # the rows usually all need the same windows building, so this is usually one pass
+            for old_end in numpy.unique(old_ends):
+                if old_end >= new_end:
+                    continue
+                group = rows[old_ends == old_end]
+                source = numpy.ix_(
+                    group,
+                    numpy.arange(old_end * factor, new_end * factor) % self.capacity,
+                )
+                target = numpy.ix_(
+                    group, numpy.arange(old_end, new_end) % self.capacity
+                )
+                shape = (len(group), new_end - old_end, factor)
+                self._minima[level][target] = (
+                    self._minima[level - 1][source].reshape(shape).min(axis=2)
+                )
+                self._maxima[level][target] = (
+                    self._maxima[level - 1][source].reshape(shape).max(axis=2)
+                )
+
+    def _rows(self, channels):
+        if channels is None:
+            return numpy.arange(len(self._end))
+        rows = numpy.asarray(channels) - self.first_channel
+        if numpy.any((rows < 0) | (rows >= len(self._end))):
+            raise ValueError("Channel outside of cached range")
+        return rows
+
+    def _window_range(self, level, rows) -> Tuple[int, int]:
+        level_factor = self.zoom_factor**level
+        ends = numpy.maximum(self._starts[level, rows], self._end[rows] // level_factor)
+        starts = numpy.maximum(self._starts[level, rows], ends - self.capacity)
+        # rows that have never had any data have a zero end
+        return int(starts.max()), int(ends.min())
+
+    def available(
+        self, level: int = 0, channels: Optional[Sequence[int]] = None
+    ) -> Tuple[int, int]:
+        """The range of samples that are cached for all the given channels.
+
+        Args:
+            level: The zoom level to check.
+            channels: The channels to check. Defaults to all of them.
+
+        Returns:
+            The first sample and the sample after the last one, as ``samples_since_start`` values.
+            These are equal if nothing is available.
+        """
+        start, end = self._window_range(level, self._rows(channels))
+        size = self.level_window_size(level)
+        return start * size, max(start, end) * size
+
+    def get(
+        self,
+        start_sample: int,
+        end_sample: int,
+        max_windows: Optional[int] = None,
+        level: Optional[int] = None,
+        channels: Optional[Sequence[int]] = None,
+    ) -> MinMaxData:
+        """Get the cached data for a range of samples.
+
+        Args:
+            start_sample: The first sample of interest (as a ``samples_since_start`` value).
+            end_sample: The sample after the last one of interest.
+            max_windows: If given (and ``level`` is not), use the finest zoom level that needs no
+                more than this many windows to cover the range. If no level is coarse enough, the
+                coarsest one is used.
+            level: The zoom level to use. Defaults to 0 if ``max_windows`` is not given either.
+            channels: The channels to get data for. Defaults to all of them.
+
+        Returns:
+            The cached data. This is limited to the part of the requested range that is available
+            for all the requested channels, and may be empty.
+        """
+        if level is None:
+            level = 0
+            if max_windows is not None:
+                while (
+                    level < self.levels - 1
+                    and -(-(end_sample - start_sample) // self.level_window_size(level))
+                    > max_windows
+                ):
+                    level += 1
+        rows = self._rows(channels)
+        size = self.level_window_size(level)
+        first, last = self._window_range(level, rows)
+        first = max(first, start_sample // size)
+        last = max(first, min(last, -(-end_sample // size)))
+
+        columns = numpy.arange(first, last) % self.capacity
+        return MinMaxData(
+            channels=rows + self.first_channel,
+            samples_since_start=first * size,
+            window_size=size,
+            minima=self._minima[level][numpy.ix_(rows, columns)],
+            maxima=self._maxima[level][numpy.ix_(rows, columns)],
+        )
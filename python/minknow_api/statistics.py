@@ -0,0 +1,612 @@
+"""
+Helpers for the statistics service
+==================================
+
+The time-series RPCs on the statistics service (``stream_acquisition_output``,
+``stream_duty_time`` and ``stream_writer_output``) start by sending everything collected since the
+start of the acquisition period, and then send updates. If the stream is interrupted, calling the
+RPC again sends the whole history again, which can be a lot of data for a long run.
+
+The functions in this module keep the data they have received in numpy columns (see
+`minknow_api.acquisition_output`), and if the stream fails with a retryable error, they make the
+call again with ``data_selection.start`` set to the most recent bucket they have. The overlapping
+buckets replace the stored ones, so the stored series stays continuous with no duplicates.
+
+Each function is a generator that yields its store every time it is updated, and returns when the
+acquisition period ends:
+
+>>> for store in stream_acquisition_output(connection, run_id, split=split):
+>>>     for filters, series in store.items():
+>>>         print(filters, series["basecalled_pass_bases"][-1])
+
+`FleetAcquisitionOutput` follows the acquisition output of many positions at once (eg: every
+position on a PromethION), following each position from one acquisition period to the next, and
+keeps the totals over all of them up to date.
+"""
+
+import collections
+import functools
+import logging
+import operator
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+import grpc
+import numpy
+
+from . import acquisition_pb2, statistics_pb2
+from ._support import (
+    RetryAttempts,
+    RetryPolicy,
+    is_transient_error,
+    raw_messages,
+)
+from .acquisition_output import (
+    YIELD_COLUMNS,
+    AcquisitionOutputStore,
+    OutputFilter,
+    _filter_key,
+    _TimeSeriesColumns,
+)
+
+__all__ = [
+    "AlignedOutput",
+    "DutyTimeSeries",
+    "FleetAcquisitionOutput",
+    "RESUME_RETRY_POLICY",
+    "WRITER_COLUMNS",
+    "WriterOutputSeries",
+    "is_resumable_error",
+    "stream_acquisition_output",
+    "stream_duty_time",
+    "stream_writer_output",
+]
+
+logger = logging.getLogger(__name__)
+
+
+def is_resumable_error(error: grpc.RpcError) -> bool:
+    """Whether a failed statistics stream is worth resuming.
+
+    This is the `RESUME_RETRY_POLICY` ``should_retry`` function. As well as the transient transport
+    errors that the default `minknow_api.RetryPolicy` retries, this allows ``UNAVAILABLE`` (eg: a
+    dropped connection).
+    """
+    return error.code() == grpc.StatusCode.UNAVAILABLE or is_transient_error(error)
+
+
+#: How the streams in this module are resumed. The attempts are counted from the last message
+#: received, so a long-running stream can be resumed any number of times.
+RESUME_RETRY_POLICY = RetryPolicy(
+    max_attempts=10,
+    initial_backoff=0.5,
+    max_backoff=30.0,
+    should_retry=is_resumable_error,
+)
+
+#: The names of the columns in a `WriterOutputSeries`.
+WRITER_COLUMNS = [
+    field.name for field in acquisition_pb2.AcquisitionWriterSummary.DESCRIPTOR.fields
+]
+_WRITER_GETTERS = [
+    (name, operator.attrgetter("writer_output." + name)) for name in WRITER_COLUMNS
+]
+
+
+class WriterOutputSeries(_TimeSeriesColumns):
+    """The output of ``stream_writer_output``, as columns.
+
+    Attributes:
+        seconds (numpy.ndarray): The time of each snapshot, in seconds since the start of the
+            acquisition period.
+        columns (Dict[str, numpy.ndarray]): An array for each name in `WRITER_COLUMNS`.
+    """
+
+    def __init__(self, capacity: int = 64):
+        super().__init__(
+            {name: numpy.int64 for name in WRITER_COLUMNS}, capacity=capacity
+        )
+
+    @property
+    def seconds(self) -> numpy.ndarray:
+        return self._times[: self._size]
+
+    def update(self, response) -> None:
+        """Add a ``StreamWriterOutputResponse`` message."""
+        snapshots = response.snapshots
+        count = len(snapshots)
+        self._merge(
+            numpy.fromiter((s.seconds for s in snapshots), numpy.uint32, count),
+            {
+                name: numpy.fromiter((getter(s) for s in snapshots), numpy.int64, count)
+                for name, getter in _WRITER_GETTERS
+            },
+        )
+
+
+class DutyTimeSeries(_TimeSeriesColumns):
+    """The output of ``stream_duty_time``, as columns.
+
+    There is a column for the time spent in each channel state (in samples, summed over all the
+    channels), named after the state, and a ``pore_occupancy`` column.
+
+    Attributes:
+        bucket_starts (numpy.ndarray): The start of each bucket, in seconds since the start of the
+            acquisition period.
+        bucket_ends (numpy.ndarray): The end of each bucket (exclusive).
+        columns (Dict[str, numpy.ndarray]): The columns.
+    """
+
+    def __init__(self, capacity: int = 64):
+        super().__init__(
+            {"bucket_end": numpy.uint32, "pore_occupancy": numpy.float32},
+            capacity=capacity,
+        )
+
+    @property
+    def bucket_starts(self) -> numpy.ndarray:
+        return self._times[: self._size]
+
+    @property
+    def bucket_ends(self) -> numpy.ndarray:
+        return self["bucket_end"]
+
+    @property
+    def states(self):
+        """The names of the channel states that have been seen."""
+        return [
+            name
+            for name in self._columns
+            if name not in ("bucket_end", "pore_occupancy")
+        ]
+
+    def update(self, response) -> None:
+        """Add a ``StreamDutyTimeResponse`` message."""
+        ranges = response.bucket_ranges
+        count = len(ranges)
+        values = {
+            "bucket_end": numpy.fromiter((r.end for r in ranges), numpy.uint32, count),
+        }
+        if len(response.pore_occupancy) == count:
+            values["pore_occupancy"] = numpy.array(
+                response.pore_occupancy, numpy.float32
+            )
+        for state, data in response.channel_states.items():
+            values[state] = numpy.array(data.state_times, numpy.uint64)
+        self._merge(
+            numpy.fromiter((r.start for r in ranges), numpy.uint32, count), values
+        )
+
+
+def _resume_stream(
+    connection, method_name, kwargs, resume_start, retry_policy, on_call=None
+):
+    """Yield the messages from a statistics stream, calling it again from ``resume_start()`` if it
+    fails with an error ``retry_policy`` allows.
+
+    ``on_call`` is called with each call that is made, so that another thread can cancel it.
+    """
+    method = getattr(connection.statistics, method_name)
+    name = "minknow_api.statistics.StatisticsService." + method_name
+    selection = kwargs.pop("data_selection", None)
+    if isinstance(selection, dict):
+        selection = statistics_pb2.DataSelection(**selection)
+
+    attempts = RetryAttempts(retry_policy, None, name)
+    while True:
+        request_selection = statistics_pb2.DataSelection()
+        if selection is not None:
+            request_selection.CopyFrom(selection)
+        start = resume_start()
+        if start is not None and start > request_selection.start:
+            request_selection.start = start
+        if attempts.attempt > 1:
+            logger.info("Resuming %s from %s seconds", method_name, start)
+
+        call = raw_messages(method(data_selection=request_selection, **kwargs))
+        if on_call is not None:
+            on_call(call)
+        try:
+            for message in call:
+                attempts = RetryAttempts(retry_policy, None, name)
+                yield message
+            return
+        except grpc.RpcError as e:
+            delay = attempts.retry_delay(e)
+            if delay is None:
+                raise
+        finally:
+            call.cancel()
+        time.sleep(delay)
+
+
+def _output_resume_start(store):
+    latest = [series.seconds[-1] for _, series in store.items() if len(series)]
+    return int(min(latest)) if latest else None
+
+
+def stream_acquisition_output(
+    connection,
+    acquisition_run_id: str,
+    store: Optional[AcquisitionOutputStore] = None,
+    retry_policy: RetryPolicy = RESUME_RETRY_POLICY,
+    **kwargs
+) -> Iterator[AcquisitionOutputStore]:
+    """Follow ``stream_acquisition_output``, resuming it if it fails.
+
+    When the stream is resumed, it starts from the most recent snapshot that every filter group
+    has, so no group misses any updates.
+
+    Args:
+        connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
+        acquisition_run_id: The acquisition period to get the output of.
+        store: The store to add to. If it already has data (eg: from an earlier call), the first
+            call starts from that data too.
+        retry_policy: Which errors to resume after, and how long to wait first.
+        **kwargs: Other arguments to ``stream_acquisition_output`` (eg: ``data_selection`` and
+            ``split``).
+
+    Yields:
+        AcquisitionOutputStore: The store, after each message has been added to it.
+    """
+    if store is None:
+        store = AcquisitionOutputStore()
+    kwargs["acquisition_run_id"] = acquisition_run_id
+    for response in _resume_stream(
+        connection,
+        "stream_acquisition_output",
+        kwargs,
+        functools.partial(_output_resume_start, store),
+        retry_policy,
+    ):
+        store.update(response)
+        yield store
+
+
+def stream_duty_time(
+    connection,
+    acquisition_run_id: str,
+    series: Optional[DutyTimeSeries] = None,
+    retry_policy: RetryPolicy = RESUME_RETRY_POLICY,
+    **kwargs
+) -> Iterator[DutyTimeSeries]:
+    """Follow ``stream_duty_time``, resuming it from the most recent bucket if it fails.
+
+    Args:
+        connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
+        acquisition_run_id: The acquisition period to get the duty time of.
+        series: The series to add to. Defaults to a new one.
+        retry_policy: Which errors to resume after, and how long to wait first.
+        **kwargs: Other arguments to ``stream_duty_time`` (ie: ``data_selection``).
+
+    Yields:
+        DutyTimeSeries: The series, after each message has been added to it.
+    """
+    if series is None:
+        series = DutyTimeSeries()
+
+    def resume_start():
+        return int(series.bucket_starts[-1]) if len(series) else None
+
+    kwargs["acquisition_run_id"] = acquisition_run_id
+    for response in _resume_stream(
+        connection, "stream_duty_time", kwargs, resume_start, retry_policy
+    ):
+        series.update(response)
+        yield series
+
+
+def stream_writer_output(
+    connection,
+    acquisition_run_id: str,
+    series: Optional[WriterOutputSeries] = None,
+    retry_policy: RetryPolicy = RESUME_RETRY_POLICY,
+    **kwargs
+) -> Iterator[WriterOutputSeries]:
+    """Follow ``stream_writer_output``, resuming it from the most recent snapshot if it fails.
+
+    Args:
+        connection (minknow_api.Connection): Connection to a MinKNOW flow cell position.
+        acquisition_run_id: The acquisition period to get the writer output of.
+        series: The series to add to. Defaults to a new one.
+        retry_policy: Which errors to resume after, and how long to wait first.
+        **kwargs: Other arguments to ``stream_writer_output`` (ie: ``data_selection``).
+
+    Yields:
+        WriterOutputSeries: The series, after each message has been added to it.
+    """
+    if series is None:
+        series = WriterOutputSeries()
+
+    def resume_start():
+        return int(series.seconds[-1]) if len(series) else None
+
+    kwargs["acquisition_run_id"] = acquisition_run_id
+    for response in _resume_stream(
+        connection, "stream_writer_output", kwargs, resume_start, retry_policy
+    ):
+        series.update(response)
+        yield series
+
+
+AlignedOutput = collections.namedtuple("AlignedOutput", ["times", "columns"])
+AlignedOutput.__doc__ = """The acquisition output of several positions, on a common time grid.
+
+Attributes:
+    times (numpy.ndarray): The time of each row, in seconds since the epoch.
+    columns (Dict[str, numpy.ndarray]): The sum over all the positions of each column in
+        `minknow_api.acquisition_output.YIELD_COLUMNS`, as it was at each time.
+"""
+
+
+class _PositionOutput(object):
+    def __init__(self, connection):
+        self.connection = connection
+        self.run_id: Optional[str] = None
+        # when the acquisition period started, in seconds since the epoch
+        self.start_time = 0.0
+        self.store = AcquisitionOutputStore()
+        # the most recent snapshot for each filter group, as a vector of YIELD_COLUMNS values
+        self.latest: Dict[Tuple[OutputFilter, ...], numpy.ndarray] = {}
+        self.watch_call = None
+        self.stream_call = None
+        self.thread: Optional[threading.Thread] = None
+
+
+class FleetAcquisitionOutput(object):
+    """Follows ``stream_acquisition_output`` on many flow cell positions at once.
+
+    Each position gets a background thread that watches for acquisition periods with
+    ``watch_current_acquisition_run``, and streams the output of each one into an
+    `minknow_api.acquisition_output.AcquisitionOutputStore` (resuming the stream if it fails, as
+    `stream_acquisition_output` does). When a position starts a new acquisition period, the output
+    of its previous one is dropped; a position that has stopped acquiring keeps contributing the
+    final output of its last acquisition period.
+
+    The running totals over all the positions (see `totals`) are updated with each message, by
+    replacing each changed filter group's contribution, so the cost of an update does not depend
+    on the number of positions or how long they have been running. `aligned` puts the positions'
+    time series onto a common wall-clock grid, which is only done when it is called.
+
+    >>> positions = {pos.name: pos.connect() for pos in manager.flow_cell_positions()}
+    >>> split = statistics_pb2.AcquisitionOutputSplit(barcode_name=True)
+    >>> with FleetAcquisitionOutput(positions, split=split) as output:
+    >>>     while True:
+    >>>         for filters, totals in output.totals().items():
+    >>>             print(filters, totals["basecalled_pass_bases"])
+    >>>         time.sleep(60)
+
+    Args:
+        connections: A connection to each position, keyed by a name for the position.
+        retry_policy: Which errors to resume the output streams after.
+        on_update (callable, optional): Called with the position name and the keys of the filter
+            groups that changed, from the position's thread, after each message is applied.
+        **kwargs: Other arguments to ``stream_acquisition_output`` (eg: ``split``).
+    """
+
+    def __init__(
+        self,
+        connections,
+        retry_policy: RetryPolicy = RESUME_RETRY_POLICY,
+        on_update=None,
+        **kwargs
+    ):
+        self._positions = {
+            name: _PositionOutput(connection)
+            for name, connection in connections.items()
+        }
+        self._retry_policy = retry_policy
+        self._on_update = on_update
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+        self._totals: Dict[Tuple[OutputFilter, ...], numpy.ndarray] = {}
+        self._errors: Dict[str, grpc.RpcError] = {}
+        self._started = False
+        self._stopping = False
+
+    def __enter__(self) -> "FleetAcquisitionOutput":
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self) -> None:
+        """Start following every position."""
+        if self._started:
+            raise RuntimeError("FleetAcquisitionOutput has already been started")
+        self._started = True
+        for name, position in self._positions.items():
+            position.thread = threading.Thread(
+                target=self._follow,
+                args=(name, position),
+                name="minknow_api.statistics fleet output ({})".format(name),
+                daemon=True,
+            )
+            position.thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop following the positions.
+
+        Args:
+            timeout: How long to wait for each position's thread to finish.
+        """
+        with self._lock:
+            self._stopping = True
+            calls = [
+                call
+                for p in self._positions.values()
+                for call in (p.watch_call, p.stream_call)
+                if call is not None
+            ]
+        for call in calls:
+            call.cancel()
+        self.wait(timeout)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for every position's thread to finish (eg: because its calls have ended).
+
+        Returns:
+            True if all the threads have finished.
+        """
+        for position in self._positions.values():
+            if position.thread is not None:
+                position.thread.join(timeout)
+        return not self.is_running
+
+    @property
+    def is_running(self) -> bool:
+        """Whether any of the positions are still being followed."""
+        return any(
+            p.thread is not None and p.thread.is_alive()
+            for p in self._positions.values()
+        )
+
+    @property
+    def errors(self) -> Dict[str, grpc.RpcError]:
+        """The errors that stopped positions being followed, keyed by position name."""
+        with self._lock:
+            return dict(self._errors)
+
+    def run_ids(self) -> Dict[str, Optional[str]]:
+        """The acquisition period being followed on each position (None if there has not been one
+        yet)."""
+        with self._lock:
+            return {name: p.run_id for name, p in self._positions.items()}
+
+    def totals(self) -> Dict[Tuple[OutputFilter, ...], Dict[str, float]]:
+        """The most recent output of each filter group, summed over all the positions.
+
+        Returns:
+            The value of each column in `minknow_api.acquisition_output.YIELD_COLUMNS`, keyed by
+            filter group (a tuple of `minknow_api.acquisition_output.OutputFilter` objects).
+        """
+        with self._lock:
+            totals = {key: values.tolist() for key, values in self._totals.items()}
+        return {key: dict(zip(YIELD_COLUMNS, values)) for key, values in totals.items()}
+
+    def aligned(
+        self, interval: float = 60.0
+    ) -> Dict[Tuple[OutputFilter, ...], AlignedOutput]:
+        """The output of each filter group over time, summed over all the positions.
+
+        Each position's snapshots are placed in wall-clock time using the start time of its
+        acquisition period, and a position contributes its most recent snapshot at or before each
+        time on the grid (or nothing, before its first snapshot).
+
+        Args:
+            interval: The time between rows, in seconds.
+
+        Returns:
+            An `AlignedOutput` for each filter group. The times are multiples of ``interval``,
+            covering all the positions' snapshots.
+        """
+        series = []
+        with self._lock:
+            for position in self._positions.values():
+                for key, s in position.store.items():
+                    if len(s):
+                        series.append(
+                            (
+                                key,
+                                position.start_time + s.seconds,
+                                numpy.stack([s[name] for name in YIELD_COLUMNS]),
+                            )
+                        )
+        if not series:
+            return {}
+
+        first = min(times[0] for _, times, _ in series)
+        last = max(times[-1] for _, times, _ in series)
+        first = numpy.floor(first / interval) * interval
+        times = first + interval * numpy.arange(
+            int(numpy.ceil((last - first) / interval)) + 1
+        )
+
+        sums = {}
+        for key, snapshot_times, values in series:
+            # column 0 is zeros, for grid times before the first snapshot
+            padded = numpy.zeros((len(YIELD_COLUMNS), values.shape[1] + 1))
+            padded[:, 1:] = values
+            rows = numpy.searchsorted(snapshot_times, times, side="right")
+            total = sums.get(key)
+            if total is None:
+                sums[key] = padded[:, rows]
+            else:
+                total += padded[:, rows]
+        return {
+            key: AlignedOutput(times, dict(zip(YIELD_COLUMNS, total)))
+            for key, total in sums.items()
+        }
+
+    def _start_run(self, position, info) -> None:
+        with self._lock:
+            for key, latest in position.latest.items():
+                self._totals[key] -= latest
+            position.run_id = info.run_id
+            if info.HasField("start_time"):
+                position.start_time = info.start_time.ToNanoseconds() / 1e9
+            else:
+                position.start_time = time.time()
+            position.store = AcquisitionOutputStore()
+            position.latest = {}
+
+    def _apply(self, position, response):
+        with self._lock:
+            position.store.update(response)
+            changed = []
+            for group in response.snapshots:
+                key = _filter_key(group.filtering)
+                series = position.store[key]
+                if not len(series):
+                    continue
+                latest = numpy.array(
+                    [series[name][-1] for name in YIELD_COLUMNS], numpy.float64
+                )
+                total = self._totals.get(key)
+                if total is None:
+                    self._totals[key] = latest.copy()
+                else:
+                    total += latest - position.latest.get(key, 0)
+                position.latest[key] = latest
+                changed.append(key)
+        return changed
+
+    def _set_call(self, position, attr, call):
+        with self._lock:
+            setattr(position, attr, call)
+            if not self._stopping:
+                return
+        call.cancel()
+
+    def _follow(self, name, position):
+        try:
+            watch = raw_messages(
+                position.connection.acquisition.watch_current_acquisition_run()
+            )
+            self._set_call(position, "watch_call", watch)
+            for info in watch:
+                if not info.run_id or info.run_id == position.run_id:
+                    continue
+                logger.info("Following acquisition %s on %s", info.run_id, name)
+                self._start_run(position, info)
+                kwargs = dict(self._kwargs, acquisition_run_id=info.run_id)
+                for response in _resume_stream(
+                    position.connection,
+                    "stream_acquisition_output",
+                    kwargs,
+                    functools.partial(_output_resume_start, position.store),
+                    self._retry_policy,
+                    on_call=functools.partial(self._set_call, position, "stream_call"),
+                ):
+                    changed = self._apply(position, response)
+                    if self._on_update:
+                        self._on_update(name, changed)
+        except grpc.RpcError as e:
+            with self._lock:
+                if not self._stopping:
+                    logger.warning(
+                        "Stopped following %s: %s", name, e.details(), exc_info=True
+                    )
+                    self._errors[name] = e
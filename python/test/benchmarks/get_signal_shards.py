@@ -0,0 +1,127 @@
+"""Benchmark sharded `minknow_api.data.get_signal` calls against a mock server.
+
+Run from the ``python`` directory:
+
+    python test/benchmarks/get_signal_shards.py --channels 3000 --samples 40000
+
+This reports the throughput of `get_signal` for a range of shard counts. The mock server runs in a
+separate process and sends pre-generated data. Note that the mock server is itself written in
+Python, so it may become the bottleneck before the client does.
+"""
+
+import argparse
+import multiprocessing
+import sys
+import time
+from pathlib import Path
+
+import grpc
+import numpy
+
+TEST_DIR = Path(__file__).resolve().parent.parent
+# the package itself and the mock server, so this runs without minknow_api being installed
+sys.path[:0] = [str(TEST_DIR.parent), str(TEST_DIR)]
+
+from minknow_api import Connection, data_pb2, data_pb2_grpc  # noqa: E402
+from minknow_api.data import get_signal  # noqa: E402
+from mock_server import Server, InstanceServicer, load_test_ca  # noqa: E402
+
+DataType = data_pb2.GetDataTypesResponse.DataType
+
+
+class BenchmarkDataServicer(data_pb2_grpc.DataServiceServicer):
+    """Streams the same pre-generated chunk of signal for every channel, as MinKNOW would (ie:
+    splitting each time period into messages of at most ``max_message_size`` bytes).
+    """
+
+    def __init__(self, chunk_samples, max_message_size=1024 * 1024):
+        self.chunk_samples = chunk_samples
+        self.max_message_size = max_message_size
+        self.chunk = numpy.random.randint(
+            0, 2000, chunk_samples, dtype=numpy.int16
+        ).tobytes()
+
+    def get_data_types(self, _request, _context):
+        return data_pb2.GetDataTypesResponse(
+            uncalibrated_signal=DataType(type=DataType.SIGNED_INTEGER, size=2),
+            calibrated_signal=DataType(type=DataType.FLOATING_POINT, size=4),
+            bias_voltages=DataType(type=DataType.SIGNED_INTEGER, size=2),
+        )
+
+    def get_signal_bytes(self, request, context):
+        channel_count = request.last_channel + 1 - request.first_channel
+        channels_per_message = max(1, self.max_message_size // len(self.chunk))
+        sent = 0
+        while context.is_active() and (not request.samples or sent < request.samples):
+            for skipped in range(0, channel_count, channels_per_message):
+                count = min(channels_per_message, channel_count - skipped)
+                msg = data_pb2.GetSignalBytesResponse(
+                    samples_since_start=sent,
+                    skipped_channels=skipped,
+                )
+                for _ in range(count):
+                    msg.channels.add(data=self.chunk)
+                yield msg
+            sent += self.chunk_samples
+
+
+def run_server(chunk_samples, max_workers, port_queue, stop_event):
+    """Run the mock server in its own process, so it doesn't compete with the client for the GIL."""
+    servicer = BenchmarkDataServicer(chunk_samples)
+    with Server([InstanceServicer(), servicer], max_workers=max_workers) as server:
+        port_queue.put(server.port)
+        stop_event.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--channels", type=int, default=3000)
+    parser.add_argument("--samples", type=int, default=40000)
+    parser.add_argument("--chunk-samples", type=int, default=4000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    port_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    server_process = multiprocessing.Process(
+        target=run_server,
+        args=(args.chunk_samples, max(args.shards) + 2, port_queue, stop_event),
+    )
+    server_process.start()
+    try:
+        port = port_queue.get(timeout=30)
+        with Connection(
+            port=port, credentials=grpc.ssl_channel_credentials(load_test_ca())
+        ) as connection:
+            total_bytes = args.channels * args.samples * 2
+            print(
+                "{} channels x {} samples ({:.1f} MB)".format(
+                    args.channels, args.samples, total_bytes / 1e6
+                )
+            )
+            for shards in args.shards:
+                best = None
+                for _ in range(args.repeats):
+                    start = time.perf_counter()
+                    get_signal(
+                        connection,
+                        samples=args.samples,
+                        first_channel=1,
+                        last_channel=args.channels,
+                        shards=shards,
+                    )
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                print(
+                    "shards={:<3} {:7.3f} s  {:8.1f} MB/s".format(
+                        shards, best, total_bytes / best / 1e6
+                    )
+                )
+    finally:
+        stop_event.set()
+        server_process.join()
+
+
+if __name__ == "__main__":
+    main()
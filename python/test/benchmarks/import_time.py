@@ -0,0 +1,67 @@
+"""Benchmark the start-up cost of `minknow_api`.
+
+Run from the ``python`` directory:
+
+    python test/benchmarks/import_time.py --repeats 10
+
+Each scenario is run in a fresh interpreter. "all services" touches every service module, which is
+what ``import minknow_api`` used to do before service modules were loaded on first use.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PYTHON_DIR = Path(__file__).resolve().parent.parent.parent
+
+SCENARIOS = [
+    ("import minknow_api", "import minknow_api"),
+    (
+        "import + data service",
+        "import minknow_api\nminknow_api.data_service",
+    ),
+    (
+        "import + all services",
+        "import minknow_api\n"
+        "for name in minknow_api._services:\n"
+        "    getattr(minknow_api, name + '_service', None)",
+    ),
+]
+
+TIMER = """
+import time
+_start = time.perf_counter()
+{code}
+print(time.perf_counter() - _start)
+"""
+
+
+def run_scenario(code):
+    output = subprocess.check_output(
+        [sys.executable, "-c", TIMER.format(code=code)], cwd=PYTHON_DIR
+    )
+    return float(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    # make sure the bytecode caches are populated before timing anything
+    for _, code in SCENARIOS:
+        run_scenario(code)
+
+    for name, code in SCENARIOS:
+        times = [run_scenario(code) for _ in range(args.repeats)]
+        print(
+            "{:<24} median {:6.1f} ms  min {:6.1f} ms".format(
+                name, statistics.median(times) * 1000, min(times) * 1000
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
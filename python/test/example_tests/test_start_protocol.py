@@ -1083,7 +1083,7 @@ def test_output_start_protocol():
             assert protocol.target_run_until_criteria == TEST_RUN_UNTIL_CRITERIA
 
 
-def test_analysis_workflows_start_protocol():
+def test_analysis_workflows_start_protocol(tmp_path):
     with SequencingPositionTestServer() as sequencing_position:
         manager_servicer = ManagerServicer(
             [
@@ -1109,7 +1109,7 @@ def test_analysis_workflows_start_protocol():
             sequencing_position.set_protocol_list([TEST_PROTOCOL])
 
             # test for file not found error
-            filepath = Path("test.json")
+            filepath = tmp_path / "test.json"
             print(str(filepath))
             assert (
                 run_start_protocol_example(
@@ -0,0 +1,100 @@
+import grpc
+import numpy
+import pytest
+
+from minknow_api import Connection, statistics_pb2, statistics_pb2_grpc
+from minknow_api.acquisition_output import (
+    YIELD_COLUMNS,
+    AcquisitionOutputStore,
+    OutputFilter,
+    collect_acquisition_output,
+)
+from mock_server import Server, InstanceServicer, load_test_ca
+
+Response = statistics_pb2.StreamAcquisitionOutputResponse
+
+
+def snapshot(seconds, reads):
+    return statistics_pb2.AcquisitionOutputSnapshot(
+        seconds=seconds,
+        yield_summary={
+            "read_count": reads,
+            "fraction_basecalled": 0.5,
+            "basecalled_pass_reads_split": {"simplex": reads // 2},
+        },
+    )
+
+
+def group(barcode, *snapshots):
+    return Response.FilteredSnapshots(
+        filtering=[statistics_pb2.AcquisitionOutputKey(barcode_name=barcode)],
+        snapshots=snapshots,
+    )
+
+
+class StatisticsServicer(statistics_pb2_grpc.StatisticsServiceServicer):
+    def __init__(self):
+        self.requests = []
+
+    def stream_acquisition_output(self, request, _context):
+        self.requests.append(request)
+        yield Response(
+            snapshots=[
+                group("barcode01", snapshot(60, 10), snapshot(120, 20)),
+                group("barcode02", snapshot(60, 5)),
+            ]
+        )
+        # the last snapshot is updated, and a new one is started
+        yield Response(
+            snapshots=[group("barcode01", snapshot(120, 25), snapshot(180, 30))]
+        )
+
+
+def test_store_appends_and_updates_snapshots():
+    store = AcquisitionOutputStore()
+    for i in range(100):
+        store.update(
+            Response(
+                snapshots=[
+                    group("barcode01", snapshot(i * 10, i), snapshot(i * 10 + 10, i))
+                ]
+            )
+        )
+
+    (key,) = list(store)
+    assert len(key) == 1 and isinstance(key[0], OutputFilter)
+    assert key[0].barcode_name == "barcode01"
+    series = store[key]
+    assert len(series) == 101
+    numpy.testing.assert_array_equal(series.seconds, numpy.arange(0, 1010, 10))
+    numpy.testing.assert_array_equal(series["read_count"][:3], [0, 1, 2])
+    assert series["read_count"][-1] == 99
+    assert set(series.columns) == set(YIELD_COLUMNS)
+    assert series["fraction_basecalled"].dtype == numpy.float32
+
+
+def test_collect_acquisition_output():
+    servicer = StatisticsServicer()
+    updates = []
+    with Server([InstanceServicer(), servicer]) as server:
+        with Connection(
+            port=server.port, credentials=grpc.ssl_channel_credentials(load_test_ca())
+        ) as connection:
+            store = collect_acquisition_output(
+                connection,
+                "run-1",
+                on_update=lambda store: updates.append(len(store)),
+                split=statistics_pb2.AcquisitionOutputSplit(barcode_name=True),
+            )
+
+    assert servicer.requests[0].split.barcode_name
+    assert updates == [2, 2]
+    ((_, series),) = store.find(barcode_name="barcode01")
+    numpy.testing.assert_array_equal(series.seconds, [60, 120, 180])
+    numpy.testing.assert_array_equal(series["read_count"], [10, 25, 30])
+    numpy.testing.assert_array_equal(
+        series["basecalled_pass_reads_split_simplex"], [5, 12, 15]
+    )
+    assert len(store.find(barcode_name="barcode02")[0][1]) == 1
+    with pytest.raises(ValueError):
+        store.find(barcode="barcode01")
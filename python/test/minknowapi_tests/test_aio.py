@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+import grpc
+import pytest
+
+from minknow_api import aio, data_pb2, data_pb2_grpc, manager_pb2
+from minknow_api._support import ArgumentError
+from mock_server import Server, InstanceServicer, ManagerServicer, load_test_ca
+
+
+class DataServicer(data_pb2_grpc.DataServiceServicer):
+    """Streams one message per sample, and responds to every live reads action."""
+
+    def get_signal_bytes(self, request, context):
+        for i in range(request.samples):
+            yield data_pb2.GetSignalBytesResponse(samples_since_start=i)
+        # keep the call open until the client goes away
+        while context.is_active():
+            time.sleep(0.01)
+
+    def get_live_reads(self, request_iterator, context):
+        for request in request_iterator:
+            yield data_pb2.GetLiveReadsResponse(
+                action_responses=[
+                    data_pb2.GetLiveReadsResponse.ActionResponse(
+                        action_id=action.action_id
+                    )
+                    for action in request.actions.actions
+                ]
+            )
+
+
+@pytest.fixture
+def server():
+    with Server([InstanceServicer(), DataServicer()], max_workers=10) as server:
+        yield server
+
+
+def connection(server):
+    return aio.Connection(
+        port=server.port, credentials=grpc.ssl_channel_credentials(load_test_ca())
+    )
+
+
+def test_unary_calls_are_awaitable(server):
+    async def run():
+        async with connection(server) as conn:
+            version = await conn.instance.get_version_info()
+            with pytest.raises(ArgumentError):
+                await conn.data.get_channel_states(first_channel=1)
+            return version
+
+    assert asyncio.run(run()).minknow.full == "4.0.0"
+
+
+def test_streaming_calls_are_async_iterators(server):
+    async def first_messages(conn, count):
+        stream = conn.data.get_signal_bytes(first_channel=1, last_channel=1, samples=10)
+        messages = []
+        async for msg in stream:
+            messages.append(msg.samples_since_start)
+            if len(messages) == count:
+                stream.cancel()
+        return messages
+
+    async def run():
+        async with connection(server) as conn:
+            # several streams driven by the one event loop
+            return await asyncio.gather(*(first_messages(conn, n) for n in (2, 3, 4)))
+
+    assert asyncio.run(run()) == [[0, 1], [0, 1, 2], [0, 1, 2, 3]]
+
+
+def test_bidirectional_calls_accept_async_iterators(server):
+    Request = data_pb2.GetLiveReadsRequest
+
+    async def requests():
+        yield Request(setup=Request.StreamSetup(first_channel=1, last_channel=4))
+        for action_id in ("a", "b"):
+            yield Request(
+                actions=Request.Actions(
+                    actions=[Request.Action(action_id=action_id, channel=1, id="r")]
+                )
+            )
+
+    async def run():
+        async with connection(server) as conn:
+            return [
+                [r.action_id for r in msg.action_responses]
+                async for msg in conn.data.get_live_reads(requests())
+            ]
+
+    assert asyncio.run(run()) == [[], ["a"], ["b"]]
+
+
+def test_manager_connects_to_positions(server):
+    manager_servicer = ManagerServicer(
+        positions=[
+            manager_pb2.FlowCellPosition(
+                name="MN12345",
+                state=manager_pb2.FlowCellPosition.State.STATE_RUNNING,
+                rpc_ports=manager_pb2.FlowCellPosition.RpcPorts(secure=server.port),
+            ),
+        ]
+    )
+
+    async def run():
+        async with aio.Manager(port=manager_server.port) as manager:
+            assert manager.core_version == "4.0.0"
+            [position] = await manager.flow_cell_positions()
+            assert position.name == "MN12345"
+            async with position.connect() as conn:
+                return await conn.instance.get_version_info()
+
+    with Server([manager_servicer]) as manager_server:
+        assert asyncio.run(run()).minknow.full == "4.0.0"
@@ -0,0 +1,169 @@
+import threading
+
+import grpc
+import pytest
+
+from minknow_api import Connection, manager_pb2
+from minknow_api.channel_pool import (
+    DEFAULT_CHANNEL_POOL,
+    ChannelPool,
+    ChannelPoolStats,
+)
+from minknow_api.manager import Manager
+from mock_server import Server, InstanceServicer, ManagerServicer, load_test_ca
+
+
+class CountingInstanceServicer(InstanceServicer):
+    def __init__(self):
+        self.version_calls = 0
+
+    def get_version_info(self, request, context):
+        self.version_calls += 1
+        return super().get_version_info(request, context)
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def servicer():
+    return CountingInstanceServicer()
+
+
+@pytest.fixture
+def server(servicer):
+    with Server([servicer]) as server:
+        yield server
+
+
+@pytest.fixture
+def credentials():
+    return grpc.ssl_channel_credentials(load_test_ca())
+
+
+def test_connections_share_channel(server, servicer, credentials):
+    pool = ChannelPool()
+
+    with Connection(port=server.port, credentials=credentials, channel_pool=pool) as a:
+        with Connection(
+            port=server.port, credentials=credentials, channel_pool=pool
+        ) as b:
+            assert a.channel is b.channel
+            assert b.instance.get_version_info().minknow.full == "4.0.0"
+            assert pool.get_stats() == ChannelPoolStats(
+                hits=1, misses=1, evictions=0, open_channels=1, in_use=1
+            )
+
+    # only the first connection had to check that MinKNOW was reachable
+    assert servicer.version_calls == 2
+    assert pool.get_stats().in_use == 0
+
+    # different credentials get a different channel
+    other_credentials = grpc.ssl_channel_credentials(load_test_ca())
+    with Connection(
+        port=server.port, credentials=other_credentials, channel_pool=pool
+    ) as c:
+        assert c.channel is not a.channel
+    assert pool.get_stats().misses == 2
+
+
+def test_idle_channels_are_evicted(server, credentials):
+    clock = FakeClock()
+    pool = ChannelPool(idle_timeout=10, clock=clock)
+
+    with Connection(port=server.port, credentials=credentials, channel_pool=pool):
+        pass
+    clock.now = 5
+    with Connection(port=server.port, credentials=credentials, channel_pool=pool):
+        pass
+    assert pool.get_stats() == ChannelPoolStats(
+        hits=1, misses=1, evictions=0, open_channels=1, in_use=0
+    )
+
+    clock.now = 15.1
+    with Connection(port=server.port, credentials=credentials, channel_pool=pool):
+        assert pool.get_stats() == ChannelPoolStats(
+            hits=1, misses=2, evictions=1, open_channels=1, in_use=1
+        )
+
+    pool.clear()
+    assert pool.get_stats().open_channels == 0
+
+
+def test_unreachable_channels_are_not_kept(credentials):
+    pool = ChannelPool()
+    with Server([]) as server:
+        # nothing implements get_version_info
+        with pytest.raises(grpc.RpcError):
+            Connection(port=server.port, credentials=credentials, channel_pool=pool)
+    assert pool.get_stats() == ChannelPoolStats(
+        hits=0, misses=1, evictions=1, open_channels=0, in_use=0
+    )
+
+
+@pytest.mark.parametrize("works", [True, False])
+def test_unchecked_channels_are_not_shared(credentials, works):
+    pool = ChannelPool()
+    channel, reused = pool.acquire("localhost:1", credentials)
+    assert not reused
+
+    results = []
+    waiter = threading.Thread(
+        target=lambda: results.append(pool.acquire("localhost:1", credentials))
+    )
+    waiter.start()
+    waiter.join(0.2)
+    # waiting for the first caller to check the channel
+    assert waiter.is_alive()
+
+    if works:
+        pool.confirm(channel)
+    else:
+        pool.release(channel, discard=True)
+    waiter.join(5)
+    [(other_channel, other_reused)] = results
+    assert (other_channel is channel) == works
+    assert other_reused == works
+    pool.clear()
+
+
+def test_unclosed_connections_release_channel(server, credentials):
+    pool = ChannelPool()
+    Connection(port=server.port, credentials=credentials, channel_pool=pool)
+    assert pool.get_stats().in_use == 0
+
+
+def test_flow_cell_positions_share_channels(server, servicer):
+    manager_servicer = ManagerServicer(
+        positions=[
+            manager_pb2.FlowCellPosition(
+                name="MN12345",
+                state=manager_pb2.FlowCellPosition.State.STATE_RUNNING,
+                rpc_ports=manager_pb2.FlowCellPosition.RpcPorts(secure=server.port),
+            ),
+        ]
+    )
+    pool = ChannelPool()
+
+    with Server([manager_servicer]) as manager_server:
+        manager = Manager(port=manager_server.port)
+        for _ in range(3):
+            [position] = manager.flow_cell_positions()
+            with position.connect(channel_pool=pool) as conn:
+                assert conn.instance.get_version_info().minknow.full == "4.0.0"
+        assert pool.get_stats().hits == 2
+        assert pool.get_stats().misses == 1
+        assert servicer.version_calls == 4
+
+        # connect_to uses the default pool
+        hits = DEFAULT_CHANNEL_POOL.get_stats().hits
+        with manager.connect_to("MN12345"):
+            pass
+        with manager.connect_to("MN12345"):
+            pass
+        assert DEFAULT_CHANNEL_POOL.get_stats().hits == hits + 1
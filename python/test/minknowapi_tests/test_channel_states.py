@@ -0,0 +1,154 @@
+import queue
+
+import grpc
+import numpy
+import pytest
+
+from minknow_api import (
+    Connection,
+    analysis_configuration_pb2,
+    analysis_configuration_pb2_grpc,
+    data_pb2,
+    data_pb2_grpc,
+)
+from minknow_api.channel_states import UNKNOWN_STATE, ChannelStateTracker
+from mock_server import Server, InstanceServicer, load_test_ca
+
+Desc = analysis_configuration_pb2.GetChannelStatesDescResponse
+ChannelStateData = data_pb2.GetChannelStatesResponse.ChannelStateData
+
+PORE, STRAND, UNAVAILABLE = 1, 2, 201
+
+
+class AnalysisConfigurationServicer(
+    analysis_configuration_pb2_grpc.AnalysisConfigurationServiceServicer
+):
+    def get_channel_states_desc(self, _request, _context):
+        return Desc(
+            groups=[
+                Desc.Group(
+                    name="sequencing",
+                    states=[
+                        Desc.ChannelState(id=PORE, name="pore"),
+                        Desc.ChannelState(id=STRAND, name="strand"),
+                    ],
+                ),
+                Desc.Group(
+                    name="other",
+                    states=[Desc.ChannelState(id=UNAVAILABLE, name="unavailable")],
+                ),
+            ]
+        )
+
+
+class DataServicer(data_pb2_grpc.DataServiceServicer):
+    """Sends each list of (channel, state id) pairs put in ``updates`` as a message."""
+
+    def __init__(self):
+        self.updates = queue.Queue()
+        self.requests = []
+
+    def get_channel_states(self, request, context):
+        self.requests.append(request)
+        while context.is_active():
+            try:
+                update = self.updates.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            yield data_pb2.GetChannelStatesResponse(
+                channel_states=[
+                    ChannelStateData(
+                        channel=channel, state_id=state, acquisition_raw_index=i
+                    )
+                    for i, (channel, state) in enumerate(update)
+                ]
+            )
+
+
+@pytest.fixture
+def data_servicer():
+    return DataServicer()
+
+
+@pytest.fixture
+def connection(data_servicer):
+    with Server(
+        [InstanceServicer(), AnalysisConfigurationServicer(), data_servicer]
+    ) as server:
+        with Connection(
+            port=server.port, credentials=grpc.ssl_channel_credentials(load_test_ca())
+        ) as conn:
+            yield conn
+
+
+def test_tracker_follows_channel_states(connection, data_servicer):
+    tracker = ChannelStateTracker(
+        connection, first_channel=1, last_channel=4, heartbeat=1.5
+    )
+    assert tracker.state_names == {
+        PORE: "pore",
+        STRAND: "strand",
+        UNAVAILABLE: "unavailable",
+    }
+
+    with tracker:
+        data_servicer.updates.put([(1, PORE), (2, PORE), (3, UNAVAILABLE)])
+        assert tracker.wait_until_ready(timeout=5)
+        request = data_servicer.requests[0]
+        assert request.use_channel_states_ids.value
+        assert request.heartbeat.ToNanoseconds() == 1500000000
+
+        assert tracker.count("pore") == 2
+        assert tracker.counts() == {"pore": 2, "unavailable": 1}
+        assert tracker.state(4) is None
+        numpy.testing.assert_array_equal(
+            tracker.get_states(), [PORE, PORE, UNAVAILABLE, UNKNOWN_STATE]
+        )
+
+        # apply the next message directly, rather than waiting for the stream
+        tracker.update(
+            data_pb2.GetChannelStatesResponse(
+                channel_states=[
+                    ChannelStateData(channel=1, state_id=STRAND),
+                    ChannelStateData(channel=1, state_id=PORE),
+                    ChannelStateData(channel=4, state_id=STRAND),
+                    ChannelStateData(channel=2, state_id=PORE),  # no change
+                    ChannelStateData(channel=9, state_id=PORE),  # not tracked
+                ]
+            )
+        )
+
+    assert tracker.count("pore") == 2
+    assert tracker.count("strand") == 1
+    assert tracker.count("missing") == 0
+    assert tracker.state(4) == "strand"
+    numpy.testing.assert_array_equal(tracker.channels_in("pore"), [1, 2])
+
+    transitions = tracker.get_transitions()
+    assert list(zip(transitions["channel"], transitions["state"])) == [
+        (1, PORE),
+        (2, PORE),
+        (3, UNAVAILABLE),
+        (1, STRAND),
+        (1, PORE),
+        (4, STRAND),
+    ]
+    assert transitions["previous"][3] == PORE
+    assert transitions["acquisition_raw_index"][2] == 2
+
+
+def test_tracker_history_is_bounded(connection):
+    tracker = ChannelStateTracker(
+        connection, first_channel=1, last_channel=2, history_size=3
+    )
+    for state in (PORE, STRAND, PORE, STRAND, PORE):
+        tracker.update(
+            data_pb2.GetChannelStatesResponse(
+                channel_states=[ChannelStateData(channel=1, state_id=state)]
+            )
+        )
+
+    transitions = tracker.get_transitions()
+    assert list(transitions["state"]) == [PORE, STRAND, PORE]
+    assert list(transitions["previous"]) == [STRAND, PORE, STRAND]
+    assert len(tracker.get_transitions(since=transitions["received"][-1])) == 0
@@ -0,0 +1,643 @@
+import queue
+import threading
+import time
+
+import grpc
+import numpy
+import pytest
+
+from minknow_api import (
+    Connection,
+    acquisition_pb2,
+    acquisition_pb2_grpc,
+    data_pb2,
+    data_pb2_grpc,
+    device_pb2,
+    device_pb2_grpc,
+)
+from minknow_api.channel_pool import ChannelPool
+from minknow_api.data import (
+    ChannelConfigChange,
+    ChannelSignalData,
+    SignalData,
+    SignalStatistics,
+    cached_calibration,
+    cached_numpy_types,
+    calibrate_signal,
+    capture_signal,
+    clear_numpy_types_cache,
+    get_signal,
+    get_signal_statistics,
+    iter_signal,
+    open_signal_capture,
+)
+from mock_server import Server, InstanceServicer, load_test_ca
+
+DataType = data_pb2.GetDataTypesResponse.DataType
+
+
+class DataServicer(data_pb2_grpc.DataServiceServicer):
+    """Streams predictable signal: sample ``n`` on channel ``c`` has value ``c * 1000 + n``.
+
+    Args:
+        chunk_size: The number of samples for each channel in each message.
+        start_samples: The value of ``samples_since_start`` in the first message (sample 0).
+        skew: How many samples later each successive call starts.
+    """
+
+    def __init__(self, chunk_size: int = 100, start_samples: int = 5000, skew: int = 0):
+        self.chunk_size = chunk_size
+        self.start_samples = start_samples
+        self.skew = skew
+        self.requests = []
+        self.data_types_calls = 0
+
+    def get_data_types(self, _request, _context):
+        self.data_types_calls += 1
+        return data_pb2.GetDataTypesResponse(
+            uncalibrated_signal=DataType(type=DataType.SIGNED_INTEGER, size=2),
+            calibrated_signal=DataType(type=DataType.FLOATING_POINT, size=4),
+            bias_voltages=DataType(type=DataType.SIGNED_INTEGER, size=2),
+        )
+
+    def get_signal_bytes(self, request, context):
+        first_sample = self.skew * len(self.requests)
+        self.requests.append(request)
+        dtype = "<f4" if request.calibrated_data else "<i2"
+        channels = range(request.first_channel, request.last_channel + 1)
+        length = request.WhichOneof("length")
+        if length == "samples":
+            total = request.samples
+        elif length == "seconds":
+            total = int(request.seconds * 4000)
+        else:
+            total = None
+        sent = 0
+        while context.is_active() and (total is None or sent < total):
+            count = (
+                self.chunk_size if total is None else min(self.chunk_size, total - sent)
+            )
+            offsets = numpy.arange(first_sample + sent, first_sample + sent + count)
+            msg = data_pb2.GetSignalBytesResponse(
+                samples_since_start=self.start_samples + offsets[0],
+                seconds_since_start=(self.start_samples + offsets[0]) / 4000,
+            )
+            for channel in channels:
+                channel_data = msg.channels.add(
+                    data=(channel * 1000 + offsets).astype(dtype).tobytes()
+                )
+                if request.include_channel_configs and sent == 0:
+                    channel_data.config_changes.add(
+                        offset=0,
+                        config=device_pb2.ReturnedChannelConfiguration(well=1),
+                    )
+            if request.include_bias_voltages:
+                msg.bias_voltages = numpy.full(count, -180, "<i2").tobytes()
+            yield msg
+            sent += count
+
+
+class AcquisitionServicer(acquisition_pb2_grpc.AcquisitionServiceServicer):
+    """Sends the run IDs put in ``runs`` from ``watch_current_acquisition_run``."""
+
+    def __init__(self):
+        self.runs = queue.Queue()
+        self.runs.put("run-1")
+
+    def watch_current_acquisition_run(self, _request, context):
+        while context.is_active():
+            try:
+                run_id = self.runs.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            yield acquisition_pb2.AcquisitionRunInfo(run_id=run_id)
+
+
+class UnavailableAcquisitionServicer(acquisition_pb2_grpc.AcquisitionServiceServicer):
+    """Fails every ``watch_current_acquisition_run`` call."""
+
+    def __init__(self):
+        self.watch_calls = 0
+
+    def watch_current_acquisition_run(self, _request, context):
+        self.watch_calls += 1
+        context.abort(grpc.StatusCode.UNIMPLEMENTED, "not supported")
+        yield
+
+
+class DeviceServicer(device_pb2_grpc.DeviceServiceServicer):
+    """Calibrates channel ``c`` with an offset of ``-1000 * c`` and a pA range of ``400 + c``."""
+
+    DIGITISATION = 2048
+
+    def __init__(self):
+        self.calibration_calls = 0
+        self.sample_rate_calls = 0
+
+    def get_sample_rate(self, _request, _context):
+        self.sample_rate_calls += 1
+        return device_pb2.GetSampleRateResponse(sample_rate=4000)
+
+    def get_calibration(self, request, _context):
+        self.calibration_calls += 1
+        channels = numpy.arange(request.first_channel, request.last_channel + 1)
+        return device_pb2.GetCalibrationResponse(
+            digitisation=self.DIGITISATION,
+            offsets=-1000.0 * channels,
+            pa_ranges=400.0 + channels,
+            has_calibration=True,
+        )
+
+
+@pytest.fixture
+def data_servicer():
+    return DataServicer()
+
+
+@pytest.fixture
+def acquisition_servicer():
+    return AcquisitionServicer()
+
+
+@pytest.fixture
+def device_servicer():
+    return DeviceServicer()
+
+
+@pytest.fixture
+def connection(data_servicer, acquisition_servicer, device_servicer):
+    with Server(
+        [InstanceServicer(), data_servicer, acquisition_servicer, device_servicer],
+        max_workers=8,
+    ) as server:
+        with Connection(
+            port=server.port, credentials=grpc.ssl_channel_credentials(load_test_ca())
+        ) as conn:
+            yield conn
+
+
+def expected_signal(channel, samples):
+    return channel * 1000 + numpy.arange(samples)
+
+
+def expected_calibrated_signal(channel, samples):
+    scale = numpy.float32(400 + channel) / numpy.float32(DeviceServicer.DIGITISATION)
+    return numpy.arange(samples, dtype=numpy.float32) * scale
+
+
+def test_get_signal_returns_signal_for_each_channel(connection):
+    result = get_signal(
+        connection,
+        samples=450,
+        first_channel=3,
+        last_channel=5,
+        include_bias_voltages=True,
+        include_channel_configs=True,
+    )
+
+    assert result.samples_since_start == 5000
+    assert [ch.name for ch in result.channels] == [3, 4, 5]
+    for ch in result.channels:
+        numpy.testing.assert_array_equal(ch.signal, expected_signal(ch.name, 450))
+        assert ch.signal.dtype == numpy.dtype("<i2")
+        assert [c.offset for c in ch.config_changes] == [0]
+    assert len(result.bias_voltages) == 450
+
+
+def test_get_signal_channels_are_views_of_one_array(connection):
+    result = get_signal(connection, samples=300, first_channel=1, last_channel=4)
+
+    base = result.channels[0].signal.base
+    assert base is not None
+    assert base.shape == (4, 300)
+    for ch in result.channels:
+        assert ch.signal.base is base
+
+
+def test_get_signal_with_seconds_uses_sample_rate(connection):
+    result = get_signal(
+        connection,
+        seconds=0.1,
+        sample_rate=4000,
+        first_channel=1,
+        last_channel=2,
+        calibrated_data=True,
+    )
+
+    for ch in result.channels:
+        assert ch.signal.dtype == numpy.dtype("<f4")
+        numpy.testing.assert_array_equal(ch.signal, expected_signal(ch.name, 400))
+    assert len(result.bias_voltages) == 0
+
+
+def test_sample_rate_is_cached_until_acquisition_restarts(
+    connection, acquisition_servicer, device_servicer
+):
+    get_signal(connection, seconds=0.01, first_channel=1, last_channel=1)
+    # the first call may happen before the acquisition watcher is ready
+    wait_for(lambda: acquisition_servicer.runs.empty())
+    get_signal(connection, seconds=0.01, first_channel=1, last_channel=1)
+    calls = device_servicer.sample_rate_calls
+
+    result = get_signal(connection, seconds=0.1, first_channel=1, last_channel=1)
+    assert len(result.channels[0].signal) == 400
+    assert device_servicer.sample_rate_calls == calls
+
+    acquisition_servicer.runs.put("run-2")
+    wait_for(
+        lambda: get_signal(connection, seconds=0.01, first_channel=1, last_channel=1)
+        and device_servicer.sample_rate_calls > calls
+    )
+
+
+def test_get_signal_grows_if_more_data_than_expected(connection):
+    # an underestimated sample rate means less space is preallocated than needed
+    result = get_signal(
+        connection, seconds=0.1, sample_rate=1000, first_channel=1, last_channel=2
+    )
+
+    for ch in result.channels:
+        numpy.testing.assert_array_equal(ch.signal, expected_signal(ch.name, 400))
+
+
+@pytest.mark.parametrize("data_servicer", [DataServicer(skew=30)])
+def test_get_signal_with_shards_aligns_channels(connection, data_servicer):
+    result = get_signal(
+        connection,
+        samples=450,
+        first_channel=1,
+        last_channel=7,
+        shards=3,
+        include_bias_voltages=True,
+        include_channel_configs=True,
+    )
+
+    # requests for channels 1-2, 3-4 and 5-7, starting 30 samples apart
+    assert sorted(
+        (r.first_channel, r.last_channel) for r in data_servicer.requests
+    ) == [
+        (1, 2),
+        (3, 4),
+        (5, 7),
+    ]
+    assert result.samples_since_start == 5060
+    assert [ch.name for ch in result.channels] == list(range(1, 8))
+    for ch in result.channels:
+        numpy.testing.assert_array_equal(ch.signal, expected_signal(ch.name, 510)[60:])
+        assert [c.offset for c in ch.config_changes] == [0]
+    assert len(result.bias_voltages) == 450
+
+
+def test_capture_signal_writes_reopenable_capture(connection, tmp_path):
+    captured = capture_signal(
+        connection,
+        tmp_path / "capture",
+        samples=250,
+        first_channel=2,
+        last_channel=4,
+        include_bias_voltages=True,
+        include_channel_configs=True,
+    )
+    result = open_signal_capture(tmp_path / "capture")
+
+    for data in (captured, result):
+        assert data.samples_since_start == 5000
+        assert data.seconds_since_start == 1.25
+        assert [ch.name for ch in data.channels] == [2, 3, 4]
+        for ch in data.channels:
+            assert isinstance(ch.signal.base, numpy.memmap)
+            numpy.testing.assert_array_equal(ch.signal, expected_signal(ch.name, 250))
+            [change] = ch.config_changes
+            assert change.offset == 0
+            assert change.config.well == 1
+        numpy.testing.assert_array_equal(data.bias_voltages, numpy.full(250, -180))
+
+
+def test_capture_signal_warns_if_data_is_discarded(connection, tmp_path, caplog):
+    # an underestimated sample rate means the files are too small for all the data
+    captured = capture_signal(
+        connection,
+        tmp_path / "capture",
+        seconds=0.1,
+        sample_rate=1000,
+        first_channel=1,
+        last_channel=2,
+    )
+
+    for ch in captured.channels:
+        numpy.testing.assert_array_equal(ch.signal, expected_signal(ch.name, 100))
+    assert "discarded 600 signal samples" in caplog.text
+
+
+def test_iter_signal_yields_fixed_size_blocks(connection):
+    blocks = list(
+        iter_signal(
+            connection,
+            block_size=160,
+            sample_rate=4000,
+            samples=450,
+            first_channel=1,
+            last_channel=3,
+            include_bias_voltages=True,
+        )
+    )
+
+    assert [b.samples_since_start for b in blocks] == [5000, 5160, 5320]
+    assert [b.seconds_since_start for b in blocks] == [1.25, 1.29, 1.33]
+    assert [len(b.bias_voltages) for b in blocks] == [160, 160, 130]
+    for ch in range(3):
+        signal = numpy.concatenate([b.channels[ch].signal for b in blocks])
+        numpy.testing.assert_array_equal(signal, expected_signal(ch + 1, 450))
+
+
+def test_iter_signal_carries_config_into_each_block(connection):
+    blocks = list(
+        iter_signal(
+            connection,
+            block_size=60,
+            sample_rate=4000,
+            samples=200,
+            first_channel=1,
+            last_channel=1,
+            include_channel_configs=True,
+        )
+    )
+
+    assert len(blocks) == 4
+    for block in blocks:
+        [change] = block.channels[0].config_changes
+        assert change.offset == 0
+        assert change.config.well == 1
+
+
+def test_iter_signal_cancels_call_when_closed(connection, data_servicer):
+    blocks = iter_signal(
+        connection, block_size=100, sample_rate=4000, first_channel=1, last_channel=1
+    )
+    first = next(blocks)
+    blocks.close()
+
+    assert not data_servicer.requests[0].HasField("samples")
+    numpy.testing.assert_array_equal(first.channels[0].signal, expected_signal(1, 100))
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_numpy_types_are_cached_until_acquisition_restarts(
+    connection, data_servicer, acquisition_servicer
+):
+    dtypes = cached_numpy_types(connection)
+    assert dtypes.uncalibrated_signal == numpy.dtype("<i2")
+    # the first call may happen before the acquisition watcher is ready
+    wait_for(lambda: acquisition_servicer.runs.empty())
+    cached_numpy_types(connection)
+    calls = data_servicer.data_types_calls
+
+    get_signal(connection, samples=10, first_channel=1, last_channel=1)
+    list(
+        iter_signal(
+            connection,
+            block_size=10,
+            sample_rate=4000,
+            samples=10,
+            first_channel=1,
+            last_channel=1,
+        )
+    )
+    assert cached_numpy_types(connection) == dtypes
+    assert data_servicer.data_types_calls == calls
+
+    acquisition_servicer.runs.put("run-2")
+    wait_for(
+        lambda: cached_numpy_types(connection)
+        and data_servicer.data_types_calls > calls
+    )
+
+    calls = data_servicer.data_types_calls
+    clear_numpy_types_cache(connection)
+    cached_numpy_types(connection)
+    assert data_servicer.data_types_calls == calls + 1
+
+
+def watcher_threads():
+    return [
+        t
+        for t in threading.enumerate()
+        if t.name == "minknow_api.data acquisition watcher"
+    ]
+
+
+def test_acquisition_watcher_stops_when_connection_is_closed(
+    data_servicer, acquisition_servicer
+):
+    pool = ChannelPool()
+    credentials = grpc.ssl_channel_credentials(load_test_ca())
+    before = len(watcher_threads())
+    with Server([InstanceServicer(), data_servicer, acquisition_servicer]) as server:
+        for _ in range(3):
+            with Connection(
+                port=server.port, credentials=credentials, channel_pool=pool
+            ) as conn:
+                cached_numpy_types(conn)
+                assert len(watcher_threads()) == before + 1
+            # the pooled channel is still open, but the watcher has stopped
+            wait_for(lambda: len(watcher_threads()) == before)
+        assert pool.get_stats().open_channels == 1
+    pool.clear()
+
+
+@pytest.mark.parametrize("acquisition_servicer", [UnavailableAcquisitionServicer()])
+def test_failed_acquisition_watch_is_backed_off(
+    connection, data_servicer, acquisition_servicer
+):
+    for _ in range(5):
+        cached_numpy_types(connection)
+        time.sleep(0.05)
+
+    # nothing is cached, but the watch is not retried for every lookup
+    assert data_servicer.data_types_calls == 5
+    assert acquisition_servicer.watch_calls == 1
+
+
+def test_calibrate_signal_matches_minknow_conversion(connection):
+    calibration = cached_calibration(connection, first_channel=2, last_channel=3)
+    raw = numpy.array([expected_signal(2, 50), expected_signal(3, 50)], "<i2")
+
+    calibrated = calibrate_signal(raw, calibration)
+    assert calibrated.dtype == numpy.float32
+    numpy.testing.assert_array_equal(calibrated[0], expected_calibrated_signal(2, 50))
+    numpy.testing.assert_array_equal(calibrated[1], expected_calibrated_signal(3, 50))
+
+    half = calibrate_signal(raw, calibration, dtype=numpy.float16)
+    assert half.dtype == numpy.float16
+    numpy.testing.assert_array_equal(half, calibrated.astype(numpy.float16))
+
+    out = numpy.empty((50,), numpy.float32)
+    assert calibrate_signal(raw[0], calibration, out=out) is out
+    numpy.testing.assert_array_equal(out, calibrated[0])
+
+
+@pytest.mark.parametrize("data_servicer", [DataServicer(skew=30)])
+def test_get_signal_can_calibrate_on_client(
+    connection, data_servicer, device_servicer, acquisition_servicer
+):
+    result = get_signal(
+        connection,
+        samples=300,
+        first_channel=1,
+        last_channel=3,
+        calibrated_data=True,
+        calibrate_on_client=True,
+    )
+
+    assert not data_servicer.requests[0].calibrated_data
+    base = result.channels[0].signal.base
+    for ch in result.channels:
+        assert ch.signal.dtype == numpy.dtype("<f4")
+        assert ch.signal.base is base
+        numpy.testing.assert_array_equal(
+            ch.signal, expected_calibrated_signal(ch.name, 300)
+        )
+
+    # the calibration is only fetched once per acquisition
+    wait_for(lambda: acquisition_servicer.runs.empty())
+    cached_calibration(connection, first_channel=1, last_channel=3)
+    calls = device_servicer.calibration_calls
+    result = get_signal(
+        connection,
+        samples=450,
+        first_channel=1,
+        last_channel=3,
+        shards=2,
+        calibrated_data=True,
+        calibrate_on_client=True,
+        calibrated_dtype=numpy.float16,
+    )
+    assert device_servicer.calibration_calls == calls
+    assert result.samples_since_start == 5060
+    for ch in result.channels:
+        assert ch.signal.dtype == numpy.float16
+        numpy.testing.assert_array_equal(
+            ch.signal,
+            expected_calibrated_signal(ch.name, 510)[60:].astype(numpy.float16),
+        )
+
+
+def test_iter_signal_can_calibrate_on_client(connection, data_servicer):
+    blocks = list(
+        iter_signal(
+            connection,
+            block_size=200,
+            sample_rate=4000,
+            samples=300,
+            first_channel=4,
+            last_channel=5,
+            calibrated_data=True,
+            calibrate_on_client=True,
+        )
+    )
+
+    assert not data_servicer.requests[0].calibrated_data
+    assert [len(b.channels[0].signal) for b in blocks] == [200, 100]
+    for ch in blocks[1].channels:
+        numpy.testing.assert_array_equal(
+            ch.signal, expected_calibrated_signal(ch.name, 300)[200:]
+        )
+
+
+def test_config_timelines_share_a_config_table():
+    def config(well):
+        return device_pb2.ReturnedChannelConfiguration(well=well)
+
+    data = SignalData(
+        0,
+        0.0,
+        [
+            ChannelSignalData(
+                1,
+                numpy.zeros(100),
+                [
+                    ChannelConfigChange(0, config(1)),
+                    ChannelConfigChange(40, config(2)),
+                    ChannelConfigChange(40, config(3)),
+                    ChannelConfigChange(70, config(1)),
+                ],
+            ),
+            ChannelSignalData(2, numpy.zeros(50), [ChannelConfigChange(10, config(3))]),
+            ChannelSignalData(3, numpy.zeros(20), []),
+        ],
+        numpy.empty(0),
+    )
+
+    first, second, empty = data.config_timelines()
+    assert first.configs is second.configs
+    assert [c.well for c in first.configs] == [1, 2, 3]
+    numpy.testing.assert_array_equal(
+        first.config_at([0, 39, 40, 69, 70, 99]), [0, 0, 2, 2, 0, 0]
+    )
+    numpy.testing.assert_array_equal(second.config_at([0, 10]), [-1, 2])
+    numpy.testing.assert_array_equal(empty.config_at([0, 5]), [-1, -1])
+
+    starts, ends, codes = first.segments()
+    numpy.testing.assert_array_equal(starts, [0, 40, 70])
+    numpy.testing.assert_array_equal(ends, [40, 70, 100])
+    numpy.testing.assert_array_equal(codes, [0, 2, 0])
+
+    in_well_3 = second.mask(lambda c: c.well == 3)
+    assert in_well_3.shape == (50,)
+    assert not in_well_3[:10].any() and in_well_3[10:].all()
+    assert first.mask(lambda c: c.well == 1).sum() == 70
+    assert not empty.mask(lambda c: True).any()
+
+    timeline = data.channels[0].config_timeline()
+    assert len(timeline.configs) == 3 and timeline.length == 100
+
+
+def test_signal_statistics_match_numpy():
+    rng = numpy.random.default_rng(1)
+    signal = rng.normal([[100.0], [250.0], [0.0]], [[5.0], [20.0], [1.0]], (3, 5000))
+    signal[1, :50] = 1000  # spikes that should not affect the median or MAD
+
+    stats = SignalStatistics(
+        10, 13, value_range=(-100, 500), bins=600, saturation_limits=(-50, 900)
+    )
+    for start in range(0, 5000, 700):
+        stats.add(signal[:, start : start + 700], first_channel=10)
+    summary = stats.summary()
+
+    numpy.testing.assert_array_equal(summary.channels, [10, 11, 12, 13])
+    numpy.testing.assert_array_equal(summary.count, [5000, 5000, 5000, 0])
+    numpy.testing.assert_allclose(summary.mean[:3], signal.mean(axis=1))
+    numpy.testing.assert_allclose(summary.std[:3], signal.std(axis=1))
+    numpy.testing.assert_array_equal(summary.min[:3], signal.min(axis=1))
+    numpy.testing.assert_array_equal(summary.max[:3], signal.max(axis=1))
+    median = numpy.median(signal, axis=1)
+    mad = numpy.median(numpy.abs(signal - median[:, numpy.newaxis]), axis=1)
+    numpy.testing.assert_allclose(summary.median[:3], median, atol=1)
+    numpy.testing.assert_allclose(summary.mad[:3], mad, atol=1)
+    numpy.testing.assert_array_equal(summary.saturated, [0, 50, 0, 0])
+    assert numpy.isnan(summary.mean[3]) and numpy.isnan(summary.median[3])
+
+
+def test_get_signal_statistics(connection):
+    summary = get_signal_statistics(
+        connection,
+        value_range=(0, 8000),
+        bins=8000,
+        samples=450,
+        first_channel=3,
+        last_channel=5,
+    )
+
+    numpy.testing.assert_array_equal(summary.count, [450] * 3)
+    for i, channel in enumerate(summary.channels):
+        expected = expected_signal(channel, 450)
+        assert summary.mean[i] == pytest.approx(expected.mean())
+        assert summary.std[i] == pytest.approx(expected.std())
+        assert summary.median[i] == pytest.approx(numpy.median(expected), abs=1)
+        assert summary.mad[i] == pytest.approx(112.5, abs=1)
@@ -0,0 +1,136 @@
+import time
+
+import grpc
+import pytest
+
+from minknow_api import manager_pb2
+from minknow_api.fleet import Fleet
+from mock_server import Server, ManagerServicer
+
+DELAY = 0.3
+
+
+class SlowManagerServicer(ManagerServicer):
+    def __init__(self, name, delay=DELAY, connect_delay=0):
+        super().__init__(
+            positions=[
+                manager_pb2.FlowCellPosition(
+                    name=name,
+                    state=manager_pb2.FlowCellPosition.State.STATE_RUNNING,
+                )
+            ]
+        )
+        self.name = name
+        self.delay = delay
+        self.connect_delay = connect_delay
+
+    def get_version_info(self, request, context):
+        time.sleep(self.connect_delay)
+        return super().get_version_info(request, context)
+
+    def describe_host(self, _request, _context):
+        time.sleep(self.delay)
+        return manager_pb2.DescribeHostResponse(description=self.name)
+
+
+@pytest.fixture
+def unused_port():
+    with Server([]) as server:
+        port = server.port
+    return port
+
+
+@pytest.fixture
+def servers():
+    servicers = [
+        SlowManagerServicer("A"),
+        SlowManagerServicer("B"),
+        SlowManagerServicer("C", delay=5 * DELAY),
+    ]
+    with Server([servicers[0]]) as a, Server([servicers[1]]) as b:
+        with Server([servicers[2]]) as c:
+            yield [a.port, b.port, c.port]
+
+
+def test_fleet_queries_hosts_in_parallel(servers, unused_port):
+    hosts = [("127.0.0.1", port) for port in servers[:2] + [unused_port]]
+
+    with Fleet(hosts) as fleet:
+        assert fleet.hosts == [f"127.0.0.1:{port}" for port in servers[:2]] + [
+            f"127.0.0.1:{unused_port}"
+        ]
+        # connect up front, so the timing below only covers the query
+        fleet.get_version_info()
+
+        start = time.monotonic()
+        results = fleet.describe_host()
+        elapsed = time.monotonic() - start
+
+        a, b, missing = results.values()
+        assert a.ok and a.value.description == "A"
+        assert b.ok and b.value.description == "B"
+        assert a.latency >= DELAY and b.latency >= DELAY
+        assert elapsed < 2 * DELAY
+
+        assert not missing.ok
+        assert isinstance(missing.error, grpc.RpcError)
+        assert missing.value is None
+
+        positions = fleet.flow_cell_positions()
+        assert [pos.name for pos in positions[f"127.0.0.1:{servers[0]}"].value] == ["A"]
+
+
+def test_slow_hosts_time_out(servers):
+    with Fleet([("127.0.0.1", port) for port in servers]) as fleet:
+        fleet.get_version_info()
+
+        results = fleet.describe_host(timeout=2 * DELAY)
+
+        a, b, c = results.values()
+        assert a.ok and b.ok
+        # either the fleet or the call itself may give up first
+        assert isinstance(c.error, (TimeoutError, grpc.RpcError))
+
+        # the call was given the remaining time, so the host is free again well before it would
+        # have responded
+        time.sleep(DELAY)
+        results = fleet.describe_host(timeout=2 * DELAY)
+        assert results[c.host].error is not None
+        assert "earlier query" not in str(results[c.host].error)
+
+
+def test_busy_hosts_are_skipped(servers):
+    def query(manager):
+        # unlike the built-in queries, this does not know about the fleet's timeout
+        return manager.describe_host().description
+
+    with Fleet([("127.0.0.1", port) for port in servers]) as fleet:
+        fleet.get_version_info()
+
+        a, b, c = fleet.map(query, timeout=2 * DELAY).values()
+        assert isinstance(c.error, TimeoutError)
+
+        # C is still working on the first query
+        start = time.monotonic()
+        a, b, c = fleet.map(query).values()
+        assert time.monotonic() - start < 2 * DELAY
+        assert a.value == "A" and b.value == "B"
+        assert isinstance(c.error, TimeoutError)
+        assert "earlier query" in str(c.error)
+
+        time.sleep(5 * DELAY)
+        completed = [r.value for r in fleet.as_completed(query)]
+        assert sorted(completed) == ["A", "B", "C"]
+        assert completed[-1] == "C"
+
+
+def test_connecting_is_limited_by_the_timeout():
+    with Server([SlowManagerServicer("A", connect_delay=5 * DELAY)]) as server:
+        with Fleet([("127.0.0.1", server.port)]) as fleet:
+            [result] = fleet.describe_host(timeout=DELAY).values()
+            assert not result.ok
+
+            time.sleep(DELAY)
+            [result] = fleet.describe_host(timeout=DELAY).values()
+            assert result.error is not None
+            assert "earlier query" not in str(result.error)
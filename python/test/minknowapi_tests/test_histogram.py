@@ -0,0 +1,128 @@
+import grpc
+import numpy
+import pytest
+
+from minknow_api import Connection, statistics_pb2, statistics_pb2_grpc
+from minknow_api.histogram import (
+    Histogram,
+    decode_histograms,
+    merge_histograms,
+    stream_read_length_histograms,
+)
+from mock_server import Server, InstanceServicer, load_test_ca
+
+ReadLengthResponse = statistics_pb2.StreamReadLengthHistogramResponse
+
+
+def read_length_response(values, bucket_value_type=statistics_pb2.ReadCounts):
+    return ReadLengthResponse(
+        bucket_value_type=bucket_value_type,
+        bucket_ranges=[
+            ReadLengthResponse.BucketRange(start=i * 100, end=(i + 1) * 100)
+            for i in range(len(values))
+        ],
+        histogram_data=[
+            ReadLengthResponse.ReadLengthHistogramData(bucket_values=values),
+            ReadLengthResponse.ReadLengthHistogramData(
+                filtering=[statistics_pb2.ReadLengthHistogramKey(read_end_reason=1)],
+                bucket_values=values[::-1],
+            ),
+        ],
+    )
+
+
+class StatisticsServicer(statistics_pb2_grpc.StatisticsServiceServicer):
+    def __init__(self):
+        self.requests = []
+
+    def stream_read_length_histogram(self, request, _context):
+        self.requests.append(request)
+        yield read_length_response([1, 0, 0])
+        yield read_length_response([2, 0, 2])
+
+
+def test_summaries():
+    histogram = Histogram([0, 100, 200, 300, 400], [0, 10, 0, 10])
+
+    assert histogram.total() == 20
+    assert histogram.mean() == 250
+    assert histogram.mode() == 150
+    assert histogram.percentile(50) == 200
+    numpy.testing.assert_allclose(histogram.percentile([25, 75]), [150, 350])
+    # 3500 of the 5000 bases are in the top bucket
+    assert histogram.nx(70) == 300
+    assert histogram.n50() == pytest.approx(300 + 100 * 2 / 7)
+    assert numpy.isnan(Histogram([0, 1], [0]).mean())
+
+    # the same reads, as total lengths
+    weighted = Histogram(histogram.edges, histogram.weights(), weighted=True)
+    numpy.testing.assert_allclose(weighted.counts(), histogram.values)
+    assert weighted.mean() == 250
+    assert weighted.n50() == histogram.n50()
+
+
+def test_merge():
+    a = Histogram([0, 10, 20], [4, 2])
+    b = Histogram([0, 10, 20], [1, 1])
+    merged = a + b
+    numpy.testing.assert_array_equal(merged.values, [5, 3])
+    assert merged.values.dtype == a.values.dtype
+
+    # the buckets don't line up, so the values are shared out
+    merged = merge_histograms([a, Histogram([5, 15, 25], [2, 4])])
+    numpy.testing.assert_array_equal(merged.edges, [0, 5, 10, 15, 20, 25])
+    numpy.testing.assert_allclose(merged.values, [2, 3, 2, 3, 2])
+    assert merged.total() == a.total() + 6
+
+    with pytest.raises(ValueError):
+        merge_histograms([a, Histogram([0, 10, 20], [1, 1], weighted=True)])
+    with pytest.raises(ValueError):
+        merge_histograms([])
+
+
+def test_decode_histograms():
+    histograms = decode_histograms(
+        read_length_response([3, 0, 1], statistics_pb2.ReadLengths)
+    )
+
+    assert len(histograms) == 2
+    overall = histograms[()]
+    numpy.testing.assert_array_equal(overall.edges, [0, 100, 200, 300])
+    numpy.testing.assert_array_equal(overall.values, [3, 0, 1])
+    assert overall.weighted
+    ((key, filtered),) = [(k, h) for k, h in histograms.items() if k]
+    assert key[0].read_end_reason == 1
+    numpy.testing.assert_array_equal(filtered.values, [1, 0, 3])
+
+    q_scores = statistics_pb2.StreamQScoreHistogramResponse(
+        bucket_value_type=statistics_pb2.QScore_BasecalledBases,
+        bucket_ranges=[{"start": 0, "end": 0.5}, {"start": 0.5, "end": 1}],
+        histogram_data=[{"bucket_values": [1, 3]}],
+    )
+    histogram = decode_histograms(q_scores)[()]
+    assert not histogram.weighted
+    assert histogram.mean() == pytest.approx(0.625)
+
+    with pytest.raises(ValueError):
+        decode_histograms(
+            ReadLengthResponse(
+                bucket_ranges=[{"start": 0, "end": 1}, {"start": 2, "end": 3}]
+            )
+        )
+
+
+def test_stream_read_length_histograms():
+    servicer = StatisticsServicer()
+    with Server([InstanceServicer(), servicer]) as server:
+        with Connection(
+            port=server.port, credentials=grpc.ssl_channel_credentials(load_test_ca())
+        ) as connection:
+            updates = list(
+                stream_read_length_histograms(
+                    connection, "run-1", read_length_type=statistics_pb2.BasecalledBases
+                )
+            )
+
+    assert servicer.requests[0].acquisition_run_id == "run-1"
+    assert servicer.requests[0].read_length_type == statistics_pb2.BasecalledBases
+    assert [u[()].mean() for u in updates] == [50, 150]
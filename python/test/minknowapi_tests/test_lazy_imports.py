@@ -0,0 +1,56 @@
+import subprocess
+import sys
+
+import grpc
+
+import minknow_api
+from minknow_api import Connection
+from mock_server import Server, InstanceServicer, load_test_ca
+
+
+def imported_modules(code):
+    """Run ``code`` in a fresh interpreter, and return the minknow_api modules it imported."""
+    output = subprocess.check_output(
+        [
+            sys.executable,
+            "-c",
+            code
+            + "\nimport sys\n"
+            + "print(' '.join(m for m in sys.modules if m.startswith('minknow_api')))",
+        ]
+    )
+    return set(output.decode().split())
+
+
+def test_import_does_not_load_services():
+    modules = imported_modules("import minknow_api")
+
+    assert not any(m.endswith("_service") or m.endswith("_pb2") for m in modules)
+
+
+def test_services_are_loaded_on_first_use():
+    modules = imported_modules("import minknow_api\nminknow_api.data_service")
+
+    assert "minknow_api.data_service" in modules
+    assert "minknow_api.acquisition_service" not in modules
+
+
+def test_module_attributes():
+    assert minknow_api.protocols_service.__name__ == "minknow_api.v2.protocols_service"
+    assert minknow_api.instance_pb2.__name__ == "minknow_api.instance_pb2"
+    assert minknow_api.data.__name__ == "minknow_api.data"
+    assert "data_service" in dir(minknow_api)
+    assert not hasattr(minknow_api, "nonexistent_pb2")
+
+
+def test_connection_creates_services_on_first_use():
+    with Server([InstanceServicer()]) as server:
+        with Connection(
+            port=server.port, credentials=grpc.ssl_channel_credentials(load_test_ca())
+        ) as connection:
+            assert "data" not in vars(connection)
+            assert "data" in dir(connection)
+
+            service = connection.data
+            assert isinstance(service, minknow_api.data_service.DataService)
+            assert connection.data is service
@@ -0,0 +1,219 @@
+import threading
+import time
+
+import grpc
+import numpy
+import pytest
+
+from minknow_api import Connection, data_pb2, data_pb2_grpc
+from minknow_api.live_reads import LiveReadsClient, RawDataType
+from mock_server import Server, InstanceServicer, load_test_ca
+
+DataType = data_pb2.GetDataTypesResponse.DataType
+ActionResponse = data_pb2.GetLiveReadsResponse.ActionResponse
+
+
+class LiveReadsServicer(data_pb2_grpc.DataServiceServicer):
+    """Sends the responses put in ``responses``, and records the requests it receives.
+
+    Any actions received are responded to (with ``SUCCESS``) in the next response.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+        self.cond = threading.Condition()
+
+    def get_data_types(self, _request, _context):
+        return data_pb2.GetDataTypesResponse(
+            uncalibrated_signal=DataType(type=DataType.SIGNED_INTEGER, size=2),
+            calibrated_signal=DataType(type=DataType.FLOATING_POINT, size=4),
+            bias_voltages=DataType(type=DataType.SIGNED_INTEGER, size=2),
+        )
+
+    def send(self, response):
+        with self.cond:
+            self.responses.append(response)
+            self.cond.notify_all()
+
+    def _read_requests(self, request_iterator):
+        try:
+            for request in request_iterator:
+                with self.cond:
+                    self.requests.append(request)
+                    if request.HasField("actions"):
+                        self.responses.append(
+                            data_pb2.GetLiveReadsResponse(
+                                action_responses=[
+                                    ActionResponse(action_id=action.action_id)
+                                    for action in request.actions.actions
+                                ]
+                            )
+                        )
+                    self.cond.notify_all()
+        except grpc.RpcError:
+            # the call was cancelled
+            pass
+
+    def get_live_reads(self, request_iterator, context):
+        threading.Thread(
+            target=self._read_requests, args=(request_iterator,), daemon=True
+        ).start()
+        while context.is_active():
+            with self.cond:
+                self.cond.wait_for(lambda: self.responses, timeout=0.05)
+                responses, self.responses = self.responses, []
+            yield from responses
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def servicer():
+    return LiveReadsServicer()
+
+
+@pytest.fixture
+def connection(servicer):
+    with Server([InstanceServicer(), servicer], max_workers=4) as server:
+        with Connection(
+            port=server.port, credentials=grpc.ssl_channel_credentials(load_test_ca())
+        ) as conn:
+            yield conn
+
+
+def read_data(read_id, signal):
+    return data_pb2.GetLiveReadsResponse.ReadData(
+        id=read_id, raw_data=numpy.asarray(signal, "<f4").tobytes()
+    )
+
+
+def test_client_sends_setup(connection, servicer):
+    with LiveReadsClient(
+        connection,
+        first_channel=1,
+        last_channel=512,
+        raw_data_type=RawDataType.UNCALIBRATED,
+        max_unblock_read_length_seconds=2.5,
+    ):
+        wait_for(lambda: servicer.requests)
+
+    setup = servicer.requests[0].setup
+    assert setup.first_channel == 1
+    assert setup.last_channel == 512
+    assert setup.raw_data_type == RawDataType.UNCALIBRATED
+    assert setup.max_unblock_read_length_seconds == 2.5
+
+
+def test_client_keeps_latest_chunk_per_channel(connection, servicer):
+    with LiveReadsClient(connection, first_channel=1, last_channel=4) as client:
+        servicer.send(
+            data_pb2.GetLiveReadsResponse(
+                samples_since_start=100,
+                channels={1: read_data("a", [1, 2]), 2: read_data("b", [3])},
+            )
+        )
+        servicer.send(
+            data_pb2.GetLiveReadsResponse(
+                samples_since_start=200,
+                channels={1: read_data("a", [1, 2, 4])},
+            )
+        )
+        wait_for(
+            lambda: client._latest_chunks.get(1)
+            and client._latest_chunks[1].samples_since_start == 200
+        )
+        chunks = client.get_read_chunks()
+
+    assert [(c.channel, c.read.id) for c in chunks] == [(1, "a"), (2, "b")]
+    numpy.testing.assert_array_equal(chunks[0].signal, [1, 2, 4])
+    assert chunks[0].signal.dtype == numpy.dtype("<f4")
+    assert client.get_read_chunks() == []
+
+
+def test_client_sends_actions_and_tracks_responses(connection, servicer):
+    with LiveReadsClient(connection, first_channel=1, last_channel=4) as client:
+        unblock_id = client.unblock(1, "a", duration=1)
+        stop_id = client.stop_receiving(2, "b")
+        wait_for(
+            lambda: client.action_response(unblock_id) is not None
+            and client.action_response(stop_id) is not None
+        )
+        assert client.action_response(unblock_id) == ActionResponse.SUCCESS
+        assert client.pending_action_count == 0
+
+    actions = {
+        action.action_id: action
+        for request in servicer.requests[1:]
+        for action in request.actions.actions
+    }
+    assert actions[unblock_id].channel == 1
+    assert actions[unblock_id].id == "a"
+    assert actions[unblock_id].unblock.duration == 1
+    assert actions[stop_id].channel == 2
+    assert actions[stop_id].HasField("stop_further_data")
+
+
+def test_client_batches_actions_by_size_and_delay(connection, servicer):
+    with LiveReadsClient(
+        connection,
+        first_channel=1,
+        last_channel=4,
+        max_batch_delay=0.2,
+        max_batch_size=2,
+    ) as client:
+        ids = [client.unblock(channel, "r{}".format(channel)) for channel in (1, 2, 3)]
+        wait_for(lambda: all(client.action_response(i) is not None for i in ids))
+        metrics = client.get_batch_metrics()
+
+    batches = [
+        [action.action_id for action in request.actions.actions]
+        for request in servicer.requests[1:]
+    ]
+    # the first batch is sent as soon as it is full, the second when the delay has passed
+    assert batches == [ids[:2], ids[2:]]
+    assert [m.size for m in metrics] == [2, 1]
+    assert metrics[0].queue_latency < 0.2
+    assert metrics[1].queue_latency >= 0.2
+    assert all(m.response_latency >= 0 for m in metrics)
+    assert client.get_batch_metrics() == []
+
+
+def test_client_deduplicates_actions(connection, servicer):
+    with LiveReadsClient(
+        connection, first_channel=1, last_channel=4, max_batch_delay=0.1
+    ) as client:
+        first_id = client.unblock(1, "a")
+        assert client.unblock(1, "a") == first_id
+        stop_id = client.stop_receiving(1, "a")
+        assert stop_id != first_id
+        wait_for(lambda: client.action_response(stop_id) is not None)
+        # once a response has been received, the action can be requested again
+        assert client.unblock(1, "a") != first_id
+
+    [request] = servicer.requests[1:2]
+    assert [a.action_id for a in request.actions.actions] == [first_id, stop_id]
+
+
+def test_client_drops_actions_for_finished_reads(connection, servicer):
+    with LiveReadsClient(
+        connection, first_channel=1, last_channel=4, max_batch_delay=10
+    ) as client:
+        servicer.send(data_pb2.GetLiveReadsResponse(channels={1: read_data("a", [1])}))
+        wait_for(lambda: client.get_read_chunks())
+        action_id = client.unblock(1, "a")
+
+        servicer.send(data_pb2.GetLiveReadsResponse(channels={1: read_data("b", [2])}))
+        wait_for(lambda: client.action_response(action_id) is not None)
+        assert client.action_response(action_id) == ActionResponse.FAILED_READ_FINISHED
+        # the channel has already moved on from this read
+        late_id = client.unblock(1, "a")
+        assert client.action_response(late_id) == ActionResponse.FAILED_READ_FINISHED
+        assert client.dropped_action_count == 2
+
+    assert [r.WhichOneof("request") for r in servicer.requests] == ["setup"]
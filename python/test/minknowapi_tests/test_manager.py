@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+import grpc
+import pytest
+
+from minknow_api import aio, manager_pb2
+from minknow_api.manager import Manager
+from mock_server import Server, InstanceServicer, ManagerServicer
+
+DELAY = 0.5
+
+
+class SlowInstanceServicer(InstanceServicer):
+    def get_version_info(self, request, context):
+        time.sleep(DELAY)
+        return super().get_version_info(request, context)
+
+
+def position(name, port=None):
+    description = manager_pb2.FlowCellPosition(
+        name=name, state=manager_pb2.FlowCellPosition.State.STATE_RUNNING
+    )
+    if port is not None:
+        description.rpc_ports.secure = port
+    return description
+
+
+@pytest.fixture
+def manager_port():
+    with Server([SlowInstanceServicer()], max_workers=10) as slow_server:
+        with Server([]) as broken_server:
+            positions = [position(f"X{i}", slow_server.port) for i in range(4)] + [
+                position("broken", broken_server.port),
+                position("stopped"),
+            ]
+            with Server([ManagerServicer(positions=positions)]) as manager_server:
+                yield manager_server.port
+
+
+def test_connect_all_connects_in_parallel(manager_port):
+    manager = Manager(port=manager_port)
+
+    start = time.monotonic()
+    result = manager.connect_all()
+    elapsed = time.monotonic() - start
+
+    assert sorted(result.connections) == ["X0", "X1", "X2", "X3"]
+    assert list(result.errors) == ["broken"]
+    assert isinstance(result.errors["broken"], grpc.RpcError)
+    # four slow positions connected one after the other would take 4 * DELAY
+    assert elapsed < 3 * DELAY
+    for conn in result.connections.values():
+        conn.close()
+
+
+def test_connect_all_with_named_positions(manager_port):
+    manager = Manager(port=manager_port)
+
+    result = manager.connect_all(["X1", "stopped", "missing"], max_workers=1)
+
+    assert list(result.connections) == ["X1"]
+    assert sorted(result.errors) == ["missing", "stopped"]
+    assert all(isinstance(e, RuntimeError) for e in result.errors.values())
+    result.connections["X1"].close()
+
+
+def test_aio_connect_all(manager_port):
+    async def run():
+        async with aio.Manager(port=manager_port) as manager:
+            start = time.monotonic()
+            result = await manager.connect_all()
+            elapsed = time.monotonic() - start
+            for conn in result.connections.values():
+                await conn.close()
+            named = await manager.connect_all(["X2", "missing"], max_concurrent=1)
+            for conn in named.connections.values():
+                await conn.close()
+            return result, elapsed, named
+
+    result, elapsed, named = asyncio.run(run())
+
+    assert sorted(result.connections) == ["X0", "X1", "X2", "X3"]
+    assert list(result.errors) == ["broken"]
+    assert elapsed < 3 * DELAY
+    assert list(named.connections) == ["X2"]
+    assert list(named.errors) == ["missing"]
+
+
+@pytest.fixture
+def watched_manager():
+    servicer = ManagerServicer(positions=[position("X0", 1234), position("X1")])
+    with Server([servicer]) as server:
+        manager = Manager(port=server.port)
+        yield servicer, manager
+        manager.close()
+
+
+def test_position_registry_tracks_changes(watched_manager):
+    servicer, manager = watched_manager
+    registry = manager.position_registry()
+    assert manager.position_registry() is registry
+
+    changes = []
+    registry.add_callback(lambda change: changes.append(change))
+
+    assert sorted(pos.name for pos in registry) == ["X0", "X1"]
+    assert registry["X0"].running
+    assert not registry.get("X1").running
+    assert registry.get("X2") is None
+    assert [pos.name for pos in registry.with_state("running")] == ["X0", "X1"]
+
+    servicer.positions = [
+        position("X1", 1235),
+        manager_pb2.FlowCellPosition(
+            name="X2", state=manager_pb2.FlowCellPosition.State.STATE_HARDWARE_ERROR
+        ),
+    ]
+    registry.wait_for(lambda r: "X0" not in r and "X2" in r, timeout=5)
+    assert registry.wait_for(lambda r: r.get("X1").running, timeout=5)
+
+    assert sorted((c.kind, c.position.name) for c in changes) == [
+        ("added", "X2"),
+        ("changed", "X1"),
+        ("removed", "X0"),
+    ]
+    assert [pos.name for pos in registry.with_state("hardware_error")] == ["X2"]
+    assert [pos.name for pos in registry.with_state("running")] == ["X1"]
+
+
+def test_position_registry_wait_for_timeout(watched_manager):
+    _, manager = watched_manager
+    registry = manager.position_registry()
+
+    with pytest.raises(TimeoutError):
+        registry.wait_for(lambda r: "X9" in r, timeout=0.1)
+
+    registry.close()
+    with pytest.raises(RuntimeError):
+        registry.wait_for(lambda r: "X9" in r)
+    # a new registry is started if the old one was closed
+    assert manager.position_registry() is not registry
@@ -0,0 +1,159 @@
+import grpc
+import numpy
+import pytest
+from google.protobuf import wrappers_pb2
+
+from minknow_api import (
+    Connection,
+    device_pb2,
+    device_pb2_grpc,
+    statistics_pb2,
+    statistics_pb2_grpc,
+)
+from minknow_api.monitoring import (
+    TieredHistory,
+    stream_bias_voltage_history,
+    stream_device_temperature_history,
+    stream_temperature_history,
+)
+from mock_server import Server, InstanceServicer, load_test_ca
+
+TemperaturePacket = statistics_pb2.TemperaturePacket
+
+
+class StatisticsServicer(statistics_pb2_grpc.StatisticsServiceServicer):
+    def stream_temperature(self, request, _context):
+        # the history so far, then an update
+        yield statistics_pb2.StreamTemperatureResponse(
+            temperatures=[
+                TemperaturePacket(
+                    promethion=TemperaturePacket.PromethIONTemperature(
+                        flowcell_temperature=30 + minute, chamber_temperature=35
+                    )
+                )
+                for minute in range(3)
+            ]
+        )
+        yield statistics_pb2.StreamTemperatureResponse(
+            temperatures=[
+                TemperaturePacket(
+                    promethion=TemperaturePacket.PromethIONTemperature(
+                        flowcell_temperature=40, chamber_temperature=0
+                    )
+                )
+            ]
+        )
+
+    def stream_bias_voltages(self, request, _context):
+        yield statistics_pb2.StreamBiasVoltagesResponse(
+            bias_voltages=[
+                statistics_pb2.BiasVoltagePacket(time_seconds=t, bias_voltage=v)
+                for t, v in ((0, -180), (30, -185), (90, -190))
+            ]
+        )
+
+
+class DeviceServicer(device_pb2_grpc.DeviceServiceServicer):
+    def stream_temperature(self, request, _context):
+        for value in (34.0, 36.0):
+            yield device_pb2.GetTemperatureResponse(
+                minion=device_pb2.GetTemperatureResponse.MinIONTemperature(
+                    heatsink_temperature=wrappers_pb2.FloatValue(value=value)
+                )
+            )
+
+
+@pytest.fixture
+def connection():
+    with Server([InstanceServicer(), StatisticsServicer(), DeviceServicer()]) as server:
+        with Connection(
+            port=server.port, credentials=grpc.ssl_channel_credentials(load_test_ca())
+        ) as conn:
+            yield conn
+
+
+def test_downsampling():
+    history = TieredHistory(["a", "b"], tiers=[(1, 1000), (60, 10)])
+    times = numpy.arange(180)
+    history.add_many(times, numpy.column_stack([times, -times]))
+
+    assert history.latest_time == 179
+    minutes = history.query(resolution=60)
+    numpy.testing.assert_array_equal(minutes.times, [0, 60, 120])
+    numpy.testing.assert_array_equal(minutes.count, [60, 60, 60])
+    numpy.testing.assert_array_equal(minutes.minimum[:, 0], [0, 60, 120])
+    numpy.testing.assert_array_equal(minutes.maximum[:, 0], [59, 119, 179])
+    numpy.testing.assert_array_equal(minutes.mean[:, 0], [29.5, 89.5, 149.5])
+    numpy.testing.assert_array_equal(minutes.minimum[:, 1], [-59, -119, -179])
+
+    seconds = history.query(100, 104.5)
+    assert seconds.resolution == 1
+    numpy.testing.assert_array_equal(seconds.times, [100, 101, 102, 103, 104])
+    numpy.testing.assert_array_equal(seconds.mean[:, 1], -seconds.times)
+
+    with pytest.raises(ValueError):
+        history.query(resolution=5)
+
+
+def test_wraparound():
+    history = TieredHistory(["value"], tiers=[(1, 100), (60, 3)])
+    for t in range(300):
+        history.add(t, [t])
+
+    # only the last 100 seconds and 3 minutes are kept
+    seconds = history.query(resolution=1)
+    numpy.testing.assert_array_equal(seconds.times, numpy.arange(200, 300))
+    numpy.testing.assert_array_equal(seconds.maximum[:, 0], numpy.arange(200, 300))
+    minutes = history.query(resolution=60)
+    numpy.testing.assert_array_equal(minutes.times, [120, 180, 240])
+    numpy.testing.assert_array_equal(minutes.minimum[:, 0], [120, 180, 240])
+
+    # the one-second tier no longer covers 150, so the one-minute tier is used
+    assert history.query(150).resolution == 60
+    assert history.query(250).resolution == 1
+
+    # too old for either tier, so ignored
+    history.add(10, [-1000])
+    assert history.query(resolution=60).minimum.min() == 120
+    # a late sample for a bucket that is still held is included
+    history.add(250.5, [-1])
+    assert history.query(250, 250, resolution=1).count.tolist() == [2]
+    assert history.query(240, 240, resolution=60).minimum.tolist() == [[-1]]
+
+
+def test_stream_temperature_history(connection):
+    updates = []
+    for history in stream_temperature_history(
+        connection, "run-1", data_selection={"start": 600}
+    ):
+        updates.append(history.query(resolution=60).count.sum())
+
+    assert updates == [3, 4]
+    assert history.columns == ["flowcell_temperature", "chamber_temperature"]
+    minutes = history.query(resolution=60)
+    numpy.testing.assert_array_equal(minutes.times, [600, 660, 720, 780])
+    numpy.testing.assert_array_equal(
+        minutes.mean, [[30, 35], [31, 35], [32, 35], [40, 0]]
+    )
+
+
+def test_stream_bias_voltage_history(connection):
+    for history in stream_bias_voltage_history(connection, "run-1", tiers=[(60, 10)]):
+        pass
+
+    minutes = history.query()
+    numpy.testing.assert_array_equal(minutes.times, [0, 60])
+    numpy.testing.assert_array_equal(minutes.minimum[:, 0], [-185, -190])
+    numpy.testing.assert_array_equal(minutes.maximum[:, 0], [-180, -190])
+
+
+def test_stream_device_temperature_history(connection):
+    for history in stream_device_temperature_history(connection, period_seconds=1):
+        pass
+
+    assert history.columns == ["asic_temperature", "heatsink_temperature"]
+    recent = history.query()
+    assert recent.count.sum() == 2
+    assert numpy.isnan(recent.mean[:, 0]).all()
+    assert recent.minimum[:, 1].min() == 34
+    assert recent.maximum[:, 1].max() == 36
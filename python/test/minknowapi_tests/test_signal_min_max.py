@@ -0,0 +1,160 @@
+import grpc
+import numpy
+import pytest
+
+from minknow_api import Connection, data_pb2, data_pb2_grpc
+from minknow_api.signal_min_max import (
+    MinMaxData,
+    SignalMinMaxCache,
+    decode_signal_min_max,
+    iter_signal_min_max,
+)
+from mock_server import Server, InstanceServicer, load_test_ca
+
+ChannelData = data_pb2.GetSignalMinMaxResponse.ChannelData
+
+
+def window_values(channel, first, count):
+    """Window ``n`` on channel ``c`` has a minimum of ``c * 1000 + n`` and a maximum 500 higher."""
+    minima = channel * 1000 + numpy.arange(first, first + count)
+    return minima, minima + 500
+
+
+def block(channels, first_window, count, window_size=10):
+    minima, maxima = zip(*(window_values(c, first_window, count) for c in channels))
+    return MinMaxData(
+        channels=numpy.array(channels),
+        samples_since_start=first_window * window_size,
+        window_size=window_size,
+        minima=numpy.array(minima, dtype=numpy.int32),
+        maxima=numpy.array(maxima, dtype=numpy.int32),
+    )
+
+
+class DataServicer(data_pb2_grpc.DataServiceServicer):
+    def get_signal_min_max(self, request, context):
+        # channels are split between two messages
+        middle = (request.first_channel + request.last_channel) // 2
+        for first_window in (0, 3):
+            for first, last in (
+                (request.first_channel, middle),
+                (middle + 1, request.last_channel),
+            ):
+                msg = data_pb2.GetSignalMinMaxResponse(
+                    samples_since_start=first_window * request.window_size,
+                    skipped_channels=first - request.first_channel,
+                )
+                for channel in range(first, last + 1):
+                    minima, maxima = window_values(channel, first_window, 3)
+                    if request.calibrated_data:
+                        msg.channels.add(
+                            calibrated_minima=minima, calibrated_maxima=maxima
+                        )
+                    else:
+                        msg.channels.add(raw_minima=minima, raw_maxima=maxima)
+                yield msg
+
+
+@pytest.fixture
+def connection():
+    with Server([InstanceServicer(), DataServicer()]) as server:
+        with Connection(
+            port=server.port, credentials=grpc.ssl_channel_credentials(load_test_ca())
+        ) as conn:
+            yield conn
+
+
+def test_decode_signal_min_max():
+    msg = data_pb2.GetSignalMinMaxResponse(
+        samples_since_start=200,
+        skipped_channels=2,
+        channels=[
+            ChannelData(calibrated_minima=[1.5, 2.5], calibrated_maxima=[3.5, 4.5]),
+            ChannelData(calibrated_minima=[5, 6], calibrated_maxima=[7, 8]),
+        ],
+    )
+
+    data = decode_signal_min_max(msg, first_channel=10, window_size=50)
+
+    numpy.testing.assert_array_equal(data.channels, [12, 13])
+    assert data.samples_since_start == 200
+    assert data.window_size == 50
+    assert data.minima.dtype == numpy.float32
+    numpy.testing.assert_array_equal(data.minima, [[1.5, 2.5], [5, 6]])
+    numpy.testing.assert_array_equal(data.maxima, [[3.5, 4.5], [7, 8]])
+
+
+def test_iter_signal_min_max(connection):
+    blocks = list(
+        iter_signal_min_max(connection, first_channel=3, last_channel=6, window_size=20)
+    )
+
+    assert [list(b.channels) for b in blocks] == [[3, 4], [5, 6], [3, 4], [5, 6]]
+    assert [b.samples_since_start for b in blocks] == [0, 0, 60, 60]
+    assert blocks[0].minima.dtype == numpy.int32
+    numpy.testing.assert_array_equal(blocks[3].maxima[1], [6503, 6504, 6505])
+
+    cache = SignalMinMaxCache(first_channel=3, last_channel=6, window_size=20)
+    for b in blocks:
+        cache.add(b)
+    assert cache.available() == (0, 120)
+
+
+def test_cache_builds_coarser_levels():
+    cache = SignalMinMaxCache(
+        first_channel=1, last_channel=3, window_size=10, zoom_factor=2, levels=3
+    )
+    # uneven block sizes, to check windows spanning blocks are summarised correctly
+    for first, count in ((0, 3), (3, 6), (9, 7)):
+        cache.add(block([1, 2, 3], first, count))
+
+    assert cache.available(level=0) == (0, 160)
+    assert cache.available(level=2) == (0, 160)
+
+    data = cache.get(0, 160)
+    assert data.window_size == 10
+    numpy.testing.assert_array_equal(data.minima[1], window_values(2, 0, 16)[0])
+
+    data = cache.get(40, 160, level=2, channels=[3])
+    assert data.window_size == 40
+    assert data.samples_since_start == 40
+    numpy.testing.assert_array_equal(data.minima, [[3004, 3008, 3012]])
+    numpy.testing.assert_array_equal(data.maxima, [[3507, 3511, 3515]])
+
+    # level 1 (20 samples per window) is the finest level needing at most 8 windows
+    assert cache.get(0, 160, max_windows=8).window_size == 20
+    assert cache.get(0, 160, max_windows=1).window_size == 40
+
+
+def test_cache_keeps_most_recent_windows():
+    cache = SignalMinMaxCache(
+        first_channel=1,
+        last_channel=2,
+        window_size=10,
+        capacity=8,
+        zoom_factor=2,
+        levels=2,
+    )
+    cache.add(block([1, 2], 0, 21))
+
+    assert cache.available(level=0) == (130, 210)
+    assert cache.available(level=1) == (40, 200)
+    data = cache.get(0, 1000)
+    numpy.testing.assert_array_equal(data.minima[0], window_values(1, 13, 8)[0])
+    data = cache.get(0, 1000, level=1)
+    numpy.testing.assert_array_equal(data.minima[0], 1000 + numpy.arange(4, 20, 2))
+
+
+def test_cache_restarts_channel_on_gap():
+    cache = SignalMinMaxCache(
+        first_channel=1, last_channel=2, window_size=10, zoom_factor=2, levels=2
+    )
+    cache.add(block([1, 2], 0, 4))
+    # channel 1 skips some windows, channel 2 is missing its next message
+    cache.add(block([1], 7, 4))
+
+    assert cache.available(channels=[1]) == (70, 110)
+    assert cache.available(level=1, channels=[1]) == (80, 100)
+    assert cache.available(channels=[2]) == (0, 40)
+    # nothing is available for both channels
+    assert cache.get(0, 200).minima.shape == (2, 0)
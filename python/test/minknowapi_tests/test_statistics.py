@@ -0,0 +1,285 @@
+import contextlib
+import threading
+import time
+
+import grpc
+import numpy
+import pytest
+
+from minknow_api import (
+    Connection,
+    RetryPolicy,
+    acquisition_pb2,
+    acquisition_pb2_grpc,
+    statistics_pb2,
+    statistics_pb2_grpc,
+)
+from minknow_api.statistics import (
+    FleetAcquisitionOutput,
+    is_resumable_error,
+    stream_acquisition_output,
+    stream_duty_time,
+    stream_writer_output,
+)
+from mock_server import Server, InstanceServicer, load_test_ca
+
+FAST_RESUME = RetryPolicy(initial_backoff=0.01, should_retry=is_resumable_error)
+
+AcquisitionOutput = statistics_pb2.StreamAcquisitionOutputResponse
+DutyTime = statistics_pb2.StreamDutyTimeResponse
+
+
+class StatisticsServicer(statistics_pb2_grpc.StatisticsServiceServicer):
+    """Streams one bucket per minute, from ``data_selection.start`` up to ``BUCKETS`` minutes.
+
+    The first call fails with ``failure`` after sending the buckets up to 3 minutes.
+    """
+
+    BUCKETS = 6
+
+    def __init__(self):
+        self.requests = []
+        self.failure = grpc.StatusCode.UNAVAILABLE
+
+    def _buckets(self, request, context):
+        first_call = not self.requests
+        self.requests.append(request)
+        for minute in range(request.data_selection.start // 60, self.BUCKETS):
+            if first_call and minute == 3:
+                context.abort(self.failure, "stream failed")
+            yield minute
+
+    def stream_acquisition_output(self, request, context):
+        for minute in self._buckets(request, context):
+            yield AcquisitionOutput(
+                snapshots=[
+                    AcquisitionOutput.FilteredSnapshots(
+                        filtering=[
+                            statistics_pb2.AcquisitionOutputKey(barcode_name=barcode)
+                        ],
+                        snapshots=[
+                            statistics_pb2.AcquisitionOutputSnapshot(
+                                seconds=minute * 60,
+                                yield_summary=acquisition_pb2.AcquisitionYieldSummary(
+                                    read_count=minute * scale
+                                ),
+                            )
+                        ],
+                    )
+                    for barcode, scale in (("barcode01", 10), ("barcode02", 20))
+                ]
+            )
+
+    def stream_duty_time(self, request, context):
+        for minute in self._buckets(request, context):
+            yield DutyTime(
+                bucket_ranges=[
+                    DutyTime.BucketRange(start=minute * 60, end=minute * 60 + 60)
+                ],
+                channel_states={
+                    "strand": DutyTime.ChannelStateData(state_times=[minute * 100])
+                },
+                pore_occupancy=[0.5],
+            )
+
+    def stream_writer_output(self, request, context):
+        for minute in self._buckets(request, context):
+            yield statistics_pb2.StreamWriterOutputResponse(
+                snapshots=[
+                    statistics_pb2.WriterOutputSnapshot(
+                        seconds=minute * 60,
+                        writer_output=acquisition_pb2.AcquisitionWriterSummary(
+                            bytes_to_write_completed=minute * 1000
+                        ),
+                    )
+                ]
+            )
+
+
+@pytest.fixture
+def servicer():
+    return StatisticsServicer()
+
+
+@pytest.fixture
+def connection(servicer):
+    with Server([InstanceServicer(), servicer]) as server:
+        with Connection(
+            port=server.port, credentials=grpc.ssl_channel_credentials(load_test_ca())
+        ) as conn:
+            yield conn
+
+
+def test_acquisition_output_resumes_from_last_snapshot(connection, servicer):
+    for store in stream_acquisition_output(
+        connection,
+        "run-1",
+        retry_policy=FAST_RESUME,
+        data_selection={"step": 60},
+        split=statistics_pb2.AcquisitionOutputSplit(barcode_name=True),
+    ):
+        pass
+
+    assert [r.data_selection.start for r in servicer.requests] == [0, 120]
+    assert all(r.data_selection.step == 60 for r in servicer.requests)
+    assert servicer.requests[1].split.barcode_name
+    ((_, series),) = store.find(barcode_name="barcode02")
+    numpy.testing.assert_array_equal(series.seconds, numpy.arange(6) * 60)
+    numpy.testing.assert_array_equal(series["read_count"], numpy.arange(6) * 20)
+
+
+def test_duty_time_and_writer_output_resume(connection, servicer):
+    for duty_time in stream_duty_time(connection, "run-1", retry_policy=FAST_RESUME):
+        pass
+    numpy.testing.assert_array_equal(duty_time.bucket_starts, numpy.arange(6) * 60)
+    numpy.testing.assert_array_equal(duty_time.bucket_ends, numpy.arange(1, 7) * 60)
+    numpy.testing.assert_array_equal(duty_time["strand"], numpy.arange(6) * 100)
+    assert duty_time.states == ["strand"]
+
+    servicer.requests.clear()
+    for writer_output in stream_writer_output(
+        connection, "run-1", retry_policy=FAST_RESUME
+    ):
+        pass
+    assert [r.data_selection.start for r in servicer.requests] == [0, 120]
+    numpy.testing.assert_array_equal(
+        writer_output["bytes_to_write_completed"], numpy.arange(6) * 1000
+    )
+
+
+def test_other_errors_are_not_resumed(connection, servicer):
+    servicer.failure = grpc.StatusCode.FAILED_PRECONDITION
+    updates = []
+    with pytest.raises(grpc.RpcError) as e:
+        for series in stream_writer_output(
+            connection, "run-1", retry_policy=FAST_RESUME
+        ):
+            updates.append(len(series))
+
+    assert e.value.code() == grpc.StatusCode.FAILED_PRECONDITION
+    assert len(servicer.requests) == 1
+    assert updates == [1, 2, 3]
+
+
+class PositionAcquisitionServicer(acquisition_pb2_grpc.AcquisitionServiceServicer):
+    """A position that runs one acquisition period after another.
+
+    Args:
+        runs: For each acquisition period, the run ID, its start time (in seconds since the epoch)
+            and the barcode01 read count at each minute.
+        hang: Whether to keep watching for acquisition periods after the last one.
+    """
+
+    def __init__(self, runs, hang=False):
+        self.runs = runs
+        self.hang = hang
+
+    def watch_current_acquisition_run(self, request, context):
+        yield acquisition_pb2.AcquisitionRunInfo(
+            state=acquisition_pb2.ACQUISITION_COMPLETED
+        )
+        for run_id, start, _ in self.runs:
+            info = acquisition_pb2.AcquisitionRunInfo(
+                run_id=run_id, state=acquisition_pb2.ACQUISITION_RUNNING
+            )
+            info.start_time.FromSeconds(start)
+            yield info
+        if self.hang:
+            cancelled = threading.Event()
+            context.add_callback(cancelled.set)
+            cancelled.wait(60)
+
+
+class PositionStatisticsServicer(statistics_pb2_grpc.StatisticsServiceServicer):
+    def __init__(self, runs):
+        self.runs = runs
+
+    def stream_acquisition_output(self, request, context):
+        for run_id, _, read_counts in self.runs:
+            if run_id == request.acquisition_run_id:
+                for minute, read_count in enumerate(read_counts, start=1):
+                    yield AcquisitionOutput(
+                        snapshots=[
+                            AcquisitionOutput.FilteredSnapshots(
+                                filtering=[
+                                    statistics_pb2.AcquisitionOutputKey(
+                                        barcode_name="barcode01"
+                                    )
+                                ],
+                                snapshots=[
+                                    statistics_pb2.AcquisitionOutputSnapshot(
+                                        seconds=minute * 60,
+                                        yield_summary={"read_count": read_count},
+                                    )
+                                ],
+                            )
+                        ]
+                    )
+
+
+@contextlib.contextmanager
+def position_connections(*positions):
+    with contextlib.ExitStack() as stack:
+        connections = {}
+        for i, servicer in enumerate(positions):
+            server = stack.enter_context(
+                Server(
+                    [
+                        InstanceServicer(),
+                        servicer,
+                        PositionStatisticsServicer(servicer.runs),
+                    ]
+                )
+            )
+            connections["position-{}".format(i + 1)] = stack.enter_context(
+                Connection(
+                    port=server.port,
+                    credentials=grpc.ssl_channel_credentials(load_test_ca()),
+                )
+            )
+        yield connections
+
+
+def test_fleet_acquisition_output():
+    updates = []
+    with position_connections(
+        PositionAcquisitionServicer([("run-a1", 1000, [5]), ("run-a2", 2000, [1, 2])]),
+        PositionAcquisitionServicer([("run-b1", 1030, [10, 20])]),
+    ) as connections:
+        output = FleetAcquisitionOutput(
+            connections,
+            on_update=lambda name, keys: updates.append((name, len(keys))),
+            split=statistics_pb2.AcquisitionOutputSplit(barcode_name=True),
+        )
+        output.start()
+        assert output.wait(timeout=10)
+
+    assert output.errors == {}
+    assert output.run_ids() == {"position-1": "run-a2", "position-2": "run-b1"}
+    assert sorted(updates) == [("position-1", 1)] * 3 + [("position-2", 1)] * 2
+    # the first acquisition period on position-1 has been replaced by the second
+    ((key, totals),) = output.totals().items()
+    assert key[0].barcode_name == "barcode01"
+    assert totals["read_count"] == 22
+
+    aligned = output.aligned(interval=60)[key]
+    numpy.testing.assert_array_equal(aligned.times, numpy.arange(1080, 2161, 60))
+    read_count = aligned.columns["read_count"]
+    assert list(read_count[:3]) == [0, 10, 20]
+    assert list(read_count[-3:]) == [20, 21, 22]
+
+
+def test_fleet_acquisition_output_stop():
+    with position_connections(
+        PositionAcquisitionServicer([("run-1", 1000, [5])], hang=True)
+    ) as connections:
+        with FleetAcquisitionOutput(connections) as output:
+            for _ in range(100):
+                if output.totals():
+                    break
+                time.sleep(0.1)
+            assert output.is_running
+        assert not output.is_running
+
+    assert output.errors == {}
+    assert [t["read_count"] for t in output.totals().values()] == [5]
@@ -0,0 +1,136 @@
+import grpc
+import pytest
+from google.protobuf import wrappers_pb2
+
+from minknow_api import (
+    DEFAULT_RETRY_POLICY,
+    NO_RETRY_POLICY,
+    Connection,
+    RetryCounts,
+    RetryPolicy,
+    clear_retry_counts,
+    get_retry_counts,
+    instance_pb2,
+    promethion_device_pb2,
+    raw_messages,
+)
+from minknow_api._support import MessageWrapper, run_with_retry
+from mock_server import Server, InstanceServicer, load_test_ca
+
+
+def make_settings_response():
+    return promethion_device_pb2.GetDeviceSettingsResponse(
+        settings=promethion_device_pb2.DeviceSettings(
+            sampling_frequency=wrappers_pb2.Int32Value(value=5000),
+            ramp_voltage=wrappers_pb2.DoubleValue(value=2.5),
+        )
+    )
+
+
+def test_message_wrapper_unwraps_fields():
+    wrapper = MessageWrapper(make_settings_response(), unwraps=["settings"])
+
+    # fields of the unwrapped submessage, with wrapper types collapsed
+    assert wrapper.sampling_frequency == 5000
+    assert wrapper.ramp_voltage == 2.5
+    # fields of the message itself
+    assert wrapper.settings.sampling_frequency.value == 5000
+    assert wrapper == make_settings_response()
+
+
+def test_raw_messages_returns_bare_message():
+    response = make_settings_response()
+
+    assert raw_messages(MessageWrapper(response, ["settings"])) is response
+    assert raw_messages(response) is response
+
+
+def test_connection_without_wrapping_returns_bare_messages():
+    with Server([InstanceServicer()]) as server:
+        with Connection(
+            port=server.port,
+            credentials=grpc.ssl_channel_credentials(load_test_ca()),
+            wrap_messages=False,
+        ) as connection:
+            response = connection.instance.get_version_info()
+
+    assert type(response) is instance_pb2.GetVersionInfoResponse
+    assert response.minknow.full == "4.0.0"
+
+
+class TransientError(grpc.RpcError):
+    def code(self):
+        return grpc.StatusCode.UNKNOWN
+
+    def details(self):
+        return "Stream removed"
+
+
+class FlakyMethod(object):
+    """A stub method that fails with a transient error the first ``failures`` times it is called."""
+
+    def __init__(self, failures, policy):
+        self.failures = failures
+        self.retry_policy = policy
+        self.method_name = "flaky"
+        self.timeouts = []
+
+    def __call__(self, request, timeout=None):
+        self.timeouts.append(timeout)
+        if len(self.timeouts) <= self.failures:
+            raise TransientError()
+        return request
+
+
+def test_run_with_retry_retries_transient_errors():
+    clear_retry_counts()
+    method = FlakyMethod(3, RetryPolicy(initial_backoff=0.001, max_backoff=0.002))
+    request = instance_pb2.GetVersionInfoRequest()
+
+    assert run_with_retry(method, request, None, [], "test.Service") == request
+    assert method.timeouts == [None] * 4
+    assert get_retry_counts() == {"test.Service.flaky": RetryCounts(3, 0)}
+
+
+def test_run_with_retry_shares_timeout_between_attempts():
+    clear_retry_counts()
+    method = FlakyMethod(100, RetryPolicy(initial_backoff=0.02, jitter=0))
+
+    with pytest.raises(TransientError):
+        run_with_retry(method, None, 0.1, [], "test.Service")
+
+    # 0.02 + 0.04 seconds of backoff fits in the budget, but the next 0.08 does not
+    assert len(method.timeouts) == 3
+    assert method.timeouts[0] <= 0.1
+    assert method.timeouts[2] <= 0.1 - 0.06
+    assert get_retry_counts() == {"test.Service.flaky": RetryCounts(2, 1)}
+
+
+def test_run_with_retry_respects_max_attempts():
+    method = FlakyMethod(1, NO_RETRY_POLICY)
+
+    with pytest.raises(TransientError):
+        run_with_retry(method, None, None, [], "test.Service")
+    assert len(method.timeouts) == 1
+
+
+def test_connection_retry_policy_overrides():
+    quick = RetryPolicy(max_attempts=3)
+    with Server([InstanceServicer()]) as server:
+        with Connection(
+            port=server.port,
+            credentials=grpc.ssl_channel_credentials(load_test_ca()),
+            retry_policy=quick,
+            retry_policies={
+                "data": DEFAULT_RETRY_POLICY,
+                "instance.get_version_info": NO_RETRY_POLICY,
+            },
+        ) as connection:
+            assert connection.instance._stub.get_version_info.retry_policy == (
+                NO_RETRY_POLICY
+            )
+            assert connection.instance._stub.get_disk_space_info.retry_policy == quick
+            assert connection.data._stub.get_data_types.retry_policy == (
+                DEFAULT_RETRY_POLICY
+            )
+            assert connection.acquisition._stub.start.retry_policy == quick
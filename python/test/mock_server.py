@@ -4,6 +4,7 @@ import importlib.resources
 import inspect
 import logging
 import os
+import time
 from concurrent import futures
 from contextlib import contextmanager
 from pathlib import Path
@@ -107,6 +108,7 @@ class ManagerServicer(manager_pb2_grpc.ManagerServiceServicer):
 
     ``flow_cell_positions`` and ``basecaller_api`` are implemented because they are
     useful for tests that use the manager as just an entry point to other services.
+    ``watch_flow_cell_positions`` streams changes made to ``positions``.
 
     Args:
         positions: The starting value of the ``positions`` attribute.
@@ -161,6 +163,38 @@ class ManagerServicer(manager_pb2_grpc.ManagerServiceServicer):
             positions=self.positions, total_count=len(self.positions)
         )
 
+    def watch_flow_cell_positions(
+        self,
+        _request: manager_pb2.WatchFlowCellPositionsRequest,
+        context: grpc.ServicerContext,
+    ):
+        """Stream changes to ``positions`` (which is checked for changes every 10ms)."""
+        known = None
+        while context.is_active():
+            current = {}
+            for pos in self.positions:
+                current[pos.name] = manager_pb2.FlowCellPosition()
+                current[pos.name].CopyFrom(pos)
+            previous = known or {}
+            response = manager_pb2.WatchFlowCellPositionsResponse(
+                additions=[
+                    pos for name, pos in current.items() if name not in previous
+                ],
+                changes=[
+                    pos
+                    for name, pos in current.items()
+                    if name in previous and previous[name] != pos
+                ],
+                removals=[name for name in previous if name not in current],
+            )
+            if (
+                known is None
+                or response != manager_pb2.WatchFlowCellPositionsResponse()
+            ):
+                yield response
+            known = current
+            time.sleep(0.01)
+
     def basecaller_api(
         self, _request: manager_pb2.BasecallerApiRequest, _context: grpc.ServicerContext
     ) -> manager_pb2.BasecallerApiResponse:
@@ -204,6 +238,8 @@ class Server(object):
         interceptors: A list of interceptors to attach to the server.
         client_root_certs: Require clients to connect using a certificate with a root of
             trust in this PEM certificate bundle.
+        max_workers: The number of threads used to handle RPCs. Note that each streaming RPC
+            occupies a thread for as long as it is running.
 
     Attrs:
         server (grpc.Server): The gRPC server.
@@ -226,9 +262,11 @@ class Server(object):
         servicers: Sequence[object],
         interceptors: Optional[List[grpc.ServerInterceptor]] = None,
         client_root_certs: Optional[bytes] = None,
+        max_workers: int = 2,
     ):
         self.server = grpc.server(
-            futures.ThreadPoolExecutor(max_workers=2), interceptors=interceptors
+            futures.ThreadPoolExecutor(max_workers=max_workers),
+            interceptors=interceptors,
         )
 
         for servicer in servicers: